@@ -0,0 +1,59 @@
+"""
+A micro-benchmark of the throughput of a detector scan. It compares scanning a text with the discord bot token
+detector alone, with scanning it with every detector the parser registers, on a text full of token candidates and on
+plain prose.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.detector_scan --size 1000000 --repeat 5
+"""
+import argparse
+import random
+
+from benchmarks.token_records import make_text, measure
+from core.detectors import DetectorRegistry
+from core.parser import TokenParser
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while our service reads screenshots and logs of chat messages "
+    "sent by users who paste their settings access rights and secrets by mistake"
+).split()
+
+
+def make_prose(size: int, seed: int = 0) -> str:
+    """
+    This function builds a text of plain words, with no token like string in it.
+    """
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word.capitalize() if rng.random() < 0.1 else word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--size", type=int, default=1_000_000, help="The size of each text in characters.")
+    arguments.add_argument("--repeat", type=int, default=5, help="The number of runs, the best one is reported.")
+    options = arguments.parse_args()
+
+    parser = TokenParser()
+    bot_only = DetectorRegistry()
+    bot_only.register(parser.detectors.detectors["discord_bot_token"])
+    # A candidate line of make_text is about 87 characters long.
+    texts = {"token candidates": make_text(max(1, options.size // 87)), "prose": make_prose(options.size)}
+
+    print(f"{len(parser.detectors)} detectors, best of {options.repeat} runs")
+    for name, text in texts.items():
+        alone = measure(lambda: list(bot_only.finditer(text)), options.repeat)
+        every = measure(lambda: list(parser.detectors.finditer(text)), options.repeat)
+        print(f"  {name} ({len(text)} characters)")
+        print(f"    {'bot token detector alone':<26} {len(text) / alone / 1e6:>8.1f} MB/s")
+        print(f"    {'every detector':<26} {len(text) / every / 1e6:>8.1f} MB/s ({every / alone:.2f}x the time)")
+
+
+if __name__ == "__main__":
+    main()
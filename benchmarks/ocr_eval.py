@@ -0,0 +1,286 @@
+"""
+An evaluation harness that compares the OCR profiles defined in config.yml on synthetic screenshots of chat messages.
+Some of the screenshots contain a discord bot token, which is the label. Every profile reads every screenshot, and the
+harness reports the token recall and precision of the profile, the p50 and p99 latency of cleaning and reading an
+image, and how many images the "auto" preprocessing routed to each pipeline. A share of the screenshots can be turned
+into photos of a screen, which are the hard images the photo pipeline is for. It then recommends the Pareto-optimal
+profile with the best recall, preferring the fastest one among profiles whose recall is within the tolerance.
+
+Run it from the root of the repository, with Tesseract OCR engine installed:
+
+    python -m benchmarks.ocr_eval --images 100 --profiles default,token,binarized
+"""
+import argparse
+import io
+import json
+import os
+import random
+import time
+import typing
+from collections import Counter
+
+import numpy as np
+from loguru import logger
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from benchmarks.token_records import make_token
+from core.ocr import OCRProfile, clean_image, ocr_image
+from core.parser import TokenParser
+from utils.helpers import Config
+
+# Background and text colors of the dark, light and darker themes of chat clients.
+THEMES = (
+    ((54, 57, 63), (220, 221, 222)),
+    ((255, 255, 255), (46, 51, 56)),
+    ((32, 34, 37), (185, 187, 190)),
+)
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+WORDS = (
+    "hey anyone know why my bot keeps going offline here is the config i use for it and the logs "
+    "from last night thanks in advance lol it works on my machine though did you try restarting"
+).split()
+
+
+def load_font(size: int) -> ImageFont.ImageFont:
+    """
+    This function loads the first TrueType font that exists on the system, or the default bitmap font of Pillow.
+    """
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+
+def make_screenshot(rng: random.Random, with_token: bool) -> typing.Tuple[bytes, typing.Optional[str]]:
+    """
+    This function draws a screenshot of a few chat messages, one of which contains a token if asked to. Some of the
+    screenshots are degraded the way shared screenshots are, by downscaling, blurring and JPEG compression.
+
+    Returns:
+        (typing.Tuple[bytes, typing.Optional[str]]): The encoded image, and the token in it, if any.
+    """
+    background, foreground = rng.choice(THEMES)
+    font = load_font(rng.randint(13, 22))
+    lines = [
+        f"user{rng.randint(1, 9999)}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+        for _ in range(rng.randint(3, 8))
+    ]
+    token = None
+    if with_token:
+        token = make_token(rng)
+        lines.insert(rng.randrange(len(lines) + 1), f"user{rng.randint(1, 9999)}: {token}")
+
+    # Older versions of Pillow only measure bitmap fonts with getsize.
+    if hasattr(font, "getbbox"):
+        line_height = int(font.getbbox("Ag")[3] * 1.6)
+        width = int(max(font.getlength(line) for line in lines)) + 40
+    else:
+        line_height = int(font.getsize("Ag")[1] * 1.6)
+        width = max(font.getsize(line)[0] for line in lines) + 40
+    image = Image.new("RGB", (width, line_height * len(lines) + 30), background)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((20, 15 + number * line_height), line, fill=foreground, font=font)
+
+    if rng.random() < 0.3:
+        image = image.resize((int(image.width * 0.75), int(image.height * 0.75)), Image.BILINEAR)
+    if rng.random() < 0.2:
+        image = image.filter(ImageFilter.GaussianBlur(0.6))
+    output = io.BytesIO()
+    if rng.random() < 0.3:
+        image.save(output, format="JPEG", quality=rng.randint(40, 80))
+    else:
+        image.save(output, format="PNG")
+    return output.getvalue(), token
+
+
+def make_photo(rng: random.Random, data: bytes) -> bytes:
+    """
+    This function turns a screenshot into something like a phone photo of the screen it was on: larger, tilted,
+    lit unevenly, noisy, out of focus and compressed as JPEG.
+    """
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image = image.resize((image.width * 2, image.height * 2), Image.BILINEAR)
+    image = image.rotate(rng.uniform(-6, 6), resample=Image.BICUBIC, expand=True, fillcolor=(90, 90, 90))
+    pixels = np.asarray(image, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    # Light falls off towards one side of the screen, and a little towards the bottom.
+    lighting = (
+        np.linspace(rng.uniform(0.5, 0.8), 1.1, width)[None, :, None]
+        * np.linspace(0.8, 1.0, height)[:, None, None]
+    )
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(0, 12, pixels.shape)
+    image = Image.fromarray(np.clip(pixels * lighting + noise, 0, 255).astype(np.uint8))
+    output = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(rng.uniform(0.6, 1.4))).save(output, format="JPEG", quality=70)
+    return output.getvalue()
+
+
+def percentile(values: typing.List[float], quantile: float) -> float:
+    """
+    This function returns a percentile of a list of values, by the nearest rank.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(quantile * (len(ordered) - 1))))]
+
+
+def evaluate(
+    profile: OCRProfile,
+    samples: typing.List[typing.Tuple[bytes, typing.Optional[str]]],
+    parser: TokenParser,
+) -> dict:
+    """
+    This function reads every sample with a profile, and measures how many tokens it found and how fast it was.
+
+    Returns:
+        (dict): The recall, precision, p50 and p99 latency in milliseconds, the number of errors of the profile,
+                and the number of images cleaned with every preprocessing variant.
+    """
+    true_positives = false_positives = labeled = errors = 0
+    latencies = []
+    routes: typing.Counter[str] = Counter()
+    for data, token in samples:
+        labeled += token is not None
+        started = time.perf_counter()
+        try:
+            image, route = clean_image(io.BytesIO(data), preprocessing=profile.preprocessing)
+            text = ocr_image(image, profile=profile)
+            routes[route] += 1
+        except Exception as e:
+            errors += 1
+            logger.debug(f"Profile {profile.name} failed to read an image. Error: {e}")
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        found = {
+            record.token_string
+            for record in parser.scan(text, data_parsed_from_type="image")
+            if record.is_valid and record.token_type == "discord_bot_token"
+        }
+        true_positives += token in found
+        false_positives += len(found - {token})
+
+    reported = true_positives + false_positives
+    return {
+        "profile": profile.name,
+        "recall": true_positives / labeled if labeled else 0.0,
+        "precision": true_positives / reported if reported else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "errors": errors,
+        "routes": dict(routes),
+    }
+
+
+def pareto_front(results: typing.List[dict]) -> typing.List[dict]:
+    """
+    This function returns the results that no other result beats on recall, precision and p99 latency at once.
+    """
+
+    def dominates(a: dict, b: dict) -> bool:
+        better_or_equal = (
+            a["recall"] >= b["recall"] and a["precision"] >= b["precision"] and a["p99_ms"] <= b["p99_ms"]
+        )
+        strictly_better = a["recall"] > b["recall"] or a["precision"] > b["precision"] or a["p99_ms"] < b["p99_ms"]
+        return better_or_equal and strictly_better
+
+    return [result for result in results if not any(dominates(other, result) for other in results)]
+
+
+def recommend(results: typing.List[dict], tolerance: float) -> typing.Optional[dict]:
+    """
+    This function picks the fastest Pareto-optimal profile whose recall is within the tolerance of the best recall.
+    Profiles that failed to read an image are never recommended.
+    """
+    front = [result for result in pareto_front(results) if result["errors"] == 0]
+    if not front:
+        return None
+    best_recall = max(result["recall"] for result in front)
+    candidates = [result for result in front if result["recall"] >= best_recall - tolerance]
+    return min(candidates, key=lambda result: (result["p99_ms"], -result["precision"]))
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--images", type=int, default=100, help="The number of synthetic screenshots.")
+    arguments.add_argument(
+        "--token-ratio", type=float, default=0.5, help="The share of screenshots that contain a token."
+    )
+    arguments.add_argument(
+        "--profiles", help="Comma separated names of the profiles to compare. Defaults to every profile."
+    )
+    arguments.add_argument(
+        "--tolerance", type=float, default=0.02, help="Recall a faster profile may lose and still be recommended."
+    )
+    arguments.add_argument(
+        "--photo-ratio", type=float, default=0.2, help="The share of screenshots that are turned into photos."
+    )
+    arguments.add_argument("--seed", type=int, default=0, help="The seed of the synthetic screenshots.")
+    arguments.add_argument("--save-images", help="A directory to save the synthetic screenshots to.")
+    arguments.add_argument("--json", help="A file to write the results to as JSON.")
+    options = arguments.parse_args()
+    logger.remove()
+    logger.add(lambda message: print(message, end=""), level="INFO")
+
+    config = Config()
+    settings = config.ocr_profiles
+    names = options.profiles.split(",") if options.profiles else list(settings)
+    unknown = [name for name in names if name not in settings]
+    if unknown:
+        arguments.error(f"Unknown profiles: {', '.join(unknown)}")
+    profiles = [OCRProfile(name=name, **settings[name]) for name in names]
+
+    rng = random.Random(options.seed)
+    samples = [make_screenshot(rng, rng.random() < options.token_ratio) for _ in range(options.images)]
+    samples = [
+        (make_photo(rng, data), token) if rng.random() < options.photo_ratio else (data, token)
+        for data, token in samples
+    ]
+    if options.save_images:
+        os.makedirs(options.save_images, exist_ok=True)
+        for number, (data, token) in enumerate(samples):
+            extension = "jpg" if data[:2] == b"\xff\xd8" else "png"
+            with open(os.path.join(options.save_images, f"{number:04d}.{extension}"), "wb") as f:
+                f.write(data)
+
+    parser = TokenParser()
+    results = []
+    for profile in profiles:
+        logger.info(f"Evaluating profile {profile.name} on {len(samples)} images.")
+        results.append(evaluate(profile, samples, parser))
+
+    front = {result["profile"] for result in pareto_front(results)}
+    print(f"\n{'profile':<16}{'recall':>8}{'precision':>11}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}  pareto")
+    for result in results:
+        print(
+            f"{result['profile']:<16}{result['recall']:>8.3f}{result['precision']:>11.3f}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+            f"  {'yes' if result['profile'] in front else ''}"
+        )
+    for profile, result in zip(profiles, results):
+        if profile.preprocessing == "auto":
+            routes = ", ".join(f"{route}: {count}" for route, count in sorted(result["routes"].items()))
+            print(f"Profile {result['profile']} routed the images to {routes}.")
+
+    best = recommend(results, options.tolerance)
+    if best is None:
+        print("\nNo profile read every image, check that Tesseract and the traineddata of the profiles are installed.")
+    else:
+        print(f'\nRecommended profile: {best["profile"]}, select it in config.yml with:\n')
+        print(f'OCR:\n  profile: "{best["profile"]}"')
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "recommended": best and best["profile"]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+A micro-benchmark of the cost of a single token candidate on the parser hot path. It compares building a pydantic
+:class:`Token` and converting it with a JSON round-trip, which is what the parser used to do for every candidate,
+with building a slotted :class:`TokenRecord` and converting it straight to a dictionary, which is what it does now.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.token_records --candidates 2000 --repeat 5
+"""
+import argparse
+import base64
+import json
+import random
+import string
+import time
+import typing
+
+from loguru import logger
+
+from core.parser import TokenParser
+from utils.models import Token, TokenRecord
+
+
+def make_token(rng: random.Random) -> str:
+    """
+    This function builds a discord bot token like string, whose components are all valid.
+    """
+    alphabet = string.ascii_letters + string.digits + "-_"
+    user_id = base64.b64encode(str(rng.randrange(10 ** 17, 10 ** 18)).encode()).decode().rstrip("=")
+    # Seconds since the token epoch, late enough to be after the Discord epoch.
+    seconds = rng.randrange(130_000_000, 200_000_000)
+    timestamp = base64.urlsafe_b64encode(seconds.to_bytes(4, "big")).decode().rstrip("=")
+    hmac = "".join(rng.choice(alphabet) for _ in range(27))
+    return f"{user_id}.{timestamp}.{hmac}"
+
+
+def make_text(candidates: int, seed: int = 0) -> str:
+    """
+    This function builds a text that contains a number of discord bot token like strings, separated by filler words.
+    """
+    rng = random.Random(seed)
+    return "\n".join(f"lorem ipsum {make_token(rng)} dolor sit amet" for _ in range(candidates))
+
+
+def legacy_jsonify(token: Token) -> dict:
+    """
+    This function converts a token the way :meth:`Token.jsonify` used to, through a JSON round-trip.
+    """
+    data = token.jsonify()
+    return json.loads(json.dumps(data))
+
+
+def measure(function: typing.Callable[[], typing.Any], repeat: int) -> float:
+    """
+    This function returns the best time of a number of runs of a function, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--candidates", type=int, default=2000, help="The number of token candidates.")
+    arguments.add_argument("--repeat", type=int, default=5, help="The number of runs, the best one is reported.")
+    options = arguments.parse_args()
+    logger.remove()  # Rejected candidates are logged, which would be measured along with them.
+
+    parser = TokenParser()
+    text = make_text(options.candidates)
+    records = parser.scan(text, data_parsed_from_type="text")
+    fields = [{name: getattr(record, name) for name in TokenRecord.__slots__} for record in records]
+    count = len(records)
+
+    results = {
+        "regex only": measure(lambda: list(parser.detectors.finditer(text)), options.repeat),
+        "before: Token + json round-trip": measure(
+            lambda: [legacy_jsonify(Token(**data)) for data in fields], options.repeat
+        ),
+        "after: TokenRecord + jsonify": measure(
+            lambda: [TokenRecord(**data).jsonify() for data in fields], options.repeat
+        ),
+        "scan + jsonify, end to end": measure(
+            lambda: [record.jsonify() for record in parser.scan(text, data_parsed_from_type="text")],
+            options.repeat,
+        ),
+    }
+
+    print(f"{count} candidates, best of {options.repeat} runs")
+    for name, elapsed in results.items():
+        print(f"  {name:<34} {elapsed * 1e9 / max(count, 1):>10.0f} ns per candidate")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,5 @@
+from .batch import *
+from .ocr import *
 from .parser import *
 from .reader import *
+from .session import *
@@ -0,0 +1,306 @@
+import codecs
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import typing
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from loguru import logger
+
+from core.ocr import OCRProfile, read_text
+from core.parser import TokenParser
+from utils.exceptions import InvalidImage
+
+__all__ = (
+    "BatchScanner",
+    "read_file_list",
+    "scan_file",
+)
+
+IMAGE_EXTENSIONS = frozenset(
+    {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+)
+
+# Text files are read and scanned in chunks of this many bytes, so that large files are never held in memory.
+CHUNK_SIZE = 1_048_576
+
+_parser: typing.Optional[TokenParser] = None
+_profile: typing.Optional[OCRProfile] = None
+
+
+def _init_worker(profile: typing.Optional[OCRProfile] = None) -> None:
+    """
+    This function is run once in every worker process, and creates the parser and sets the OCR profile used by
+    :func:`scan_file`.
+    """
+    global _parser, _profile
+    _parser = TokenParser()
+    _profile = profile
+
+
+def _result(path: str) -> dict:
+    """
+    This function returns the result of a file before it is scanned.
+    """
+    return {
+        "path": path,
+        "type": "image" if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS else "text",
+        "size": 0,
+        "tokens": [],
+        "error": None,
+    }
+
+
+def _scan_text(f: typing.BinaryIO, result: dict) -> None:
+    """
+    This function scans a text file in chunks. Every chunk is scanned together with the end of the text before it,
+    as long as the longest token minus one character, so that tokens split across two chunks are still found, like
+    :meth:`core.session.ScanSession.feed` does with text deltas.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    overlap = _parser.max_token_length - 1
+    tail = str()
+    while True:
+        data = f.read(CHUNK_SIZE)
+        result["size"] += len(data)
+        window = tail + decoder.decode(data, final=not data)
+        result["tokens"].extend(
+            token.jsonify() for token in _parser.scan(window, data_parsed_from_type="text", boundary=len(tail))
+        )
+        if not data:
+            break
+        tail = window[-overlap:]
+
+
+def scan_file(path: str) -> dict:
+    """
+    This function scans a single file for tokens. Images are read with Tesseract OCR engine first, with the OCR
+    profile the worker process was started with, every other file is read as text, in chunks. It is run in the
+    worker processes of :class:`BatchScanner`.
+
+    Parameters:
+        path (str): This parameter takes the path of the file to scan.
+
+    Returns:
+        (dict): The path, type and size of the file, every token found in it, the time it took to scan it, and
+                the error that occurred, if any.
+    """
+    global _parser
+    if _parser is None:
+        _parser = TokenParser()
+
+    started = time.perf_counter()
+    result = _result(path)
+    try:
+        with open(path, "rb") as f:
+            if result["type"] == "image":
+                data = f.read()
+                result["size"] = len(data)
+                text = read_text(BytesIO(data), profile=_profile)
+                result["tokens"] = [
+                    token.jsonify() for token in _parser.scan(text, data_parsed_from_type="image")
+                ]
+            else:
+                _scan_text(f, result)
+    except (OSError, InvalidImage) as e:
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+class BatchScanner:
+    """
+    A class that scans many files for tokens offline, without going through the HTTP API. Files are scanned in a
+    pool of worker processes, results are written as JSON lines as soon as they complete, and every finished file is
+    recorded in a checkpoint file, so that an interrupted run can be resumed where it stopped. If a worker process
+    crashes, the files it was scanning are written as failed, but left out of the checkpoint so that a resumed run
+    scans them again, and the pool is replaced. Images are read with the OCR profile given, like the API does.
+    """
+
+    def __init__(
+        self,
+        output: typing.TextIO,
+        checkpoint_path: typing.Optional[str] = None,
+        workers: typing.Optional[int] = None,
+        progress_interval: float = 10.0,
+        profile: typing.Optional[OCRProfile] = None,
+    ):
+        self.output = output
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers or os.cpu_count() or 1
+        self.profile = profile
+        self.progress_interval = progress_interval
+        self.logger = logger
+        self.completed: typing.Set[str] = set()
+        self.files_scanned = 0
+        self.bytes_scanned = 0
+        self.tokens_found = 0
+        self.errors = 0
+
+    def load_checkpoint(self) -> int:
+        """
+        This method loads the paths of the files that were already scanned by a previous run from the checkpoint
+        file, so that they are skipped.
+
+        Returns:
+            (int): The number of files that were already scanned.
+        """
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            self.completed = {line.rstrip("\n") for line in f if line.strip()}
+        return len(self.completed)
+
+    @staticmethod
+    def walk(sources: typing.Iterable[str]) -> typing.Iterator[str]:
+        """
+        This method yields every file in the sources, directories are walked recursively.
+
+        Parameters:
+            sources (typing.Iterable[str]): This parameter takes paths of files and directories.
+
+        Returns:
+            (typing.Iterator[str]): The paths of the files.
+        """
+        for source in sources:
+            if os.path.isdir(source):
+                for directory, _, files in os.walk(source):
+                    for name in sorted(files):
+                        yield os.path.join(directory, name)
+            else:
+                yield source
+
+    def _report(self, started: float) -> None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.logger.info(
+            f"Scanned {self.files_scanned} files ({self.bytes_scanned / 1_048_576:.1f} MiB) in {elapsed:.1f}s, "
+            f"{self.files_scanned / elapsed:.1f} files/s, {self.bytes_scanned / 1_048_576 / elapsed:.2f} MiB/s, "
+            f"{self.tokens_found} tokens found, {self.errors} errors."
+        )
+
+    def run(self, sources: typing.Iterable[str]) -> int:
+        """
+        This method scans every file in the sources that is not in the checkpoint yet. At most a few files per
+        worker are queued at once, so that the list of files is never held in memory. A pool whose worker process
+        crashed is replaced, and the run goes on.
+
+        Parameters:
+            sources (typing.Iterable[str]): This parameter takes paths of files and directories.
+
+        Returns:
+            (int): The number of files scanned by this run.
+        """
+        skipped = self.load_checkpoint()
+        if skipped:
+            self.logger.info(f"Resuming, {skipped} files were already scanned and will be skipped.")
+
+        checkpoint = (
+            open(self.checkpoint_path, "a", encoding="utf-8") if self.checkpoint_path else None
+        )
+        paths = (path for path in self.walk(sources) if path not in self.completed)
+        pending: typing.Dict[concurrent.futures.Future, str] = {}
+        started = last_report = time.perf_counter()
+        pool = self._create_pool()
+        try:
+            for path in paths:
+                try:
+                    future = pool.submit(scan_file, path)
+                except BrokenProcessPool:
+                    # The files that were queued in the broken pool failed with it, they are written by _collect.
+                    pool = self._replace_pool(pool)
+                    future = pool.submit(scan_file, path)
+                pending[future] = path
+                while len(pending) >= self.workers * 4:
+                    self._collect(pending, checkpoint)
+                    if time.perf_counter() - last_report >= self.progress_interval:
+                        self._report(started)
+                        last_report = time.perf_counter()
+
+            while pending:
+                self._collect(pending, checkpoint)
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+            if checkpoint is not None:
+                checkpoint.close()
+            self._report(started)
+
+        return self.files_scanned
+
+    def _create_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.profile,)
+        )
+
+    def _replace_pool(
+        self, pool: concurrent.futures.ProcessPoolExecutor
+    ) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        This method replaces a pool whose worker process crashed.
+        """
+        self.logger.warning("A worker process crashed, replacing the pool.")
+        pool.shutdown(wait=False)
+        return self._create_pool()
+
+    def _collect(
+        self,
+        pending: typing.Dict[concurrent.futures.Future, str],
+        checkpoint: typing.Optional[typing.TextIO],
+    ) -> None:
+        """
+        This method waits for at least one of the pending files to finish, and writes the results of the finished
+        files to the output, and only then records them in the checkpoint, so that a result is never lost when a run
+        is interrupted. Files whose worker process crashed are written as failed, but not recorded in the checkpoint.
+        """
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        finished = []
+        for future in done:
+            path = pending.pop(future)
+            try:
+                result = future.result()
+                finished.append(path)
+            except BrokenProcessPool as e:
+                # Which of the files the process was scanning crashed it is unknown, so every one of them failed.
+                result = _result(path)
+                result["error"] = f"{e.__class__.__name__}: {e}"
+            self.output.write(json.dumps(result) + "\n")
+            self.files_scanned += 1
+            self.bytes_scanned += result["size"]
+            self.tokens_found += sum(1 for token in result["tokens"] if token["is_valid"])
+            self.errors += result["error"] is not None
+        self.output.flush()
+
+        if checkpoint is not None and finished:
+            checkpoint.write("".join(path + "\n" for path in finished))
+            checkpoint.flush()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} workers={self.workers} scanned={self.files_scanned}>"
+
+
+def read_file_list(path: str) -> typing.Iterator[str]:
+    """
+    This function yields the paths listed in a file, one per line. A path of "-" reads the list from stdin.
+
+    Parameters:
+        path (str): This parameter takes the path of the file list.
+
+    Returns:
+        (typing.Iterator[str]): The paths in the list.
+    """
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
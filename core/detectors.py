@@ -0,0 +1,395 @@
+import math
+import re
+import typing
+from collections import Counter
+
+from utils.models import TokenRecord
+
+__all__ = (
+    "Detector",
+    "DetectorMatch",
+    "DetectorRegistry",
+    "validate_discord_user_token",
+    "validate_discord_webhook",
+    "validate_api_key",
+    "discord_user_token_detector",
+    "discord_webhook_detector",
+    "api_key_detector",
+)
+
+Validator = typing.Callable[[typing.Tuple[str, ...], typing.Optional[str], str], TokenRecord]
+
+
+class DetectorMatch(typing.NamedTuple):
+    """
+    A match of a :class:`Detector` in a text.
+    """
+
+    detector: "Detector"
+    start: int
+    end: int
+    text: str
+    groups: typing.Tuple[str, ...]
+
+
+class Detector:
+    """
+    A class that represents a type of secret that can be detected, with the regex that matches it and the function
+    that validates a match. If every match of the detector starts with one of a few literal prefixes, the prefixes
+    should be given, so that the detector is only tried where one of them occurs in the text.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pattern: str,
+        validator: Validator,
+        max_length: int,
+        flags: int = 0,
+        prefixes: typing.Sequence[str] = (),
+    ):
+        self.name = name
+        self.pattern = pattern
+        self.validator = validator
+        self.max_length = max_length
+        self.regex = re.compile(pattern, flags)
+        self.prefixes = tuple(prefix.lower() for prefix in prefixes)
+        self.offset = 0  # The index of the group of this detector in the combined regex.
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+
+class DetectorRegistry:
+    """
+    A class that keeps every registered :class:`Detector` and scans text for all of them at once.
+
+    Detectors without literal prefixes are compiled into one combined regex, which costs one pass over the text
+    however many of them there are. Detectors with literal prefixes are only tried at the positions where one of
+    their prefixes occurs, which are found with :meth:`str.find` in ascii text, so each of them adds a small fraction
+    of the cost of a regex pass rather than a pass of its own. Run `python -m benchmarks.detector_scan` to measure it.
+    """
+
+    def __init__(self):
+        self.detectors: typing.Dict[str, Detector] = {}
+        self._by_offset: typing.Dict[int, Detector] = {}
+        self._by_prefix: typing.Dict[str, typing.List[Detector]] = {}
+        self._prefix_detectors: typing.List[typing.List[Detector]] = []
+        self._ordered_prefixes: typing.Tuple[str, ...] = ()
+        self._combined: typing.Optional[typing.Pattern] = None
+        self._prefixes: typing.Optional[typing.Pattern] = None
+
+    def register(self, detector: Detector) -> Detector:
+        """
+        This method registers a detector, replacing any detector that has the same name.
+
+        Parameters:
+            detector (Detector): This parameter takes the detector to register.
+
+        Returns:
+            (Detector): The registered detector.
+        """
+        self.detectors[detector.name] = detector
+        self._compile()
+        return detector
+
+    def unregister(self, name: str) -> typing.Optional[Detector]:
+        """
+        This method removes a detector from the registry.
+
+        Parameters:
+            name (str): This parameter takes the name of the detector.
+
+        Returns:
+            (typing.Optional[Detector]): The removed detector, or None if no detector has that name.
+        """
+        detector = self.detectors.pop(name, None)
+        self._compile()
+        return detector
+
+    def _compile(self) -> None:
+        """
+        This method compiles the combined regex of the detectors without prefixes, and the regex of the prefixes of
+        the other detectors. Each detector's pattern is wrapped in its own group with its own flags.
+        """
+        parts = []
+        self._by_offset = {}
+        self._by_prefix = {}
+        offset = 1
+        for detector in self.detectors.values():
+            if detector.prefixes:
+                for prefix in detector.prefixes:
+                    self._by_prefix.setdefault(prefix, []).append(detector)
+                continue
+
+            detector.offset = offset
+            self._by_offset[offset] = detector
+            pattern = detector.pattern
+            if detector.regex.flags & re.IGNORECASE:
+                pattern = f"(?i:{pattern})"
+            parts.append(f"({pattern})")
+            offset += 1 + detector.regex.groups
+
+        self._combined = re.compile("|".join(parts)) if parts else None
+        if self._by_prefix:
+            # Longer prefixes go first, so that a prefix of another prefix does not hide it. Every prefix has its own
+            # group, so a match is mapped back to its detectors by the group that matched, and not by its text, which
+            # unicode case folding can make differ from the prefix, such as "ſ" matching "s".
+            self._ordered_prefixes = tuple(sorted(self._by_prefix, key=len, reverse=True))
+            self._prefix_detectors = [self._by_prefix[prefix] for prefix in self._ordered_prefixes]
+            self._prefixes = re.compile(
+                "|".join(f"({re.escape(prefix)})" for prefix in self._ordered_prefixes), re.IGNORECASE
+            )
+        else:
+            self._ordered_prefixes = ()
+            self._prefixes = None
+
+    @property
+    def max_length(self) -> int:
+        """
+        This property returns the length of the longest string any registered detector can match.
+        """
+        return max((detector.max_length for detector in self.detectors.values()), default=0)
+
+    def _find_prefixes(self, text: str) -> typing.List[typing.Tuple[int, int]]:
+        """
+        This method returns the positions of the prefixes in the text, along with the index of each prefix, the same
+        way the regex of the prefixes would find them: without overlaps, and the longest prefix first.
+        """
+        if not text.isascii():
+            return [(match.start(), match.lastindex - 1) for match in self._prefixes.finditer(text)]
+
+        # Lowercasing ascii text keeps every offset the same, and str.find skips through the text for a literal a lot
+        # faster than the regex engine tries an alternation of literals at every position.
+        lowered = text.lower()
+        found = []
+        for index, prefix in enumerate(self._ordered_prefixes):
+            start = lowered.find(prefix)
+            while start != -1:
+                found.append((start, index))
+                start = lowered.find(prefix, start + 1)
+        found.sort()
+
+        positions = []
+        end = 0
+        for start, index in found:
+            if start >= end:
+                positions.append((start, index))
+                end = start + len(self._ordered_prefixes[index])
+        return positions
+
+    def _find_prefixed(self, text: str) -> typing.Iterator[DetectorMatch]:
+        """
+        This method yields the matches of the detectors with prefixes, by trying them only where one of their
+        prefixes occurs in the text.
+        """
+        for start, index in self._find_prefixes(text):
+            for detector in self._prefix_detectors[index]:
+                match = detector.regex.match(text, start)
+                if match is not None:
+                    yield DetectorMatch(
+                        detector, match.start(), match.end(), match.group(), match.groups()
+                    )
+                    break
+
+    def _find_combined(self, text: str) -> typing.Iterator[DetectorMatch]:
+        """
+        This method yields the matches of the detectors without prefixes, found with the combined regex.
+        """
+        for match in self._combined.finditer(text):
+            # The group of the detector closes after its inner groups, so it is always the last matched group.
+            detector = self._by_offset[match.lastindex]
+            yield DetectorMatch(
+                detector,
+                match.start(),
+                match.end(),
+                match.group(detector.offset),
+                match.groups()[detector.offset : detector.offset + detector.regex.groups],
+            )
+
+    def finditer(self, text: str) -> typing.Iterator[DetectorMatch]:
+        """
+        This method scans the text for every registered detector, and yields the matches in the order they appear
+        in the text. Like :meth:`re.Pattern.finditer`, matches never overlap, the leftmost one is kept.
+
+        Parameters:
+            text (str): This parameter takes the text to scan.
+
+        Returns:
+            (typing.Iterator[DetectorMatch]): The matches of every secret found.
+        """
+        if self._prefixes is None:
+            if self._combined is not None:
+                yield from self._find_combined(text)
+            return
+
+        matches = list(self._find_prefixed(text))
+        if self._combined is not None:
+            matches.extend(self._find_combined(text))
+            matches.sort(key=lambda detector_match: detector_match.start)
+
+        end = 0
+        for detector_match in matches:
+            if detector_match.start < end:
+                continue
+            end = detector_match.end
+            yield detector_match
+
+    def __len__(self):
+        return len(self.detectors)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {list(self.detectors)}>"
+
+
+def shannon_entropy(data: str) -> float:
+    """
+    This function returns the Shannon entropy of a string in bits per character.
+
+    Parameters:
+        data (str): This parameter takes the string.
+
+    Returns:
+        (float): The entropy of the string.
+    """
+    if not data:
+        return 0.0
+    length = len(data)
+    return -sum(
+        count / length * math.log2(count / length) for count in Counter(data).values()
+    )
+
+
+def validate_discord_user_token(
+    data: typing.Tuple[str, ...],
+    raw_data: typing.Optional[str],
+    data_parsed_from_type: str = None,
+) -> TokenRecord:
+    """
+    This function validates a multi-factor authentication discord user token, which starts with `mfa.` and is
+    followed by a base64 string.
+
+    Parameters:
+        data (typing.Tuple[str, ...]): This parameter takes the base64 part of the token.
+
+        raw_data (typing.Optional[str]): This parameter takes the raw text data the token was found in.
+
+        data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data.
+
+    Returns:
+        (TokenRecord): The token record containing the data extracted from the token.
+    """
+    is_valid = len(set(data[0].lower())) > 3
+    return TokenRecord(
+        token_string=f"mfa.{data[0]}",
+        is_valid=is_valid,
+        reason="This user token is valid, as its components are valid."
+        if is_valid
+        else "This user token is invalid, as it has less than 3 unique characters.",
+        raw_data=raw_data,
+    )
+
+
+def validate_discord_webhook(
+    data: typing.Tuple[str, ...],
+    raw_data: typing.Optional[str],
+    data_parsed_from_type: str = None,
+) -> TokenRecord:
+    """
+    This function validates a discord webhook url, the ID of the webhook is returned as the user ID.
+
+    Parameters:
+        data (typing.Tuple[str, ...]): This parameter takes the host, webhook ID and webhook secret of the url.
+
+        raw_data (typing.Optional[str]): This parameter takes the raw text data the webhook was found in.
+
+        data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data.
+
+    Returns:
+        (TokenRecord): The token record containing the data extracted from the webhook url.
+    """
+    host, webhook_id, secret = data
+    is_valid = len(set(secret.lower())) > 3
+    return TokenRecord(
+        token_string=f"https://{host}/api/webhooks/{webhook_id}/{secret}",
+        user_id=int(webhook_id),
+        is_valid=is_valid,
+        reason="This webhook is valid, as all components of the webhook url are valid."
+        if is_valid
+        else "This webhook is invalid, as its secret has less than 3 unique characters.",
+        raw_data=raw_data,
+    )
+
+
+def validate_api_key(
+    data: typing.Tuple[str, ...],
+    raw_data: typing.Optional[str],
+    data_parsed_from_type: str = None,
+) -> TokenRecord:
+    """
+    This function validates a generic api key that was assigned to a name such as `api_key` or `secret`, the key is
+    only deemed valid if it looks random enough to be a real secret.
+
+    Parameters:
+        data (typing.Tuple[str, ...]): This parameter takes the api key.
+
+        raw_data (typing.Optional[str]): This parameter takes the raw text data the api key was found in.
+
+        data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data.
+
+    Returns:
+        (TokenRecord): The token record containing the api key.
+    """
+    entropy = shannon_entropy(data[0])
+    is_valid = entropy >= 3.5
+    return TokenRecord(
+        token_string=data[0],
+        is_valid=is_valid,
+        reason=f"This api key is valid, as it has a high entropy of {entropy:.2f} bits per character."
+        if is_valid
+        else f"This api key is invalid, as it has a low entropy of {entropy:.2f} bits per character.",
+        raw_data=raw_data,
+    )
+
+
+def discord_user_token_detector() -> Detector:
+    """
+    This function returns a detector for multi-factor authentication discord user tokens.
+    """
+    return Detector(
+        name="discord_user_token",
+        pattern=r"mfa\.([a-z0-9_-]{84})",
+        validator=validate_discord_user_token,
+        max_length=4 + 84,
+        flags=re.IGNORECASE,
+        prefixes=("mfa.",),
+    )
+
+
+def discord_webhook_detector() -> Detector:
+    """
+    This function returns a detector for discord webhook urls.
+    """
+    return Detector(
+        name="discord_webhook",
+        pattern=r"https://((?:ptb\.|canary\.)?discord(?:app)?\.com)/api/webhooks/(\d{17,20})/([a-z0-9_-]{60,68})",
+        validator=validate_discord_webhook,
+        max_length=8 + 21 + 14 + 20 + 1 + 68,
+        flags=re.IGNORECASE,
+        prefixes=("https://",),
+    )
+
+
+def api_key_detector() -> Detector:
+    """
+    This function returns a detector for generic high entropy api keys assigned to a name such as `api_key`.
+    """
+    return Detector(
+        name="api_key",
+        pattern=r"(?:api[_-]?(?:key|secret)|secret[_-]?key|a(?:ccess|uth)[_-]?token)"
+        r"[\"']?\s{0,3}[:=]\s{0,3}[\"']?([a-z0-9_+/=-]{32,128})",
+        validator=validate_api_key,
+        max_length=12 + 1 + 3 + 1 + 3 + 1 + 128,
+        flags=re.IGNORECASE,
+        prefixes=("api", "secret", "access", "auth"),
+    )
@@ -0,0 +1,175 @@
+import collections
+import hashlib
+import hmac
+import math
+import secrets
+import typing
+
+from loguru import logger
+
+__all__ = (
+    "BloomFilter",
+    "FingerprintStore",
+)
+
+
+class BloomFilter:
+    """
+    A class that implements a simple in-memory Bloom filter over fixed size digests. A Bloom filter can tell with
+    certainty that a digest was never added, but can only tell that a digest was probably added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(
+            8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, digest: bytes) -> typing.Iterator[int]:
+        """
+        This method derives the bit indexes of a digest using double hashing, so that only one real hash has to
+        be computed per item.
+
+        Parameters:
+            digest (bytes): This parameter takes a digest of at least 16 bytes.
+
+        Returns:
+            (typing.Iterator[int]): The bit indexes of the digest.
+        """
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, digest: bytes) -> None:
+        """
+        This method adds a digest to the filter.
+
+        Parameters:
+            digest (bytes): This parameter takes a digest of at least 16 bytes.
+        """
+        for index in self._indexes(digest):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(
+            self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(digest)
+        )
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} size={self.size} hashes={self.hash_count}>"
+
+
+class FingerprintStore:
+    """
+    A class that remembers which tokens have already been detected. Only salted hashes of the token strings are
+    stored, never the tokens themselves. Lookups go through an in-memory Bloom filter first, which is exact for the
+    tokens that were never detected. Its hits are confirmed against an exact store: a bounded set of the
+    `exact_capacity` most recently detected fingerprints, and then, if one is attached, a redis set shared by every
+    instance of the API. Tokens that are only known to the filter are tagged as seen before by :meth:`add`, which is
+    wrong with a probability of about `error_rate` while fewer than `capacity` tokens were added, but only confirmed
+    tokens are reported by :meth:`contains`, so validation is never skipped for a token that was not detected.
+    """
+
+    def __init__(
+        self,
+        salt: typing.Optional[str],
+        capacity: int,
+        error_rate: float,
+        exact_capacity: int = 100_000,
+        skip_known: bool = False,
+        redis_key: str = "token_fingerprints",
+    ):
+        if not salt:
+            logger.warning(
+                "No fingerprint salt was set in config.yml, a random salt is used, so fingerprints will not "
+                "be recognised after a restart or by other instances of the API."
+            )
+            salt = secrets.token_hex(32)
+
+        self.salt = salt.encode("utf-8")
+        self.skip_known = skip_known
+        self.redis_key = redis_key
+        self.redis = None
+        self.bloom = BloomFilter(capacity=capacity, error_rate=error_rate)
+        self.exact_capacity = exact_capacity
+        self.recent: typing.OrderedDict[bytes, None] = collections.OrderedDict()
+        self.added = 0
+
+    def fingerprint(self, token_string: str) -> bytes:
+        """
+        This method returns the salted hash of a token string.
+
+        Parameters:
+            token_string (str): This parameter takes the token string.
+
+        Returns:
+            (bytes): The salted SHA-256 digest of the token string.
+        """
+        return hmac.new(self.salt, token_string.encode("utf-8"), hashlib.sha256).digest()
+
+    def _remember(self, digest: bytes) -> None:
+        if digest not in self.bloom:
+            self.bloom.add(digest)
+            self.added += 1
+        self.recent[digest] = None
+        self.recent.move_to_end(digest)
+        if len(self.recent) > self.exact_capacity:
+            self.recent.popitem(last=False)
+
+    def _confirmed(self, digest: bytes) -> bool:
+        if digest not in self.recent:
+            return False
+        self.recent.move_to_end(digest)
+        return True
+
+    async def contains(self, token_string: str) -> bool:
+        """
+        |coroutine|
+        This method checks if a token has already been detected. Unlike :meth:`add`, a hit of the Bloom filter is
+        not enough, it has to be confirmed by the exact store.
+
+        Parameters:
+            token_string (str): This parameter takes the token string.
+
+        Returns:
+            (bool): True if the token has already been detected, False if it was never detected, or if it is not
+                    in the exact store anymore.
+        """
+        digest = self.fingerprint(token_string)
+        if self.redis is None:
+            return digest in self.bloom and self._confirmed(digest)
+        if self._confirmed(digest):
+            return True
+
+        if await self.redis.sismember(self.redis_key, digest.hex()):
+            self._remember(digest)
+            return True
+        return False
+
+    async def add(self, token_string: str) -> bool:
+        """
+        |coroutine|
+        This method records a detected token.
+
+        Parameters:
+            token_string (str): This parameter takes the token string.
+
+        Returns:
+            (bool): True if the token was not detected before, False if it has probably already been detected.
+        """
+        digest = self.fingerprint(token_string)
+        known = digest in self.bloom
+        self._remember(digest)
+        if self.redis is None:
+            return not known
+        return bool(await self.redis.sadd(self.redis_key, digest.hex()))
+
+    def __len__(self):
+        return self.added
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} fingerprints={self.added} skip_known={self.skip_known}>"
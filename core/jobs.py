@@ -0,0 +1,451 @@
+import abc
+import asyncio
+import json
+import math
+import os
+import socket
+import time
+import typing
+import uuid
+from collections import Counter
+from io import BytesIO
+
+from loguru import logger
+
+from core.ocr import OCRProfile, clean_image, clean_image_data, ocr_image
+from utils.deadline import Deadline
+from utils.exceptions import DeadlineExceeded, InvalidImage, JobFailed, Overloaded
+from utils.lanes import ExecutionLane
+from utils.logs import log_event
+from utils.pool import RecyclingPool
+from utils.quotas import metered, record_usage
+
+__all__ = (
+    "JobQueue",
+    "LocalJobQueue",
+    "OCRJob",
+    "OCRWorker",
+    "RedisJobQueue",
+)
+
+
+class OCRJob(typing.NamedTuple):
+    """
+    An image that has to be read, and the time it has to be read by. The time is a wall clock time, as the job can be
+    read on another machine than the one that submitted it.
+    """
+
+    job_id: str
+    image: bytes
+    expires_at: float
+    entry_id: typing.Optional[str] = None  # The ID of the entry of the job in the Redis stream, if any.
+
+
+class JobQueue(abc.ABC):
+    """
+    The base class of the queues that hand image jobs from the API to OCR workers, and their results back. The API
+    calls :meth:`read_image`, workers call :meth:`fetch` and :meth:`complete`.
+    """
+
+    @abc.abstractmethod
+    async def submit(self, job: OCRJob) -> None:
+        """
+        |coroutine|
+        This method adds a job to the queue.
+
+        Raises:
+            (Overloaded): If the queue is full.
+        """
+
+    @abc.abstractmethod
+    async def wait(self, job_id: str, timeout: float) -> typing.Optional[dict]:
+        """
+        |coroutine|
+        This method waits for the result of a job.
+
+        Returns:
+            (typing.Optional[dict]): The result, or None if it did not arrive in time.
+        """
+
+    @abc.abstractmethod
+    async def fetch(self, consumer: str, count: int, timeout: float) -> typing.List[OCRJob]:
+        """
+        |coroutine|
+        This method takes jobs from the queue for a worker, waiting up to the timeout for the first one.
+
+        Returns:
+            (typing.List[OCRJob]): At most count jobs, or none if no job arrived in time.
+        """
+
+    @abc.abstractmethod
+    async def complete(self, job: OCRJob, result: dict) -> None:
+        """
+        |coroutine|
+        This method posts the result of a job back to the API node that is waiting for it.
+        """
+
+    async def read_image(self, data: bytes, timeout: float) -> typing.Tuple[str, typing.Optional[str]]:
+        """
+        |coroutine|
+        This method hands an image to the OCR workers, and waits for the text they read from it.
+
+        Parameters:
+            data (bytes): This parameter takes the image.
+
+            timeout (float): This parameter takes the number of seconds the image has to be read in.
+
+        Returns:
+            (typing.Tuple[str, typing.Optional[str]]): The text found in the image, and the preprocessing variant
+                                                       the worker cleaned it with.
+
+        Raises:
+            (Overloaded): If the queue is full.
+            (InvalidImage): If the image could not be opened.
+            (DeadlineExceeded): If no worker read the image in time.
+            (JobFailed): If the worker failed to read the image.
+        """
+        job = OCRJob(job_id=uuid.uuid4().hex, image=data, expires_at=time.time() + timeout)
+        await self.submit(job)
+        result = await self.wait(job.job_id, timeout)
+        if result is None or result["error"] == "deadline":
+            raise DeadlineExceeded("ocr")
+        if result["error"] == "invalid_image":
+            raise InvalidImage(result["detail"])
+        if result["error"] is not None:
+            raise JobFailed(job.job_id, result["detail"])
+        # The worker measured the CPU time Tesseract OCR engine took, which the request is charged for.
+        record_usage(cpu_ms=result.get("cpu_ms", 0.0))
+        return result["text"], result.get("route")
+
+
+class LocalJobQueue(JobQueue):
+    """
+    A queue that hands jobs to :class:`OCRWorker` tasks in the same process. It is used by tests and single node
+    setups, where the API and the worker share the event loop.
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+        self._jobs: typing.Optional[asyncio.Queue] = None
+        self.results: typing.Dict[str, asyncio.Future] = {}
+
+    @property
+    def jobs(self) -> asyncio.Queue:
+        # The queue is created on first use, so that it belongs to the event loop the server runs on.
+        if self._jobs is None:
+            self._jobs = asyncio.Queue(maxsize=self.max_length)
+        return self._jobs
+
+    async def submit(self, job: OCRJob) -> None:
+        try:
+            self.jobs.put_nowait(job)
+        except asyncio.QueueFull:
+            raise Overloaded("ocr queue", 1)
+        self.results[job.job_id] = asyncio.get_event_loop().create_future()
+
+    async def wait(self, job_id: str, timeout: float) -> typing.Optional[dict]:
+        future = self.results[job_id]
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.results.pop(job_id, None)
+
+    async def fetch(self, consumer: str, count: int, timeout: float) -> typing.List[OCRJob]:
+        try:
+            jobs = [await asyncio.wait_for(self.jobs.get(), timeout=timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while len(jobs) < count and not self.jobs.empty():
+            jobs.append(self.jobs.get_nowait())
+        return jobs
+
+    async def complete(self, job: OCRJob, result: dict) -> None:
+        future = self.results.get(job.job_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} queued={self.jobs.qsize()}/{self.max_length}>"
+
+
+class RedisJobQueue(JobQueue):
+    """
+    A queue that hands jobs to a fleet of OCR workers through a Redis stream, which the workers read as a consumer
+    group, so that every job is read by one worker. Results are pushed to a list per job, which the API node blocks
+    on. A job a worker took but never acknowledged, because the worker died, is claimed by another worker once it
+    has been idle for long enough.
+
+    The Redis client must not decode responses, as images are binary. It can be attached after the queue is created,
+    like the one of :class:`core.fingerprint.FingerprintStore`.
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        stream: str = "ocr:jobs",
+        group: str = "ocr-workers",
+        max_length: int = 1000,
+        result_ttl: int = 60,
+        claim_idle: float = 60.0,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.max_length = max_length
+        self.result_ttl = result_ttl
+        self.claim_idle = claim_idle
+        self.claim_page = 100
+        self.last_claim = 0.0
+
+    async def setup(self) -> None:
+        """
+        |coroutine|
+        This method creates the stream and the consumer group of the workers, if they do not exist yet.
+        """
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def result_key(self, job_id: str) -> str:
+        """
+        This method returns the key of the list the result of a job is pushed to.
+        """
+        return f"{self.stream}:result:{job_id}"
+
+    async def submit(self, job: OCRJob) -> None:
+        # The stream is never trimmed, as trimming would drop jobs that are still queued. The length check is not
+        # atomic, so the stream can grow past its maximum length by the number of jobs submitted at the same time.
+        if await self.redis.xlen(self.stream) >= self.max_length:
+            raise Overloaded("ocr queue", 1)
+        await self.redis.xadd(
+            self.stream,
+            {"job_id": job.job_id, "image": job.image, "expires_at": repr(job.expires_at)},
+        )
+
+    async def wait(self, job_id: str, timeout: float) -> typing.Optional[dict]:
+        # Older versions of Redis only block for whole seconds.
+        response = await self.redis.blpop(self.result_key(job_id), timeout=max(1, math.ceil(timeout)))
+        if response is None:
+            return None
+        return json.loads(response[1])
+
+    @staticmethod
+    def _parse(entry_id: typing.Union[bytes, str], fields: typing.Dict[bytes, bytes]) -> OCRJob:
+        return OCRJob(
+            job_id=fields[b"job_id"].decode("utf-8"),
+            image=fields[b"image"],
+            expires_at=float(fields[b"expires_at"]),
+            entry_id=entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id,
+        )
+
+    @staticmethod
+    def _next_id(entry_id: typing.Union[bytes, str]) -> str:
+        # The smallest ID after an entry, as exclusive ranges need Redis 6.2.
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode("utf-8")
+        milliseconds, _, sequence = entry_id.partition("-")
+        return f"{milliseconds}-{int(sequence or 0) + 1}"
+
+    async def claim(self, consumer: str, count: int) -> typing.List[OCRJob]:
+        """
+        |coroutine|
+        This method takes over jobs that another worker took, but has not acknowledged for longer than the claim
+        idle time. It only looks for them once per claim idle time, and pages through every pending job, as the
+        oldest ones can belong to workers that are still reading them.
+
+        Returns:
+            (typing.List[OCRJob]): The jobs that were claimed.
+        """
+        if time.monotonic() - self.last_claim < self.claim_idle:
+            return []
+        self.last_claim = time.monotonic()
+        min_idle_time = int(self.claim_idle * 1000)
+        stale = []
+        start = "-"
+        while len(stale) < count:
+            pending = await self.redis.xpending_range(self.stream, self.group, start, "+", self.claim_page)
+            stale.extend(entry["message_id"] for entry in pending if entry["time_since_delivered"] >= min_idle_time)
+            if len(pending) < self.claim_page:
+                break
+            start = self._next_id(pending[-1]["message_id"])
+        if not stale:
+            return []
+        claimed = await self.redis.xclaim(self.stream, self.group, consumer, min_idle_time, stale[:count])
+        # Entries that were deleted from the stream are claimed without their fields, and can only be acknowledged.
+        deleted = [entry_id for entry_id, fields in claimed if not fields]
+        if deleted:
+            await self.redis.xack(self.stream, self.group, *deleted)
+        return [self._parse(entry_id, fields) for entry_id, fields in claimed if fields]
+
+    async def fetch(self, consumer: str, count: int, timeout: float) -> typing.List[OCRJob]:
+        jobs = await self.claim(consumer, count)
+        if jobs:
+            return jobs
+        response = await self.redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=int(timeout * 1000)
+        )
+        return [self._parse(entry_id, fields) for _, entries in response or [] for entry_id, fields in entries]
+
+    async def complete(self, job: OCRJob, result: dict) -> None:
+        key = self.result_key(job.job_id)
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.lpush(key, json.dumps(result))
+        pipeline.expire(key, self.result_ttl)
+        pipeline.xack(self.stream, self.group, job.entry_id)
+        pipeline.xdel(self.stream, job.entry_id)
+        await pipeline.execute()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} stream={self.stream} group={self.group}>"
+
+
+class OCRWorker:
+    """
+    A class that reads the images of the jobs in a :class:`JobQueue` with :class:`CleanImage` and Tesseract OCR engine,
+    and posts the text back. It only takes as many jobs from the queue as it can read at once, so that the rest stay
+    in the queue for other workers. Images are cleaned in the processes of a :class:`RecyclingPool` if one is given,
+    so that the memory of a long running worker stays flat.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        profile: OCRProfile,
+        concurrency: int,
+        consumer: typing.Optional[str] = None,
+        pool: typing.Optional[RecyclingPool] = None,
+    ):
+        self.queue = queue
+        self.pool = pool
+        self.profile = profile
+        self.concurrency = concurrency
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.lane = ExecutionLane(name="worker", max_workers=concurrency, max_queue=concurrency)
+        self.logger = logger
+        self.processed = 0
+        self.failed = 0
+        self.expired = 0
+        self.routes: typing.Counter[str] = Counter()
+
+    def _read(self, job: OCRJob, deadline: Deadline) -> typing.Tuple[str, str]:
+        image, route = clean_image(BytesIO(job.image), deadline=deadline, preprocessing=self.profile.preprocessing)
+        return ocr_image(image, deadline=deadline, profile=self.profile), route
+
+    async def read(self, job: OCRJob) -> typing.Tuple[str, str]:
+        """
+        |coroutine|
+        This method cleans and reads the image of a job within the deadline of the job.
+
+        Parameters:
+            job (OCRJob): This parameter takes the job.
+
+        Returns:
+            (typing.Tuple[str, str]): The text found in the image, and the preprocessing variant it was cleaned with.
+        """
+        deadline = Deadline(timeout=max(0.0, job.expires_at - time.time()))
+        if self.pool is None:
+            return await self.lane.run(self._read, job, deadline)
+        image, route = await self.pool.run(clean_image_data, job.image, self.profile.preprocessing)
+        deadline.raise_if_expired("ocr")
+        return await self.lane.run(ocr_image, BytesIO(image), deadline=deadline, profile=self.profile), route
+
+    async def process(self, job: OCRJob) -> dict:
+        """
+        |coroutine|
+        This method reads the image of a job and posts the result back. Jobs whose deadline has already passed are
+        not read at all.
+
+        Parameters:
+            job (OCRJob): This parameter takes the job.
+
+        Returns:
+            (dict): The result that was posted, with the text, the preprocessing variant the image was cleaned
+                    with and the CPU time Tesseract OCR engine took to read it, or the error and its detail.
+        """
+        started = time.perf_counter()
+        result = {"job_id": job.job_id, "text": None, "error": None, "detail": None}
+        try:
+            if job.expires_at <= time.time():
+                raise DeadlineExceeded("queue")
+            with metered() as meter:
+                result["text"], result["route"] = await self.read(job)
+            result["cpu_ms"] = round(meter.cpu_ms, 3)
+            self.routes[result["route"]] += 1
+            self.processed += 1
+        except DeadlineExceeded as e:
+            self.expired += 1
+            result.update(error="deadline", detail=str(e))
+        except InvalidImage as e:
+            self.failed += 1
+            result.update(error="invalid_image", detail=str(e))
+        except Exception as e:
+            self.failed += 1
+            result.update(error="failed", detail=f"{e.__class__.__name__}: {e}")
+            log_event(
+                "job_failed", "ERROR", "OCR job {job_id} failed. Error: {error}", job_id=job.job_id, error=repr(e)
+            )
+
+        result["worker"] = self.consumer
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        await self.queue.complete(job, result)
+        return result
+
+    async def run(self, stop: typing.Optional[asyncio.Event] = None) -> None:
+        """
+        |coroutine|
+        This method takes jobs from the queue and reads them until the stop event is set, then waits for the jobs
+        it already took to finish.
+
+        Parameters:
+            stop (typing.Optional[asyncio.Event]): This parameter takes the event that stops the worker.
+        """
+        self.logger.info(f"OCR worker {self.consumer} started, reading {self.concurrency} images at once.")
+        tasks: typing.Set[asyncio.Task] = set()
+        try:
+            while stop is None or not stop.is_set():
+                free = self.concurrency - len(tasks)
+                if free <= 0:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                try:
+                    jobs = await self.queue.fetch(self.consumer, count=free, timeout=1.0)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log_event("queue_unavailable", "ERROR", "Could not fetch OCR jobs. Error: {error}", error=repr(e))
+                    await asyncio.sleep(1.0)
+                    continue
+                for job in jobs:
+                    task = asyncio.ensure_future(self.process(job))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            self.logger.info(f"OCR worker {self.consumer} stopped after reading {self.processed} images.")
+
+    def stats(self) -> dict:
+        """
+        This method returns the counters of the worker.
+
+        Returns:
+            (dict): The name of the worker, the number of images it read, failed to read, and skipped because
+                    their deadline had passed, and the number of images it cleaned with every preprocessing
+                    variant, along with the metrics of its lane and of the processes it cleans images in, if any.
+        """
+        return {
+            "consumer": self.consumer,
+            "processed": self.processed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "routes": dict(self.routes),
+            "lane": self.lane.stats(),
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.consumer} concurrency={self.concurrency}>"
@@ -0,0 +1,230 @@
+import os
+import subprocess
+import time
+import typing
+from io import BytesIO
+
+import pytesseract
+
+from core.reader import CleanImage
+from utils.deadline import Deadline
+from utils.quotas import record_usage
+
+__all__ = (
+    "OCRProfile",
+    "TesseractProcess",
+    "clean_image",
+    "clean_image_data",
+    "ocr_image",
+    "read_text",
+)
+
+
+class OCRProfile(typing.NamedTuple):
+    """
+    A named set of Tesseract OCR engine settings and the preprocessing variant of :class:`CleanImage` to run before
+    it. Profiles are defined in config.yml, and compared with `benchmarks/ocr_eval.py`.
+    """
+
+    name: str
+    lang: str = "eng"
+    oem: typing.Optional[int] = None  # OCR engine mode, 1 is the LSTM engine only.
+    psm: typing.Optional[int] = None  # Page segmentation mode, 6 assumes a single uniform block of text.
+    whitelist: typing.Optional[str] = None  # The only characters Tesseract is allowed to read.
+    tessdata_dir: typing.Optional[str] = None  # A directory of traineddata, such as tessdata_fast or tessdata_best.
+    preprocessing: str = "default"
+
+    def arguments(self) -> typing.List[str]:
+        """
+        This method returns the command line options of Tesseract for the profile.
+
+        Returns:
+            (typing.List[str]): The options, to pass after the input and output of Tesseract.
+        """
+        arguments = ["-l", self.lang]
+        if self.tessdata_dir:
+            arguments += ["--tessdata-dir", self.tessdata_dir]
+        if self.oem is not None:
+            arguments += ["--oem", str(self.oem)]
+        if self.psm is not None:
+            arguments += ["--psm", str(self.psm)]
+        if self.whitelist:
+            arguments += ["-c", f"tessedit_char_whitelist={self.whitelist}"]
+        return arguments
+
+
+class TesseractProcess(subprocess.Popen):
+    """
+    A :class:`subprocess.Popen` that keeps the CPU time the process used, which is only known when the process is
+    reaped, so Tesseract OCR engine is charged for the work it did and not for the time it waited. The process is
+    reaped with :func:`os.wait4`, which returns its resource usage, on systems that have it, otherwise the CPU time is
+    left as None.
+    """
+
+    cpu_time: typing.Optional[float] = None
+
+    def wait(self, timeout: typing.Optional[float] = None) -> int:
+        if self.returncode is None and hasattr(os, "wait4"):
+            self._reap(timeout)
+        return super().wait(timeout=timeout)
+
+    def _reap(self, timeout: typing.Optional[float]) -> None:
+        # os.wait4 can't wait for a limited time, so it is polled with a growing delay, like Popen.wait does.
+        endtime = None if timeout is None else time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            try:
+                pid, status, usage = os.wait4(self.pid, 0 if endtime is None else os.WNOHANG)
+            except ChildProcessError:
+                # The process was already reaped, Popen.wait handles it the way it always does.
+                return
+            if pid == self.pid:
+                self.cpu_time = usage.ru_utime + usage.ru_stime
+                self.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                return
+            remaining = endtime - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+
+def clean_image(
+    data: BytesIO,
+    deadline: typing.Optional[Deadline] = None,
+    preprocessing: str = "default",
+) -> typing.Tuple[BytesIO, str]:
+    """
+    This function cleans an image with :class:`CleanImage` so that Tesseract OCR engine can read it more accurately.
+
+    Parameters:
+        data (BytesIO): This parameter takes an image as a BytesIO object, that needs to be cleaned.
+
+        deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request, the image is not
+                                              cleaned if it has already passed.
+
+        preprocessing (str): This parameter takes the name of the preprocessing variant of :class:`CleanImage`.
+
+    Returns:
+        (typing.Tuple[BytesIO, str]): The cleaned image, encoded as PNG, and the preprocessing variant that ran,
+                                      which is the route the "auto" variant picked for the image.
+
+    Raises:
+        (InvalidImage): If the image could not be opened.
+        (DeadlineExceeded): If the deadline passed before the image was cleaned.
+    """
+    if deadline is not None:
+        deadline.raise_if_expired("clean")
+    return CleanImage.clean_and_route(image=data, preprocessing=preprocessing)
+
+
+def clean_image_data(data: bytes, preprocessing: str = "default") -> typing.Tuple[bytes, str]:
+    """
+    This function cleans an encoded image with :class:`CleanImage`. It takes and returns bytes, so that it can be
+    sent to the processes of a :class:`utils.pool.RecyclingPool`, which decode images away from the server process.
+
+    Parameters:
+        data (bytes): This parameter takes the encoded image.
+
+        preprocessing (str): This parameter takes the name of the preprocessing variant of :class:`CleanImage`.
+
+    Returns:
+        (typing.Tuple[bytes, str]): The cleaned image, encoded as PNG, and the preprocessing variant that ran.
+
+    Raises:
+        (InvalidImage): If the image could not be opened.
+    """
+    image, route = CleanImage.clean_and_route(image=BytesIO(data), preprocessing=preprocessing)
+    return image.getvalue(), route
+
+
+def ocr_image(
+    image: BytesIO,
+    lang: str = "eng",
+    deadline: typing.Optional[Deadline] = None,
+    profile: typing.Optional[OCRProfile] = None,
+) -> str:
+    """
+    This function returns the text Tesseract OCR engine reads from an image. Tesseract is run as a subprocess that
+    is killed as soon as the deadline passes or the request is cancelled. The CPU time of the subprocess is added
+    to the meter of the request, if its work is measured.
+
+    Parameters:
+        image (BytesIO): This parameter takes the image to read, in a format Tesseract can open, such as PNG.
+
+        lang (str): This parameter takes the language of the Tesseract language data to use.
+
+        deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        profile (typing.Optional[OCRProfile]): This parameter takes the settings to run Tesseract with, the
+                                               language is taken from the profile if it is given.
+
+    Returns:
+        (str): The text found in the image.
+
+    Raises:
+        (pytesseract.TesseractError): If Tesseract failed to read the image.
+        (DeadlineExceeded): If the deadline passed before Tesseract finished.
+    """
+    if deadline is not None:
+        deadline.raise_if_expired("ocr")
+
+    arguments = profile.arguments() if profile is not None else ["-l", lang]
+    started = time.perf_counter()
+    process = TesseractProcess(
+        [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", *arguments],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    data = image.getvalue()
+    while True:
+        try:
+            stdout, stderr = process.communicate(
+                data, timeout=deadline.poll_interval if deadline is not None else None
+            )
+            break
+        except subprocess.TimeoutExpired:
+            data = None  # The image was already written to stdin, it can't be sent twice.
+            if deadline is not None and deadline.expired:
+                process.kill()
+                process.wait()
+                _record_cpu_time(process, started)
+                deadline.raise_if_expired("ocr")
+
+    _record_cpu_time(process, started)
+    if process.returncode != 0:
+        raise pytesseract.TesseractError(
+            process.returncode, stderr.decode("utf-8", errors="replace").strip()
+        )
+    return stdout.decode("utf-8", errors="replace")
+
+
+def _record_cpu_time(process: TesseractProcess, started: float) -> None:
+    cpu_time = process.cpu_time if process.cpu_time is not None else time.perf_counter() - started
+    record_usage(cpu_ms=cpu_time * 1000)
+
+
+def read_text(
+    data: BytesIO, lang: str = "eng", profile: typing.Optional[OCRProfile] = None
+) -> str:
+    """
+    This function cleans an image with :class:`CleanImage` and returns the text Tesseract OCR engine reads from it.
+    It is a module level function, so that it can also be sent to worker processes.
+
+    Parameters:
+        data (BytesIO): This parameter takes an image as a BytesIO object, that needs to be read.
+
+        lang (str): This parameter takes the language of the Tesseract language data to use.
+
+        profile (typing.Optional[OCRProfile]): This parameter takes the settings to clean and read the image with.
+
+    Returns:
+        (str): The text found in the image.
+
+    Raises:
+        (InvalidImage): If the image could not be opened.
+    """
+    if profile is None:
+        return ocr_image(clean_image(data)[0], lang=lang)
+    return ocr_image(clean_image(data, preprocessing=profile.preprocessing)[0], profile=profile)
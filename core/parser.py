@@ -4,9 +4,17 @@ import typing
 from datetime import datetime, timezone
 from typing import Callable, Optional
 
-from loguru import logger
-
-from utils.models import Token
+from core.detectors import (
+    Detector,
+    DetectorMatch,
+    DetectorRegistry,
+    api_key_detector,
+    discord_user_token_detector,
+    discord_webhook_detector,
+)
+from core.fingerprint import FingerprintStore
+from utils.logs import log_event
+from utils.models import TokenRecord
 
 __all__ = ("TokenParser",)
 
@@ -14,10 +22,12 @@ __all__ = ("TokenParser",)
 class TokenParser:
     """
     A class that parses a discord bot token into its individual components and returns various information about it in
-    class :class:`Token` object.
+    class :class:`TokenRecord` object. Other types of secrets are detected by the detectors in :attr:`detectors`, all
+    of them are matched in a single pass over the text.
     """
 
-    def __init__(self):
+    def __init__(self, fingerprints: typing.Optional[FingerprintStore] = None):
+        self.fingerprints = fingerprints
         self.token_string = str()
         self.token_epoch = 1_293_840_000
         self.discord_epoch = 1_420_070_400
@@ -25,6 +35,19 @@ class TokenParser:
             r"([a-z0-9_-]{23,28})\.([a-z0-9_-]{6,7})\.([a-z0-9_-]{27})", re.IGNORECASE
         )  # regex for discord bot token, taken from https://github.com/onerandomusername/secrets-pre-commit
         # thanks arl!
+        self.detectors = DetectorRegistry()
+        self.detectors.register(
+            Detector(
+                name="discord_bot_token",
+                pattern=self.discord_bot_token_regex.pattern,
+                validator=self.build_token,
+                max_length=28 + 1 + 7 + 1 + 27,
+                flags=re.IGNORECASE,
+            )
+        )
+        self.detectors.register(discord_user_token_detector())
+        self.detectors.register(discord_webhook_detector())
+        self.detectors.register(api_key_detector())
 
     def get_timestamp(self, timestamp: str) -> typing.Optional[int]:
         """
@@ -42,14 +65,17 @@ class TokenParser:
                 base64.urlsafe_b64decode(timestamp + "=="), byteorder="big"
             )
             if data + self.token_epoch < self.discord_epoch:
-                logger.error(
-                    f"Invalid token timestamp: {data}, as the sum of timestamp and token epoch is smaller "
-                    f"than the Discord epoch."
+                log_event(
+                    "rejected_timestamp",
+                    "DEBUG",
+                    "Invalid token timestamp: {value}, as the sum of timestamp and token epoch is smaller "
+                    "than the Discord epoch.",
+                    value=data,
                 )
                 return None
             return data
         except ValueError:
-            logger.error(f"Could not decode timestamp: {timestamp}")
+            log_event("rejected_timestamp", "DEBUG", "Could not decode timestamp: {value}", value=timestamp)
             return None
 
     @staticmethod
@@ -70,7 +96,7 @@ class TokenParser:
             )
             return datetime_extracted_from_timestamp
         except Exception as e:
-            logger.error(f"Error while decoding timestamp: {e}")
+            log_event("rejected_timestamp", "DEBUG", "Error while decoding timestamp: {error}", error=str(e))
             return None
 
     @staticmethod
@@ -90,8 +116,11 @@ class TokenParser:
             decoded_base64_data = int(base64.urlsafe_b64decode(data))
             return decoded_base64_data
         except ValueError:
-            logger.error(
-                f"Could not decode user ID: {data}, as it is not a valid base64 encoded string."
+            log_event(
+                "rejected_user_id",
+                "DEBUG",
+                "Could not decode user ID: {value}, as it is not a valid base64 encoded string.",
+                value=data,
             )
             return None
 
@@ -111,18 +140,22 @@ class TokenParser:
         if unique > 3:
             return hmac
         else:
-            logger.error(
-                f"Could not decode hmac: {hmac}, as it has less than 3 unique characters."
+            log_event(
+                "rejected_hmac",
+                "DEBUG",
+                "Could not decode hmac: {value}, as it has less than 3 unique characters.",
+                value=hmac,
             )
             return None
 
     async def validate_token(
         self, raw_data: str, data_parsed_from_type: str = None
-    ) -> Token:
+    ) -> TokenRecord:
         """
         This method that returns various parts of the discord bot token, information about the token and validates it.
         It uses regex to match if there is a token like string in string, and then it splits the token into its parts,
-        if a match is found.
+        if a match is found. If a :class:`FingerprintStore` is attached to the parser, valid tokens are tagged as new
+        or seen before, and tokens that were already reported are not validated again if the store skips them.
 
         Parameters:
             raw_data (str): This parameter takes the raw text data as a string that needs to be parsed.
@@ -133,80 +166,240 @@ class TokenParser:
             # Laziness
 
         Returns:
-            (Token): The token object containing all the data extracted from the token.
-        """
-        for match in self.discord_bot_token_regex.finditer(raw_data):
-            data = match.group(1), match.group(2), match.group(3)
-            user_id = self.get_user_id(data[0])
-            timestamp = self.get_timestamp(data[1])
-            hmac = self.validate_hmac_uniqueness(data[2])
-            created_at = self.created_at(timestamp)
-            if user_id and timestamp and hmac and data_parsed_from_type == "text":
-                #  This if statements checks that, if the data was parsed from raw text and not an image,
-                #  and if the token that was found is valid, it reports it as a valid token.
-                # This might look stupid at first, but I am lazy.
-                return Token(
-                    user_id=user_id,
-                    hmac=hmac,
-                    created_at=created_at,
-                    timestamp=timestamp,
-                    token_string=".".join(data),
-                    is_valid=True,
-                    reason="This token is valid, as all components of the token are valid.",
-                    raw_data=raw_data,
-                )
-            if (
-                user_id is None
-                and timestamp
-                and hmac
-                and data_parsed_from_type == "image"
-            ):
-                # This if statement checks that if the token was parsed from an image, and if the token is valid,
-                # it reports it as a valid token.
-                return Token(
-                    user_id=user_id,
-                    hmac=hmac,
-                    created_at=created_at,
-                    timestamp=timestamp,
-                    token_string=".".join(data),
-                    is_valid=True,
-                    reason="This token is invalid, as one or more components of the token are invalid. "
-                    "However, it was parsed from an image, and the OCR will not be 100% accurate, so even if "
-                    "the components are invalid, if a token like string matches, it is valid. "
-                    "Please note that this is not a guarantee that the token is actually valid, and this is a stupid "
-                    "solution.",
-                    raw_data=raw_data,
-                )
-            if user_id and timestamp and hmac and data_parsed_from_type == "image":
-                return Token(
-                    user_id=user_id,
-                    hmac=hmac,
-                    created_at=created_at,
-                    timestamp=timestamp,
-                    token_string=".".join(data),
-                    is_valid=True,
-                    reason="This token is valid, as all components of the token are valid.",
-                    raw_data=raw_data,
-                )
+            (TokenRecord): The token record containing all the data extracted from the token.
+        """
+        return await self.validate_match(
+            self.first_match(raw_data, data_parsed_from_type), raw_data, data_parsed_from_type
+        )
 
-            else:
-                return Token(
-                    user_id=user_id,
-                    hmac=hmac,
-                    created_at=created_at,
-                    timestamp=timestamp,
-                    token_string=".".join(data),
-                    is_valid=False,
-                    reason="This token is invalid, as one or more components of the token are invalid.",
-                    raw_data=raw_data,
-                )
-        else:
-            return Token(
+    def first_match(
+        self, raw_data: str, data_parsed_from_type: str = None
+    ) -> typing.Optional[DetectorMatch]:
+        """
+        This method searches the raw data for the first token like string that validates, so that a decoy, such as a
+        low entropy api key, does not hide a valid token after it. It is the part of :meth:`validate_token` that
+        takes time on large texts, and does not touch the event loop, so it can be run in an executor.
+
+        Parameters:
+            raw_data (str): This parameter takes the raw text data as a string that needs to be searched.
+
+            data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data,
+                                         either "image" or "text", which the validators depend on.
+
+        Returns:
+            (typing.Optional[DetectorMatch]): The first valid match, the first match if none of them is valid, or None
+                                              if there is no token like string in the data.
+        """
+        first = None
+        for match in self.detectors.finditer(raw_data):
+            if self.run_detector(match, None, data_parsed_from_type).is_valid:
+                return match
+            if first is None:
+                first = match
+        return first
+
+    async def validate_match(
+        self,
+        match: typing.Optional[DetectorMatch],
+        raw_data: str,
+        data_parsed_from_type: str = None,
+    ) -> TokenRecord:
+        """
+        This method validates a match found by :meth:`first_match`, and tags it with the :class:`FingerprintStore`
+        attached to the parser, if any.
+
+        Parameters:
+            match (typing.Optional[DetectorMatch]): This parameter takes the match, or None if nothing was found.
+
+            raw_data (str): This parameter takes the raw text data the match was found in.
+
+            data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data.
+
+        Returns:
+            (TokenRecord): The token record containing all the data extracted from the token.
+        """
+        if match is None:
+            return TokenRecord(
                 is_valid=False,
                 reason="No token like string in the extracted text data.",
                 raw_data=raw_data,
             )
 
+        if self.fingerprints is None:
+            return self.run_detector(match, raw_data, data_parsed_from_type)
+
+        token_string = match.text
+        if self.fingerprints.skip_known and await self.fingerprints.contains(
+            token_string
+        ):
+            # The token was already reported, so the validation is skipped entirely.
+            return TokenRecord(
+                token_string=token_string,
+                token_type=match.detector.name,
+                is_valid=True,
+                seen_before=True,
+                reason="This token has already been reported, so it was not validated again.",
+                raw_data=raw_data,
+            )
+
+        token = self.run_detector(match, raw_data, data_parsed_from_type)
+        if token.is_valid:
+            token.seen_before = not await self.fingerprints.add(token_string)
+        return token
+
+    def scan(
+        self, raw_data: str, data_parsed_from_type: str = None, boundary: int = 0
+    ) -> typing.List[TokenRecord]:
+        """
+        This method returns every token like string found in the raw data, instead of only the first one like
+        :meth:`validate_token` does. The raw data is not attached to the returned tokens, as the caller already has it.
+
+        Parameters:
+            raw_data (str): This parameter takes the raw text data as a string that needs to be parsed.
+
+            data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data,
+                                         either "image" or "text".
+
+            boundary (int): This parameter takes an offset into the raw data, only matches that end after this
+                            offset are returned. This is used by incremental scans, where the text before the
+                            boundary has already been scanned.
+
+        Returns:
+            (typing.List[TokenRecord]): A list of token records, one for each match, in the order they were found.
+        """
+        tokens = []
+        for match in self.detectors.finditer(raw_data):
+            if match.end <= boundary:
+                continue
+            tokens.append(self.run_detector(match, None, data_parsed_from_type))
+        return tokens
+
+    async def remember(self, tokens: typing.Iterable[TokenRecord]) -> None:
+        """
+        |coroutine|
+        This method records the valid tokens found by :meth:`scan` in the :class:`FingerprintStore` attached to the
+        parser, if any, and tags them with `seen_before` like :meth:`validate_match` does.
+
+        Parameters:
+            tokens (typing.Iterable[TokenRecord]): This parameter takes the token records to record.
+        """
+        if self.fingerprints is None:
+            return
+        for token in tokens:
+            if token.is_valid:
+                token.seen_before = not await self.fingerprints.add(token.token_string)
+
+    @staticmethod
+    def run_detector(
+        match: DetectorMatch,
+        raw_data: typing.Optional[str],
+        data_parsed_from_type: str = None,
+    ) -> TokenRecord:
+        """
+        This method validates a match with the validator of the detector it belongs to.
+
+        Parameters:
+            match (DetectorMatch): This parameter takes the match of the detector.
+
+            raw_data (typing.Optional[str]): This parameter takes the raw text data the match was found in.
+
+            data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data,
+                                         either "image" or "text".
+
+        Returns:
+            (TokenRecord): The token record containing all the data extracted from the match.
+        """
+        token = match.detector.validator(match.groups, raw_data, data_parsed_from_type)
+        token.token_type = match.detector.name
+        return token
+
+    @property
+    def max_token_length(self) -> int:
+        """
+        This property returns the length of the longest string any of the detectors can match.
+        """
+        return self.detectors.max_length
+
+    def build_token(
+        self,
+        data: typing.Tuple[str, str, str],
+        raw_data: typing.Optional[str],
+        data_parsed_from_type: str = None,
+    ) -> TokenRecord:
+        """
+        This method validates the components of a single token like string matched by the regex, and returns a
+        :class:`TokenRecord` object containing all the data extracted from it.
+
+        Parameters:
+            data (typing.Tuple[str, str, str]): This parameter takes the user ID, timestamp and hmac components
+                                                of the matched token like string.
+
+            raw_data (typing.Optional[str]): This parameter takes the raw text data the token was found in.
+
+            data_parsed_from_type (str): This parameter takes the type of data that is parsed from the raw data,
+                                         either "image" or "text".
+
+        Returns:
+            (TokenRecord): The token record containing all the data extracted from the token.
+        """
+        user_id = self.get_user_id(data[0])
+        timestamp = self.get_timestamp(data[1])
+        hmac = self.validate_hmac_uniqueness(data[2])
+        created_at = self.created_at(timestamp)
+        if user_id and timestamp and hmac and data_parsed_from_type == "text":
+            #  This if statements checks that, if the data was parsed from raw text and not an image,
+            #  and if the token that was found is valid, it reports it as a valid token.
+            # This might look stupid at first, but I am lazy.
+            return TokenRecord(
+                user_id=user_id,
+                hmac=hmac,
+                created_at=created_at,
+                timestamp=timestamp,
+                token_string=".".join(data),
+                is_valid=True,
+                reason="This token is valid, as all components of the token are valid.",
+                raw_data=raw_data,
+            )
+        if user_id is None and timestamp and hmac and data_parsed_from_type == "image":
+            # This if statement checks that if the token was parsed from an image, and if the token is valid,
+            # it reports it as a valid token.
+            return TokenRecord(
+                user_id=user_id,
+                hmac=hmac,
+                created_at=created_at,
+                timestamp=timestamp,
+                token_string=".".join(data),
+                is_valid=True,
+                reason="This token is invalid, as one or more components of the token are invalid. "
+                "However, it was parsed from an image, and the OCR will not be 100% accurate, so even if "
+                "the components are invalid, if a token like string matches, it is valid. "
+                "Please note that this is not a guarantee that the token is actually valid, and this is a stupid "
+                "solution.",
+                raw_data=raw_data,
+            )
+        if user_id and timestamp and hmac and data_parsed_from_type == "image":
+            return TokenRecord(
+                user_id=user_id,
+                hmac=hmac,
+                created_at=created_at,
+                timestamp=timestamp,
+                token_string=".".join(data),
+                is_valid=True,
+                reason="This token is valid, as all components of the token are valid.",
+                raw_data=raw_data,
+            )
+
+        return TokenRecord(
+            user_id=user_id,
+            hmac=hmac,
+            created_at=created_at,
+            timestamp=timestamp,
+            token_string=".".join(data),
+            is_valid=False,
+            reason="This token is invalid, as one or more components of the token are invalid.",
+            raw_data=raw_data,
+        )
+
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.token_string}>"
 
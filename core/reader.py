@@ -3,11 +3,11 @@ from io import BytesIO
 
 import numpy as np
 import PIL.ImageEnhance
-from loguru import logger
 from PIL import ImageFilter, ImageOps
 from PIL.Image import Image
 
 from utils.exceptions import InvalidImage
+from utils.logs import log_event
 
 __all__ = ("CleanImage",)
 
@@ -17,17 +17,242 @@ class CleanImage:
     A class that cleans an image by removing noise, grayscaling and sharpening it.
     """
 
+    # The longest side of the thumbnail :meth:`classify` measures, in pixels.
+    THUMBNAIL_SIZE = 256
+    # The angles :meth:`estimate_skew` tries, in degrees, the best one is then refined in quarter degrees.
+    SKEW_ANGLES = tuple(range(-10, 11))
+
     def __init__(self):
         self.image_binary = BytesIO
 
+    # The preprocessing variants :meth:`clean` can run, which OCR profiles select by name.
+    PREPROCESSING = ("default", "grayscale", "binarize", "upscale", "screenshot", "photo", "auto")
+    # The pipelines the "auto" variant routes images to.
+    ROUTES = ("screenshot", "photo")
+
+    @staticmethod
+    def preprocess(image: Image, preprocessing: str = "default") -> Image:
+        """
+        This method runs a preprocessing variant on a grayscale image.
+
+        - "default" sharpens the image, reduces it to 16 shades of gray and smooths it.
+        - "grayscale" leaves the image as it is, and lets Tesseract do its own thresholding.
+        - "binarize" stretches the contrast of the image, and turns every pixel black or white.
+        - "upscale" doubles the size of the image before the default variant, which helps with small text.
+        - "screenshot" only turns light text on a dark background into dark text on a light one, and stretches the
+          contrast, which is all a clean screenshot needs.
+        - "photo" restores a photo of a screen: it removes noise, straightens the text and turns every pixel black or
+          white by comparing it with its neighbourhood, so that uneven lighting does not wash out parts of the text.
+
+        The "auto" variant picks one of the last two with :meth:`classify`, and is run by :meth:`clean_and_route`.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the grayscale image.
+
+            preprocessing (str): This parameter takes the name of the variant.
+
+        Returns:
+            (PIL.Image): The preprocessed image.
+
+        Raises:
+            (ValueError): If there is no variant with that name.
+        """
+        if preprocessing == "grayscale":
+            return image
+        if preprocessing == "binarize":
+            return ImageOps.autocontrast(image).point(lambda value: 255 if value > 127 else 0)
+        if preprocessing == "screenshot":
+            return ImageOps.autocontrast(CleanImage.light_background(image))
+        if preprocessing == "photo":
+            return CleanImage.restore(image)
+        if preprocessing == "upscale":
+            image = image.resize((image.width * 2, image.height * 2), PIL.Image.LANCZOS)
+        elif preprocessing != "default":
+            raise ValueError(f"Unknown preprocessing variant: {preprocessing}")
+
+        image = (
+            ImageOps.grayscale(image)
+            .filter(ImageFilter.UnsharpMask)
+            .filter(ImageFilter.DETAIL)
+        )
+        return (
+            ImageOps.posterize(image, 4)
+            .filter(ImageFilter.SMOOTH)
+            .filter(ImageFilter.SHARPEN)
+        )
+
+    @staticmethod
+    def thumbnail(image: Image) -> np.ndarray:
+        """
+        This method returns a small grayscale copy of an image as an array. Pixels are picked, not averaged, so the
+        thumbnail keeps the exact shades and the hard edges of the image.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the image.
+
+        Returns:
+            (numpy.ndarray): The thumbnail, as a 2D array of 8 bit shades of gray.
+        """
+        scale = min(1.0, CleanImage.THUMBNAIL_SIZE / max(image.width, image.height, 1))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return np.asarray(image.resize(size, PIL.Image.NEAREST).convert("L"), dtype=np.int16)
+
+    @staticmethod
+    def features(image: Image) -> typing.Dict[str, float]:
+        """
+        This method measures the histogram and the edges of a thumbnail of an image.
+
+        - "dominant_share" is the share of pixels in the 8 most common shades. Screenshots are made of flat areas
+          and a few text colors, so most of their pixels share a handful of shades, when photos spread them out.
+        - "sharp_edge_share" is the share of the edges that are sharp. Text rendered on a screen changes shade from
+          one pixel to the next, when the edges of a photo are blurred and its noise makes many faint ones.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the image.
+
+        Returns:
+            (typing.Dict[str, float]): The features, by name.
+        """
+        pixels = CleanImage.thumbnail(image)
+        histogram = np.bincount(pixels.ravel(), minlength=256)
+        dominant_share = float(np.sort(histogram)[-8:].sum() / max(pixels.size, 1))
+        gradients = np.concatenate(
+            (np.abs(np.diff(pixels, axis=0)).ravel(), np.abs(np.diff(pixels, axis=1)).ravel())
+        )
+        edges = int(np.count_nonzero(gradients > 8))
+        sharp_edge_share = float(np.count_nonzero(gradients > 64) / edges) if edges else 1.0
+        return {"dominant_share": round(dominant_share, 3), "sharp_edge_share": round(sharp_edge_share, 3)}
+
+    @staticmethod
+    def classify(image: Image) -> str:
+        """
+        This method tells a screenshot from a photo of a screen, from the :meth:`features` of its thumbnail, which
+        takes a couple of milliseconds whatever the size of the image. Screenshots that were scaled down, blurred
+        or compressed hard enough to lose their flat colors and sharp edges are sent to the photo pipeline, which
+        costs more but reads them better.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the image.
+
+        Returns:
+            (str): "screenshot" or "photo", the name of the preprocessing variant the image should run.
+        """
+        features = CleanImage.features(image)
+        if features["dominant_share"] >= 0.5 and features["sharp_edge_share"] >= 0.3:
+            return "screenshot"
+        return "photo"
+
+    @staticmethod
+    def light_background(image: Image) -> Image:
+        """
+        This method inverts a grayscale image whose background is dark, as Tesseract OCR engine reads dark text on a
+        light background best. The background is taken to be the most common shade of the image.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the grayscale image.
+
+        Returns:
+            (PIL.Image): The image, with a light background.
+        """
+        histogram = image.histogram()
+        if histogram.index(max(histogram)) < 128:
+            return ImageOps.invert(image)
+        return image
+
+    @staticmethod
+    def estimate_skew(image: Image) -> float:
+        """
+        This method estimates the angle the lines of text of an image are tilted by, as the angle that straightens
+        them the most: rows of a straight text are either full of ink or empty, so the ink per row varies the most.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the grayscale image, with a light background.
+
+        Returns:
+            (float): The angle to rotate the image by, in degrees counterclockwise.
+        """
+        scale = min(1.0, 2 * CleanImage.THUMBNAIL_SIZE / max(image.width, image.height, 1))
+        small = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+        ink = ImageOps.invert(ImageOps.autocontrast(small))
+
+        def spread(angle: float) -> float:
+            rows = np.asarray(ink.rotate(angle, resample=PIL.Image.BILINEAR), dtype=np.float32).sum(axis=1)
+            return float(np.square(np.diff(rows)).sum())
+
+        best = max(CleanImage.SKEW_ANGLES, key=spread)
+        return max((best + step / 4 for step in range(-3, 4)), key=spread)
+
+    @staticmethod
+    def restore(image: Image) -> Image:
+        """
+        This method runs the photo pipeline on a grayscale image: it removes the noise, gives it a light background,
+        straightens its text and binarizes it with a threshold that follows the lighting of the image.
+
+        Parameters:
+            image (PIL.Image): This parameter takes the grayscale image.
+
+        Returns:
+            (PIL.Image): The restored image, with black text on a white background.
+        """
+        image = ImageOps.autocontrast(CleanImage.light_background(image.filter(ImageFilter.MedianFilter(3))), cutoff=1)
+        angle = CleanImage.estimate_skew(image)
+        if abs(angle) >= 0.5:
+            image = image.rotate(angle, resample=PIL.Image.BICUBIC, expand=True, fillcolor=255)
+
+        # A pixel is ink when it is darker than the average of its neighbourhood, which is about as large as a line
+        # of text, so a shadow over part of the screen moves the threshold with it.
+        radius = max(8, min(image.width, image.height) // 30)
+        local_mean = np.asarray(image.filter(ImageFilter.BoxBlur(radius)), dtype=np.int16)
+        pixels = np.asarray(image, dtype=np.int16)
+        return PIL.Image.fromarray(np.where(pixels < local_mean - 10, 0, 255).astype(np.uint8))
+
     @staticmethod
-    def clean(image: BytesIO) -> typing.Optional[BytesIO]:
+    def clean_and_route(image: BytesIO, preprocessing: str = "default") -> typing.Tuple[BytesIO, str]:
+        """
+        This method cleans an image like :meth:`clean`, and tells which preprocessing variant ran. The "auto"
+        variant sends the image to the screenshot or to the photo pipeline, as :meth:`classify` decides.
+
+        Parameters:
+            image (BytesIO): This parameter takes an image as a BytesIO object, that needs to be cleaned.
+
+            preprocessing (str): This parameter takes the name of the preprocessing variant to run, see
+                                 :meth:`preprocess`.
+
+        Returns:
+            (typing.Tuple[BytesIO, str]): The cleaned image, and the name of the variant that ran, which is the
+                                          route :meth:`classify` picked for the "auto" variant.
+
+        Raises:
+            (InvalidImage): If the image is not in the BytesIO or the image has failed to be converted to a PIL
+                        image object.
+        """
+        if not isinstance(image, BytesIO):
+            raise InvalidImage("The image must be a BytesIO object.")
+        try:
+            image = PIL.Image.open(image)
+            image.load()
+        except Exception as e:
+            log_event("invalid_image", "WARNING", "Image could not be opened: {error}", error=str(e))
+            raise InvalidImage("The image could not be converted to a PIL image.")
+
+        image = image.convert("L")
+        route = CleanImage.classify(image) if preprocessing == "auto" else preprocessing
+        image_binary = BytesIO()
+        CleanImage.preprocess(image, route).save(image_binary, format="PNG")
+        image_binary.seek(0)
+        return image_binary, route
+
+    @staticmethod
+    def clean(image: BytesIO, preprocessing: str = "default") -> typing.Optional[BytesIO]:
         """
         This method takes an image and returns a cleaned version of it by removing noise and smoothing it.
 
         Parameters:
             image (BytesIO): This parameter takes an image as a BytesIO object, that needs to be cleaned.
 
+            preprocessing (str): This parameter takes the name of the preprocessing variant to run, see
+                                 :meth:`preprocess`.
+
         Returns:
             (typing.Optional[BytesIO]): The cleaned image as a BytesIO object, or None if the image could not be
                                         cleaned or if the image is None.
@@ -36,32 +261,7 @@ class CleanImage:
             (InvalidImage): If the image is not in the BytesIO or the image has failed to be converted to a PIL
                         image object.
         """
-        image_binary = BytesIO()
-
-        if isinstance(image, BytesIO):
-            try:
-                image = PIL.Image.open(image).convert("L")
-            except Exception as e:
-                logger.error(e)
-                raise InvalidImage("The image could not be converted to a PIL image.")
-
-            image = (
-                ImageOps.grayscale(image)
-                .filter(ImageFilter.UnsharpMask)
-                .filter(ImageFilter.DETAIL)
-            )
-            image = (
-                ImageOps.posterize(image, 4)
-                .filter(ImageFilter.SMOOTH)
-                .filter(ImageFilter.SHARPEN)
-            )
-            image.save(image_binary, format="PNG")
-            image_binary.seek(0)
-
-            return image_binary
-
-        else:
-            raise InvalidImage("The image must be a BytesIO object.")
+        return CleanImage.clean_and_route(image, preprocessing)[0]
 
     @staticmethod
     def to_numpy_array(image: BytesIO) -> np.ndarray:
@@ -83,7 +283,7 @@ class CleanImage:
         try:
             pil_image = PIL.Image.open(image)
         except Exception as e:
-            logger.error(e)
+            log_event("invalid_image", "WARNING", "Image could not be opened: {error}", error=str(e))
             raise InvalidImage("The image could not be converted to a PIL image.")
         pil_image.save(image_binary, format="PNG")
         image_binary.seek(0)
@@ -109,7 +309,7 @@ class CleanImage:
             image = PIL.Image.open(image_as_bytes)
             return image
         except Exception as e:
-            logger.error(e)
+            log_event("invalid_image", "WARNING", "Image could not be opened: {error}", error=str(e))
             raise InvalidImage("The image could not be converted to a PIL image.")
 
     def __repr__(self):
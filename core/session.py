@@ -0,0 +1,163 @@
+import time
+import typing
+import uuid
+from collections import OrderedDict
+
+from core.parser import TokenParser
+from utils.models import TokenRecord
+
+__all__ = (
+    "ScanSession",
+    "ScanSessionStore",
+)
+
+
+class ScanSession:
+    """
+    A class that represents an incremental scan session. Text is appended to the session in deltas, and only the
+    new text, plus a small overlap with the previously scanned text, is scanned for tokens each time.
+    """
+
+    def __init__(self, session_id: str, parser: TokenParser):
+        self.session_id = session_id
+        self.parser = parser
+        self.overlap = parser.max_token_length - 1
+        self.tail = str()
+        self.tokens: typing.Dict[str, TokenRecord] = {}
+        self.scanned_characters = 0
+        self.last_access = time.monotonic()
+
+    def feed(self, delta: str) -> typing.List[TokenRecord]:
+        """
+        This method scans a text delta that was appended to the session, together with the unscanned tail of the
+        previous deltas, so that tokens split across two deltas are still found.
+
+        Parameters:
+            delta (str): This parameter takes the text that was appended to the session.
+
+        Returns:
+            (typing.List[TokenRecord]): The tokens that were found for the first time in this session.
+        """
+        window = self.tail + delta
+        new_tokens = []
+        for token in self.parser.scan(
+            window, data_parsed_from_type="text", boundary=len(self.tail)
+        ):
+            if token.token_string in self.tokens:
+                continue
+            self.tokens[token.token_string] = token
+            new_tokens.append(token)
+
+        self.tail = window[-self.overlap :]
+        self.scanned_characters += len(delta)
+        self.last_access = time.monotonic()
+        return new_tokens
+
+    def jsonify(
+        self, ttl: float, new_tokens: typing.Optional[typing.List[TokenRecord]] = None
+    ) -> dict:
+        """
+        This method converts the session into a regular python dictionary object.
+
+        Parameters:
+            ttl (float): This parameter takes the time to live of the session in seconds.
+
+            new_tokens (typing.Optional[typing.List[TokenRecord]]): This parameter takes the tokens found by the last
+                                                              :meth:`feed` call.
+
+        Returns:
+            (dict): The dictionary representation of the session.
+        """
+        return {
+            "session_id": self.session_id,
+            "new_tokens": [token.jsonify() for token in new_tokens or []],
+            "tokens": [token.jsonify() for token in self.tokens.values()],
+            "scanned_characters": self.scanned_characters,
+            "expires_in": max(0.0, self.last_access + ttl - time.monotonic()),
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.session_id} tokens={len(self.tokens)}>"
+
+
+class ScanSessionStore:
+    """
+    A class that stores incremental scan sessions in memory, and evicts them after they have been inactive for
+    longer than their time to live.
+    """
+
+    def __init__(self, parser: TokenParser, ttl: float, max_sessions: int):
+        self.parser = parser
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ScanSession]" = OrderedDict()
+
+    def evict_expired(self) -> int:
+        """
+        This method removes every session that has been inactive for longer than the time to live. Sessions are
+        kept in the order of their last access, so only the expired sessions at the front are looked at.
+
+        Returns:
+            (int): The number of sessions that were evicted.
+        """
+        now = time.monotonic()
+        evicted = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_access + self.ttl > now:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def create(self) -> ScanSession:
+        """
+        This method creates a new session, evicting the least recently used session if the store is full.
+
+        Returns:
+            (ScanSession): The new session.
+        """
+        self.evict_expired()
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+
+        session = ScanSession(uuid.uuid4().hex, self.parser)
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> typing.Optional[ScanSession]:
+        """
+        This method returns the session with the given ID and marks it as recently used.
+
+        Parameters:
+            session_id (str): This parameter takes the ID of the session.
+
+        Returns:
+            (typing.Optional[ScanSession]): The session, or None if it does not exist or has expired.
+        """
+        self.evict_expired()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def remove(self, session_id: str) -> typing.Optional[ScanSession]:
+        """
+        This method removes the session with the given ID from the store.
+
+        Parameters:
+            session_id (str): This parameter takes the ID of the session.
+
+        Returns:
+            (typing.Optional[ScanSession]): The removed session, or None if it does not exist.
+        """
+        self.evict_expired()
+        return self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} sessions={len(self._sessions)} ttl={self.ttl}>"
@@ -0,0 +1,102 @@
+import argparse
+import itertools
+import sys
+
+from loguru import logger
+
+from core.batch import BatchScanner, read_file_list
+from core.ocr import OCRProfile
+from utils.helpers import Config
+from utils.logs import setup_logging
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Scan files and directories for tokens offline, without running the API. "
+        "Images are read with Tesseract OCR engine, every other file is scanned as text."
+    )
+    parser.add_argument(
+        "paths", nargs="*", help="Files and directories to scan, directories are walked recursively."
+    )
+    parser.add_argument(
+        "-f",
+        "--files-from",
+        help='A file listing the paths to scan, one per line. Use "-" to read the list from stdin.',
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help='The file the results are appended to as JSON lines. Defaults to "-", which is stdout.',
+    )
+    parser.add_argument(
+        "-c",
+        "--checkpoint",
+        help="A file that records every scanned path. Running again with the same checkpoint resumes an "
+        "interrupted run. Defaults to the output file with a .checkpoint suffix, if the output is a file.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        default=None,
+        help="The OCR profile of config.yml images are read with. Defaults to the profile the API uses.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between throughput reports. Defaults to 10.",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        help="The lowest level that is logged. Rejected token candidates are logged at DEBUG. Defaults to INFO.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    setup_logging(level=arguments.log_level.upper(), sample_rate=10, sample_burst=50)
+    if not arguments.paths and not arguments.files_from:
+        logger.error("No paths to scan, pass paths or a file list with --files-from.")
+        sys.exit(2)
+
+    sources = iter(arguments.paths)
+    if arguments.files_from:
+        sources = itertools.chain(sources, read_file_list(arguments.files_from))
+
+    checkpoint = arguments.checkpoint
+    if checkpoint is None and arguments.output != "-":
+        checkpoint = f"{arguments.output}.checkpoint"
+
+    config = Config()
+    profile_name = arguments.profile or config.ocr_profile
+    if profile_name not in config.ocr_profiles:
+        logger.error(f"OCR profile {profile_name} is not defined in config.yml.")
+        sys.exit(2)
+    profile = OCRProfile(name=profile_name, **config.ocr_profiles[profile_name])
+
+    output = sys.stdout if arguments.output == "-" else open(arguments.output, "a", encoding="utf-8")
+    scanner = BatchScanner(
+        output=output,
+        checkpoint_path=checkpoint,
+        workers=arguments.workers,
+        progress_interval=arguments.progress_interval,
+        profile=profile,
+    )
+    try:
+        scanner.run(sources)
+    except KeyboardInterrupt:
+        logger.info("[*] User interrupted the scan. Run again with the same checkpoint to resume.")
+        sys.exit(130)
+    finally:
+        if output is not sys.stdout:
+            output.close()
@@ -1,16 +1,38 @@
+import asyncio
+import hmac
+import ipaddress
+import math
+import typing
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 
 import aiohttp
 import fastapi
-import pytesseract
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from loguru import logger
+from starlette.formparsers import MultiPartParser
+from starlette.requests import HTTPConnection
 
+from core.fingerprint import FingerprintStore
+from core.jobs import JobQueue, LocalJobQueue, OCRWorker, RedisJobQueue
+from core.ocr import OCRProfile, clean_image, clean_image_data, ocr_image
 from core.parser import TokenParser
 from core.reader import CleanImage
-from utils.exceptions import InvalidImage
+from core.session import ScanSessionStore
+from utils.assets import AssetCache
+from utils.concurrency import AdaptiveLimiter
+from utils.deadline import Deadline
+from utils.exceptions import DownloadFailed, HostUnavailable, InvalidImage
+from utils.fetcher import ImageFetcher
 from utils.helpers import Config, executor_function
+from utils.lanes import ExecutionLane, register_lane
+from utils.logs import log_event
+from utils.models import TokenRecord
+from utils.pool import RecyclingPool
+from utils.profiling import AllocationTracker, ProfileStore, SamplingProfiler
+from utils.quotas import QuotaManager, record_usage
 
 __all__ = ("DetectionAPI",)
 
@@ -21,9 +43,99 @@ class DetectionAPI(FastAPI):
     """
     def __init__(self):
         self.cleaner = CleanImage()
-        self.parser = TokenParser()
         self.config = Config()
         self.logger = logger
+        self.fingerprints = FingerprintStore(
+            salt=self.config.fingerprint_salt,
+            capacity=self.config.fingerprint_capacity,
+            error_rate=self.config.fingerprint_error_rate,
+            exact_capacity=self.config.fingerprint_exact_capacity,
+            skip_known=self.config.fingerprint_skip_known,
+        )
+        self.parser = TokenParser(fingerprints=self.fingerprints)
+        self.ocr_profile = OCRProfile(
+            name=self.config.ocr_profile, **self.config.ocr_profiles[self.config.ocr_profile]
+        )
+        self.ocr_limiter = AdaptiveLimiter(
+            name="ocr",
+            initial_limit=self.config.concurrency_initial_limit,
+            min_limit=self.config.concurrency_min_limit,
+            max_limit=self.config.concurrency_max_limit,
+            target_latency=self.config.concurrency_target_latency,
+            queue_timeout=self.config.concurrency_queue_timeout,
+            max_queue=self.config.concurrency_max_queue,
+        )
+        # Images and texts run in separate lanes, so that texts never wait behind images that are being read.
+        self.ocr_lane = register_lane(
+            ExecutionLane(
+                name="ocr",
+                max_workers=self.config.lane_ocr_workers,
+                max_queue=self.config.lane_ocr_max_queue,
+            )
+        )
+        self.text_lane = register_lane(
+            ExecutionLane(
+                name="text",
+                max_workers=self.config.lane_text_workers,
+                max_queue=self.config.lane_text_max_queue,
+            )
+        )
+        # Images are decoded in processes that are replaced as they grow, as the heap decoding fragments is only
+        # given back when the process that decoded the images exits.
+        self.pool: typing.Optional[RecyclingPool] = None
+        if self.config.recycling_enabled:
+            self.pool = RecyclingPool(
+                name="ocr",
+                processes=self.config.recycling_processes,
+                max_queue=self.config.lane_ocr_max_queue,
+                max_jobs=self.config.recycling_max_jobs,
+                max_rss=self.config.recycling_max_rss,
+            )
+        # Images are read inline in the OCR lane, or handed to OCR workers through a queue, see create_job_queue.
+        self.jobs: typing.Optional[JobQueue] = None
+        self.local_worker: typing.Optional[OCRWorker] = None
+        self._worker_stop: typing.Optional[asyncio.Event] = None
+        self._worker_task: typing.Optional[asyncio.Future] = None
+        self.create_job_queue()
+        # The number of images cleaned with every preprocessing variant, see record_route.
+        self.preprocessing_routes: typing.Counter[str] = Counter()
+        self.trusted_proxies = self.config.quota_trusted_proxies
+        self.quotas: typing.Optional[QuotaManager] = None
+        if self.config.quotas_enabled:
+            self.quotas = QuotaManager(
+                capacity=self.config.quota_capacity,
+                refill_rate=self.config.quota_refill_rate,
+                megapixel_cost=self.config.quota_megapixel_cost,
+                cpu_second_cost=self.config.quota_cpu_second_cost,
+                megabyte_cost=self.config.quota_megabyte_cost,
+                cpu_per_megapixel=self.config.quota_cpu_per_megapixel,
+                max_requests=self.config.quota_max_requests,
+                request_rate=self.config.quota_request_rate,
+                max_tenants=self.config.quota_max_tenants,
+            )
+        self.fetcher = ImageFetcher(
+            negative_ttl=self.config.download_negative_ttl,
+            negative_max_entries=self.config.download_negative_max_entries,
+            failure_threshold=self.config.download_failure_threshold,
+            reset_timeout=self.config.download_reset_timeout,
+            connect_timeout=self.config.download_connect_timeout,
+            read_timeout=self.config.download_read_timeout,
+            max_size=self.config.max_upload_size,
+        )
+        self.assets = AssetCache(
+            directory=self.config.assets_directory,
+            check_interval=self.config.asset_check_interval,
+            max_file_size=self.config.asset_max_file_size,
+            min_compress_size=self.config.asset_min_compress_size,
+        )
+        self.sampler = SamplingProfiler(interval=self.config.profiling_sample_interval)
+        self.profiles = ProfileStore(max_profiles=self.config.profiling_max_profiles)
+        self.allocations = AllocationTracker()
+        self.sessions = ScanSessionStore(
+            parser=self.parser,
+            ttl=self.config.session_ttl,
+            max_sessions=self.config.session_limit,
+        )
 
         super().__init__(
             title="Token Detection API",
@@ -33,70 +145,633 @@ class DetectionAPI(FastAPI):
             debug=self.config.fastapi_debug_mode,
         )
 
-    @executor_function
-    def read_image(self, data: BytesIO) -> str:
+    def create_deadline(
+        self, request: typing.Optional[Request] = None, timeout: typing.Optional[typing.Any] = None
+    ) -> Deadline:
+        """
+        This method creates the deadline of a request. Clients can ask for a budget other than the default with the
+        `X-Request-Timeout` header, in seconds, shorter or longer, but never longer than the maximum in config.yml.
+
+        Parameters:
+            request (typing.Optional[Request]): This parameter takes the request, if any. The client of the request
+                                                is watched for a disconnect while the request is processed.
+
+            timeout (typing.Optional[typing.Any]): This parameter takes the budget the client asked for some other
+                                                   way, such as in a stream frame, if any.
+
+        Returns:
+            (Deadline): The deadline of the request.
+
+        Raises:
+            (HTTPException): If the budget the client asked for is not a positive number of seconds.
+        """
+        if timeout is None and request is not None:
+            timeout = request.headers.get("x-request-timeout")
+        if timeout is None:
+            timeout = self.config.request_timeout
+        else:
+            try:
+                timeout = float(timeout)
+            except (TypeError, ValueError):
+                timeout = math.nan
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise fastapi.exceptions.HTTPException(
+                    status_code=400, detail="The request timeout must be a positive number of seconds."
+                )
+        return Deadline(timeout=min(timeout, self.config.max_request_timeout), request=request)
+
+    def is_trusted_proxy(self, address: str) -> bool:
+        """
+        This method checks if an address belongs to one of the reverse proxies in config.yml.
+
+        Parameters:
+            address (str): This parameter takes the IP address.
+
+        Returns:
+            (bool): True if the address is a trusted proxy, False otherwise.
+        """
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def tenant(self, connection: HTTPConnection) -> str:
+        """
+        This method returns the client a request or websocket connection is charged to, which is its IP address.
+        The `X-Forwarded-For` header is only used if the connection comes from a trusted proxy, as any client can
+        send it, and the client is then the last address in it that is not a trusted proxy itself.
+
+        Parameters:
+            connection (HTTPConnection): This parameter takes the request or the websocket connection.
+
+        Returns:
+            (str): The client.
+        """
+        host = connection.client.host if connection.client is not None else "unknown"
+        forwarded = connection.headers.get("x-forwarded-for")
+        if not forwarded or not self.is_trusted_proxy(host):
+            return host
+        addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+        for address in reversed(addresses):
+            if not self.is_trusted_proxy(address):
+                return address
+        return addresses[0] if addresses else host
+
+    def create_job_queue(self) -> None:
+        """
+        This method creates the queue images are handed to OCR workers through, for the queue backend in config.yml.
+        The "local" backend also creates a worker that runs in the API process, it is started along with the server.
+        The Redis client of the "redis" backend is attached when the server starts, the workers are started
+        separately with worker.py.
+        """
+        backend = self.config.queue_backend
+        if backend == "local":
+            self.jobs = LocalJobQueue(max_length=self.config.queue_max_length)
+            self.local_worker = OCRWorker(
+                queue=self.jobs,
+                profile=self.ocr_profile,
+                concurrency=self.config.queue_worker_concurrency,
+                consumer="local",
+                pool=self.pool,
+            )
+        elif backend == "redis":
+            self.jobs = RedisJobQueue(
+                stream=self.config.queue_stream,
+                group=self.config.queue_group,
+                max_length=self.config.queue_max_length,
+                result_ttl=self.config.queue_result_ttl,
+                claim_idle=self.config.queue_claim_idle,
+            )
+
+    def start_local_worker(self) -> None:
+        """
+        This method starts the OCR worker of the "local" queue backend on the event loop of the server, if there is
+        one.
+        """
+        if self.local_worker is None or self._worker_task is not None:
+            return
+        self._worker_stop = asyncio.Event()
+        self._worker_task = asyncio.ensure_future(self.local_worker.run(self._worker_stop))
+
+    async def stop_local_worker(self) -> None:
+        """
+        |coroutine|
+        This method stops the OCR worker of the "local" queue backend, and waits for the images it is reading.
+        """
+        if self._worker_task is None:
+            return
+        self._worker_stop.set()
+        await self._worker_task
+        self._worker_task = None
+
+    @executor_function(lane="ocr")
+    def clean_image(self, data: BytesIO, deadline: Deadline) -> typing.Tuple[BytesIO, str]:
+        """
+        An executor function that cleans an image so that Tesseract OCR engine can read it more accurately, with the
+        preprocessing variant of the OCR profile selected in config.yml.
+
+        Parameters:
+            data (BytesIO): The parameter takes an image as a BytesIO object, that needs to be cleaned.
+
+            deadline (Deadline): This parameter takes the deadline of the request.
+
+        Returns:
+            (typing.Tuple[BytesIO, str]): The cleaned image, and the preprocessing variant it was cleaned with.
+        """
+        try:
+            return clean_image(data, deadline=deadline, preprocessing=self.ocr_profile.preprocessing)
+        except InvalidImage:
+            log_event("invalid_image", "WARNING", "Image could not be opened as it is not a valid url.")
+            raise fastapi.exceptions.HTTPException(
+                status_code=500,
+                detail="Image could not be opened due to url being invalid.",
+            )
+
+    async def clean(self, data: BytesIO, deadline: Deadline) -> typing.Tuple[BytesIO, str]:
+        """
+        |coroutine|
+        This method cleans an image in a process of :attr:`pool`, or in the OCR lane if recycling is disabled.
+
+        Parameters:
+            data (BytesIO): The parameter takes an image as a BytesIO object, that needs to be cleaned.
+
+            deadline (Deadline): This parameter takes the deadline of the request.
+
+        Returns:
+            (typing.Tuple[BytesIO, str]): The cleaned image, and the preprocessing variant it was cleaned with.
+
+        Raises:
+            (HTTPException): If the image could not be opened, or if the process cleaning it crashed.
+        """
+        if self.pool is None:
+            return await self.clean_image(data, deadline=deadline)
+        deadline.raise_if_expired("clean")
+        try:
+            cleaned, route = await self.pool.run(clean_image_data, data.getvalue(), self.ocr_profile.preprocessing)
+        except InvalidImage:
+            log_event("invalid_image", "WARNING", "Image could not be opened as it is not a valid url.")
+            raise fastapi.exceptions.HTTPException(
+                status_code=500,
+                detail="Image could not be opened due to url being invalid.",
+            )
+        except BrokenProcessPool:
+            # The process died while it cleaned the image, and the pool already replaced it.
+            raise fastapi.exceptions.HTTPException(
+                status_code=503,
+                detail="The process cleaning the image crashed, try again.",
+                headers={"Retry-After": "1"},
+            )
+        return BytesIO(cleaned), route
+
+    def record_route(self, route: typing.Optional[str]) -> None:
         """
-        An executor function that reads an image and returns the text found in the image.
+        This method counts the preprocessing variant an image was cleaned with, which is the pipeline the "auto"
+        variant routed it to, for :meth:`status`.
+
+        Parameters:
+            route (typing.Optional[str]): This parameter takes the name of the variant, or None if it is unknown.
+        """
+        if route is None:
+            return
+        self.preprocessing_routes[route] += 1
+        log_event("image_routed", "DEBUG", "Image was cleaned with the {route} preprocessing.", route=route)
+
+    @executor_function(lane="ocr")
+    def ocr_image(self, image: BytesIO, deadline: Deadline) -> str:
+        """
+        An executor function that returns the text Tesseract OCR engine reads from a cleaned image, with the OCR
+        profile selected in config.yml.
+
+        Parameters:
+            image (BytesIO): The parameter takes the cleaned image as a BytesIO object.
+
+            deadline (Deadline): This parameter takes the deadline of the request.
+
+        Returns:
+            (str): The text found in the image.
+        """
+        return ocr_image(image, deadline=deadline, profile=self.ocr_profile)
+
+    async def read_image(self, data: BytesIO, deadline: typing.Optional[Deadline] = None) -> str:
+        """
+        |coroutine|
+        This method reads an image and returns the text found in the image. Cleaning the image and reading it are
+        separate stages, the deadline is checked before each of them, and each of them is abandoned if the deadline
+        passes or the client disconnects while it runs. Both stages run in a slot of :attr:`ocr_limiter`, so only as
+        many images as the server can handle are read at once, and the rest wait briefly or are shed. If a queue
+        backend is configured, both stages run on an OCR worker instead, with the time left of the deadline, and no
+        slot is taken, as the length of the queue already bounds the images in flight. The client of the request is
+        charged for the image before it is decoded, if quotas are enabled.
 
         Parameters:
             data (BytesIO): The parameter takes an image as a BytesIO object, that needs to be read.
 
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request. If it is not
+                                                  given, the default deadline from config.yml is used.
+
         Returns:
             (str): The text found in the image.
+
+        Raises:
+            (JobFailed): If an OCR worker failed to read the image.
+            (QuotaExceeded): If the budget of the client does not cover the image.
         """
+        deadline = deadline or self.create_deadline()
+        if self.quotas is not None:
+            self.quotas.charge_image(data)
+        if self.jobs is not None:
+            text, route = await deadline.run(self._read_image_on_worker(data, deadline), stage="ocr")
+            self.record_route(route)
+            return text
+        async with self.ocr_limiter.slot(timeout=deadline.remaining()):
+            image, route = await deadline.run(self.clean(data, deadline=deadline), stage="clean")
+            self.record_route(route)
+            return await deadline.run(self.ocr_image(image, deadline=deadline), stage="ocr")
+
+    async def _read_image_on_worker(
+        self, data: BytesIO, deadline: Deadline
+    ) -> typing.Tuple[str, typing.Optional[str]]:
         try:
-            image = self.cleaner.clean(image=data)
-            cleaned_image = self.cleaner.to_pil_image(image)
+            return await self.jobs.read_image(data.getvalue(), timeout=deadline.remaining())
         except InvalidImage:
-            logger.error("Image could not be opened as it is not a valid url.")
+            log_event("invalid_image", "WARNING", "Image could not be opened as it is not a valid url.")
             raise fastapi.exceptions.HTTPException(
                 status_code=500,
                 detail="Image could not be opened due to url being invalid.",
             )
 
-        text = pytesseract.image_to_string(cleaned_image, lang="eng")
-        return text
+    async def download_image(self, url: str, deadline: typing.Optional[Deadline] = None) -> BytesIO:
+        """
+        |coroutine|
+        This method downloads an image from the provided url with :attr:`fetcher`. Urls that failed recently, and
+        hosts that failed repeatedly, fail right away without being asked again. Images larger than the maximum
+        upload size are not downloaded.
+
+        Parameters:
+            url (str): This parameter takes the url of the image.
+
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        Returns:
+            (BytesIO): The downloaded image as a BytesIO object.
 
-    async def search_token_in_image(self, image_url: str) -> JSONResponse:
+        Raises:
+            (fastapi.exceptions.HTTPException): If the image could not be downloaded or is too large, the host of the
+                                                image is cut off, or the url is not a valid url.
+        """
+        deadline = deadline or self.create_deadline()
+        # The download gives up a little before the deadline, so that a host too slow to send the image in time
+        # counts against its breaker instead of only being cancelled.
+        timeout = deadline.remaining() * 0.9
+        try:
+            return await deadline.run(self.fetcher.fetch(url, timeout=timeout), stage="download")
+        except aiohttp.InvalidURL:
+            log_event("invalid_url", "WARNING", "Image url is not a valid url: {url}", url=url)
+            raise fastapi.exceptions.HTTPException(
+                status_code=400, detail="Invalid Image URL provided."
+            )
+        except HostUnavailable as e:
+            raise fastapi.exceptions.HTTPException(
+                status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+            )
+        except DownloadFailed as e:
+            if e.status is not None:
+                raise fastapi.exceptions.HTTPException(
+                    status_code=410, detail="Image resource not found."
+                )
+            if e.reason == "timeout":
+                raise fastapi.exceptions.HTTPException(
+                    status_code=504, detail="Image host did not respond in time."
+                )
+            if e.reason == "too large":
+                raise fastapi.exceptions.HTTPException(
+                    status_code=413,
+                    detail=f"Image is larger than the maximum size of {self.config.max_upload_size} bytes.",
+                )
+            raise fastapi.exceptions.HTTPException(
+                status_code=502, detail="Image host could not be reached."
+            )
+
+    async def scan_image(self, image_url: str, deadline: typing.Optional[Deadline] = None) -> TokenRecord:
         """
         |coroutine|
-        This method validates and downloads the image from the provided url, if the url is valid and an image is found,
-        it calls :class:`core.parser.TokenParser.validate_token` to parse the image for tokens,
-        if found, it returns the token and various other information about it in :class:`JSONResponse` object.
+        This method downloads the image from the provided url, reads the text in it and parses the text for tokens.
 
         Parameters:
             image_url (str): The url of the image to search for tokens in, must be a valid url containing an image.
 
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
         Returns:
-        (JSONResponse): :class:A `JSONResponse` object is returned containing the token and
-                       various other information about it as a dict, which fastapi will render as a json object.
+            (TokenRecord): The token record containing all the data extracted from the token.
         """
+        deadline = deadline or self.create_deadline()
+        self.ocr_limiter.admit()  # There is no point in downloading an image that would be shed anyway.
+        data = await self.download_image(image_url, deadline=deadline)
+        return await self.scan_image_data(data, deadline=deadline)
 
-        try:
-            async with aiohttp.request("GET", image_url) as response:
-                if response.status != 200:
-                    logger.error(
-                        f"Image could not be downloaded. Status: {response.status}"
-                    )
+    async def scan_image_data(
+        self, data: BytesIO, deadline: typing.Optional[Deadline] = None
+    ) -> TokenRecord:
+        """
+        |coroutine|
+        This method reads the text in an image that is already in memory and parses the text for tokens.
+
+        Parameters:
+            data (BytesIO): This parameter takes the image as a BytesIO object.
+
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        Returns:
+            (TokenRecord): The token record containing all the data extracted from the token.
+        """
+        deadline = deadline or self.create_deadline()
+        image_data = await self.read_image(data=data, deadline=deadline)
+        await deadline.check("parse")
+        record_usage(scanned_bytes=len(image_data))
+        return await self.parser.validate_token(image_data, data_parsed_from_type="image")
+
+    async def scan_text(self, text: str) -> TokenRecord:
+        """
+        |coroutine|
+        This method parses the text for tokens. Short texts are parsed inline, as that is faster than handing them to
+        a thread, longer texts are searched in :attr:`text_lane`, so that they do not block the event loop.
+
+        Parameters:
+            text (str): This parameter takes a text as a string, that needs to be parsed for tokens.
+
+        Returns:
+            (TokenRecord): The token record containing all the data extracted from the token.
+
+        Raises:
+            (Overloaded): If the text is too long to parse inline, and the queue of the text lane is full.
+            (QuotaExceeded): If the budget of the client does not cover the text.
+        """
+        if self.quotas is not None:
+            self.quotas.charge_text(len(text))
+        if len(text) < self.config.lane_text_inline_limit:
+            match = self.parser.first_match(text, "text")
+        else:
+            match = await self.text_lane.run(self.parser.first_match, text, "text")
+        return await self.parser.validate_match(match, text, data_parsed_from_type="text")
+
+    def is_admin(self, token: typing.Optional[str]) -> bool:
+        """
+        This method checks an admin token against the one in config.yml.
+
+        Parameters:
+            token (typing.Optional[str]): This parameter takes the token the client passed, if any.
+
+        Returns:
+            (bool): True if the profiling endpoints are enabled and the token is the admin token.
+        """
+        admin_token = self.config.profiling_admin_token
+        if admin_token is None or token is None:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8"))
+
+    def verify_admin(self, token: typing.Optional[str]) -> None:
+        """
+        This method guards the profiling and status endpoints. They do not exist as far as clients can tell unless
+        an admin token is set in config.yml.
+
+        Parameters:
+            token (typing.Optional[str]): This parameter takes the token the client passed in the `X-Admin-Token`
+                                          header, if any.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If the admin endpoints are disabled, or the token is wrong.
+        """
+        if self.config.profiling_admin_token is None:
+            raise fastapi.exceptions.HTTPException(status_code=404, detail="Not Found")
+        if not self.is_admin(token):
+            raise fastapi.exceptions.HTTPException(status_code=403, detail="Invalid admin token.")
+
+    async def sample_profile(self, seconds: float, idle: bool = False) -> str:
+        """
+        |coroutine|
+        This method samples the stacks of every thread of the server for a number of seconds.
+
+        Parameters:
+            seconds (float): This parameter takes the number of seconds to sample for, at most the maximum duration
+                             in config.yml.
+
+            idle (bool): This parameter takes True to also count threads that are waiting for work.
+
+        Returns:
+            (str): The collapsed stacks, which flamegraph tools can read.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If the duration is too long, or a sample is already running.
+        """
+        if seconds > self.config.profiling_max_duration:
+            raise fastapi.exceptions.HTTPException(
+                status_code=400,
+                detail=f"A sample can run for at most {self.config.profiling_max_duration} seconds.",
+            )
+        if self.sampler.running:
+            raise fastapi.exceptions.HTTPException(
+                status_code=409, detail="A sampling profile is already running."
+            )
+        return await self.sampler.sample(seconds, idle=idle)
+
+    @executor_function
+    def allocation_diff(self, limit: int, key_type: str, match: typing.Optional[str]) -> typing.List[dict]:
+        """
+        An executor function that compares the allocations traced since :meth:`AllocationTracker.start` with the
+        baseline. Taking a snapshot can take a while when many allocations are traced.
+
+        Parameters:
+            limit (int): This parameter takes the number of places to return.
+
+            key_type (str): This parameter takes how allocations are grouped, "lineno", "filename" or "traceback".
+
+            match (typing.Optional[str]): This parameter takes a part of a file name to only compare allocations with
+                                          that file in their traceback.
+
+        Returns:
+            (typing.List[dict]): The places that allocated the most memory since the baseline.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If allocation tracing was not started.
+        """
+        if not self.allocations.tracing:
+            raise fastapi.exceptions.HTTPException(
+                status_code=409, detail="Allocation tracing was not started."
+            )
+        return self.allocations.diff(limit=limit, key_type=key_type, match=match)
+
+    def status(self) -> dict:
+        """
+        This method returns the state of the execution lanes, of the OCR concurrency limiter, of the processes
+        images are cleaned in, of the OCR worker running in the API process, if any, of the image downloads, of
+        the quotas, of the static file cache, and of the preprocessing routes images took, so that operators can
+        see where work is queueing and how much memory it takes.
+
+        Returns:
+            (dict): The metrics of every lane, the state of the OCR limiter, the memory of every process of the pool
+                    and its recent recycle events, the queue backend, the counters of the local OCR worker, the
+                    counters of the image fetcher along with the hosts that are cut off, the counters of the
+                    quotas, the counters of the static file cache, and the number of images cleaned with every
+                    preprocessing variant.
+        """
+        return {
+            "lanes": {
+                lane.name: lane.stats() for lane in (self.ocr_lane, self.text_lane)
+            },
+            "ocr_limiter": self.ocr_limiter.stats(),
+            "pool": self.pool.stats() if self.pool is not None else None,
+            "queue": self.config.queue_backend,
+            "local_worker": self.local_worker.stats() if self.local_worker is not None else None,
+            "downloads": self.fetcher.stats(),
+            "quotas": self.quotas.stats() if self.quotas is not None else None,
+            "assets": self.assets.stats(),
+            "routes": dict(self.preprocessing_routes),
+        }
+
+    async def extract_text(self, url: str, deadline: typing.Optional[Deadline] = None) -> dict:
+        """
+        |coroutine|
+        This method downloads the image from the provided url, and returns the text that was read from it.
+
+        Parameters:
+            url (str): This parameter takes the url of the image that needs to be processed.
+
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        Returns:
+            (dict): The url, the text that was read from the image, and the text without whitespace control
+                    characters, as described by :class:`OCRData`.
+        """
+        deadline = deadline or self.create_deadline()
+        self.ocr_limiter.admit()
+        data = await self.download_image(url, deadline=deadline)
+        return await self.extract_text_from_data(data, url=url, deadline=deadline)
+
+    async def extract_text_from_data(
+        self,
+        data: BytesIO,
+        url: typing.Optional[str] = None,
+        deadline: typing.Optional[Deadline] = None,
+    ) -> dict:
+        """
+        |coroutine|
+        This method returns the text that was read from an image that is already in memory.
+
+        Parameters:
+            data (BytesIO): This parameter takes the image as a BytesIO object.
+
+            url (typing.Optional[str]): This parameter takes the url the image was downloaded from, if any.
+
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        Returns:
+            (dict): The url, the text that was read from the image, and the text without whitespace control
+                    characters, as described by :class:`OCRData`.
+        """
+        data_from_image = await self.read_image(data=data, deadline=deadline)
+        return {
+            "url": url,
+            "unfiltered_text": data_from_image,
+            "filtered_text": data_from_image.replace("\n", " ")
+            .replace("\f", "")
+            .replace("\r", "")
+            .replace("\t", "")
+            .replace("\v", ""),
+        }
+
+    async def read_upload(self, request: Request) -> BytesIO:
+        """
+        |coroutine|
+        This method reads an image uploaded in the body of a request, either as the raw body with a content type such
+        as `application/octet-stream`, or as the first file of a `multipart/form-data` body. The body is streamed in
+        chunks and counted as it is received, whatever its `Content-Length` header says, and the upload is rejected
+        as soon as it is larger than the maximum upload size, before a multipart body is parsed any further.
+
+        Parameters:
+            request (Request): This parameter takes the request the image was uploaded with.
+
+        Returns:
+            (BytesIO): The uploaded image as a BytesIO object.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If no image was uploaded, or the image is too large.
+        """
+        max_size = self.config.max_upload_size
+        too_large = fastapi.exceptions.HTTPException(
+            status_code=413,
+            detail=f"Image is larger than the maximum upload size of {max_size} bytes.",
+        )
+        multipart = request.headers.get("content-type", "").startswith("multipart/form-data")
+        # A multipart body is a bit larger than the file in it, because of the boundaries and headers of its parts.
+        max_body_size = max_size + 65536 if multipart else max_size
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body_size:
+            raise too_large
+
+        async def body() -> typing.AsyncGenerator[bytes, None]:
+            # Chunked bodies have no Content-Length, so the bytes are counted as they arrive.
+            received = 0
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_body_size:
+                    raise too_large
+                yield chunk
+
+        image = BytesIO()
+        if multipart:
+            form = await MultiPartParser(request.headers, body()).parse()
+            try:
+                upload = next(
+                    (value for value in form.values() if hasattr(value, "read")), None
+                )
+                if upload is None:
                     raise fastapi.exceptions.HTTPException(
-                        status_code=410, detail="Image resource not found."
+                        status_code=400, detail="No image file found in the multipart body."
                     )
-                image_data = await self.read_image(
-                    data=BytesIO(await response.read())
-                )
+                while True:
+                    chunk = await upload.read(65536)
+                    if not chunk:
+                        break
+                    image.write(chunk)
+                    if image.tell() > max_size:
+                        raise too_large
+            finally:
+                await form.close()
+        else:
+            async for chunk in body():
+                image.write(chunk)
 
-                data_from_image = await self.parser.validate_token(
-                    image_data, data_parsed_from_type="image"
-                )
-                json_data = data_from_image.jsonify()
-                return JSONResponse(
-                    content=json_data, status_code=200, media_type="application/json"
-                )
-        except aiohttp.InvalidURL:
-            self.logger.error("Image url is not a valid url.")
+        if image.tell() == 0:
             raise fastapi.exceptions.HTTPException(
-                status_code=400, detail="Invalid Image URL provided."
+                status_code=400, detail="No image was uploaded."
             )
+        image.seek(0)
+        return image
+
+    async def search_token_in_image(
+        self, image_url: str, deadline: typing.Optional[Deadline] = None
+    ) -> JSONResponse:
+        """
+        |coroutine|
+        This method validates and downloads the image from the provided url, if the url is valid and an image is found,
+        it calls :class:`core.parser.TokenParser.validate_token` to parse the image for tokens,
+        if found, it returns the token and various other information about it in :class:`JSONResponse` object.
+
+        Parameters:
+            image_url (str): The url of the image to search for tokens in, must be a valid url containing an image.
+
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
+        Returns:
+        (JSONResponse): :class:A `JSONResponse` object is returned containing the token and
+                       various other information about it as a dict, which fastapi will render as a json object.
+        """
+        json_data = (await self.scan_image(image_url, deadline=deadline)).jsonify()
+        return JSONResponse(
+            content=json_data, status_code=200, media_type="application/json"
+        )
 
     async def search_token_in_text(self, text: str) -> JSONResponse:
         """
@@ -111,14 +786,12 @@ class DetectionAPI(FastAPI):
             (JSONResponse): A :class:`JSONResponse` object is returned containing data of the token as a
                         dict which fastapi will render as a json object.
         """
-        json_data = (
-            await self.parser.validate_token(text, data_parsed_from_type="text")
-        ).jsonify()
+        json_data = (await self.scan_text(text)).jsonify()
         return JSONResponse(
             content=json_data, status_code=200, media_type="application/json"
         )
 
-    async def ocr(self, url: str) -> JSONResponse:
+    async def ocr(self, url: str, deadline: typing.Optional[Deadline] = None) -> JSONResponse:
         """
         |coroutine|
         This method downloads an image from url, and then uses :func:`read_image` to read the image and
@@ -128,6 +801,8 @@ class DetectionAPI(FastAPI):
         Parameters:
             url (str): This parameter takes the url of the image that needs to be processed.
 
+            deadline (typing.Optional[Deadline]): This parameter takes the deadline of the request.
+
         Returns:
 
         (JSONResponse): A `fastapi.responses.JSONResponse` object is returned containing the text
@@ -136,33 +811,123 @@ class DetectionAPI(FastAPI):
         Raises:
             (fastapi.exceptions.HTTPException): If the image could not be downloaded, or the url is not a valid url.
         """
-        try:
-            async with aiohttp.request("GET", url) as response:
-                if response.status != 200:
-                    self.logger.error(
-                        f"Image could not be downloaded. Status: {response.status}"
-                    )
-                    raise fastapi.exceptions.HTTPException(
-                        status_code=410, detail="Image resource not found."
-                    )
-                data_from_image = await self.read_image(
-                    data_in_bytes=BytesIO(await response.read())
-                )
+        json_data = await self.extract_text(url, deadline=deadline)
+        return JSONResponse(
+            status_code=200, content=json_data, media_type="application/json"
+        )
 
-                json_data = {
-                    "url": url,
-                    "unfiltered_text": data_from_image,
-                    "filtered_text": data_from_image.replace("\n", " ")
-                    .replace("\f", "")
-                    .replace("\r", "")
-                    .replace("\t", "")
-                    .replace("\v", ""),
-                }
-                return JSONResponse(
-                    status_code=200, content=json_data, media_type="application/json"
-                )
-        except aiohttp.InvalidURL:
-            self.logger.error("Image url is not a valid url.")
+    async def create_scan_session(self) -> JSONResponse:
+        """
+        |coroutine|
+        This method creates a new incremental scan session, text can then be appended to it with
+        :meth:`append_to_scan_session`.
+
+        Returns:
+            (JSONResponse): A :class:`JSONResponse` object is returned containing the ID of the new session.
+        """
+        session = self.sessions.create()
+        return JSONResponse(
+            content=session.jsonify(self.sessions.ttl),
+            status_code=201,
+            media_type="application/json",
+        )
+
+    async def append_to_scan_session(self, session_id: str, text: str) -> JSONResponse:
+        """
+        |coroutine|
+        This method appends text to an incremental scan session, and scans only the appended text and the unscanned
+        tail of the session for tokens. The valid tokens found for the first time in the session are recorded in the
+        fingerprint store, and tagged with `seen_before`.
+
+        Parameters:
+            session_id (str): This parameter takes the ID of the session.
+
+            text (str): This parameter takes the text that is appended to the session.
+
+        Returns:
+            (JSONResponse): A :class:`JSONResponse` object is returned containing the new tokens found in the text,
+                            and every token found in the session so far.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If the session does not exist or has expired.
+            (QuotaExceeded): If the budget of the client does not cover the text.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
             raise fastapi.exceptions.HTTPException(
-                status_code=400, detail="Invalid Image URL provided."
+                status_code=404, detail="Scan session not found or expired."
+            )
+        if self.quotas is not None:
+            self.quotas.charge_text(len(text))
+        new_tokens = session.feed(text)
+        await self.parser.remember(new_tokens)
+        return JSONResponse(
+            content=session.jsonify(self.sessions.ttl, new_tokens=new_tokens),
+            status_code=200,
+            media_type="application/json",
+        )
+
+    async def close_scan_session(self, session_id: str) -> JSONResponse:
+        """
+        |coroutine|
+        This method closes an incremental scan session and returns the tokens found in it.
+
+        Parameters:
+            session_id (str): This parameter takes the ID of the session.
+
+        Returns:
+            (JSONResponse): A :class:`JSONResponse` object is returned containing every token found in the session.
+
+        Raises:
+            (fastapi.exceptions.HTTPException): If the session does not exist or has expired.
+        """
+        session = self.sessions.remove(session_id)
+        if session is None:
+            raise fastapi.exceptions.HTTPException(
+                status_code=404, detail="Scan session not found or expired."
             )
+        return JSONResponse(
+            content=session.jsonify(0),
+            status_code=200,
+            media_type="application/json",
+        )
+
+    async def search_token_in_upload(self, request: Request) -> JSONResponse:
+        """
+        |coroutine|
+        This method reads the image uploaded in the body of the request, and parses the text in it for tokens,
+        without downloading anything.
+
+        Parameters:
+            request (Request): This parameter takes the request the image was uploaded with.
+
+        Returns:
+            (JSONResponse): A :class:`JSONResponse` object is returned containing the token and
+                            various other information about it.
+        """
+        deadline = self.create_deadline(request)
+        data = await self.read_upload(request)
+        json_data = (await self.scan_image_data(data, deadline=deadline)).jsonify()
+        return JSONResponse(
+            content=json_data, status_code=200, media_type="application/json"
+        )
+
+    async def ocr_upload(self, request: Request) -> JSONResponse:
+        """
+        |coroutine|
+        This method reads the image uploaded in the body of the request, and returns the text that was read from it,
+        without downloading anything.
+
+        Parameters:
+            request (Request): This parameter takes the request the image was uploaded with.
+
+        Returns:
+            (JSONResponse): A :class:`JSONResponse` object is returned containing the text that was read from
+                            the image.
+        """
+        deadline = self.create_deadline(request)
+        data = await self.read_upload(request)
+        json_data = await self.extract_text_from_data(data, deadline=deadline)
+        return JSONResponse(
+            status_code=200, content=json_data, media_type="application/json"
+        )
@@ -1,15 +1,33 @@
+import typing
+
 import aioredis
-from fastapi import Depends
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import Depends, Header, HTTPException, Query, Request, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
+from loguru import logger
 
+from core.jobs import RedisJobQueue
 from src.app import DetectionAPI
-from utils.models import ImageRequest, OCRData, TextRequest, Token
+from src.stream import StreamIngress
+from utils.exceptions import (
+    ClientDisconnected,
+    DeadlineExceeded,
+    JobFailed,
+    Overloaded,
+    QuotaExceeded,
+)
+from utils.logs import setup_logging
+from utils.models import ImageRequest, OCRData, ScanSessionData, TextRequest, Token
+from utils.profiling import ProfileMiddleware
+from utils.quotas import QuotaMiddleware
 
 app = DetectionAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+if app.quotas is not None:
+    app.add_middleware(QuotaMiddleware, quotas=app.quotas, tenant=app.tenant, prefixes=("/token/", "/ocr/"))
+if app.config.profiling_admin_token is not None:
+    app.add_middleware(ProfileMiddleware, profiles=app.profiles, is_admin=app.is_admin, prefixes=("/token/", "/ocr/"))
+stream = StreamIngress(app)
 
 
 @app.on_event("startup")
@@ -18,8 +36,16 @@ async def startup() -> None:
     |coroutine|
     This method is triggered when the FastAPI app instance starts up, it is binded to the event named as
     `startup` in the above listener (decorator).
-    This function initializes the redis connection.
+    This function sets up logging, initializes the redis connection, and shares it with the token fingerprint store
+    if enabled. It also connects the Redis queue of the OCR workers, or starts the local OCR worker, depending on
+    the queue backend.
     """
+    setup_logging(
+        level=app.config.logging_level,
+        serialize=app.config.logging_serialize,
+        sample_rate=app.config.logging_sample_rate,
+        sample_burst=app.config.logging_sample_burst,
+    )
     redis = await aioredis.from_url(
         url=app.config.redis_address,
         db=app.config.redis_db,
@@ -30,6 +56,20 @@ async def startup() -> None:
         decode_responses=True,
     )
     await FastAPILimiter.init(redis)
+    if app.config.fingerprint_redis:
+        app.fingerprints.redis = redis
+    if isinstance(app.jobs, RedisJobQueue):
+        # Images are binary, so the queue needs a connection that does not decode responses.
+        app.jobs.redis = await aioredis.from_url(
+            url=app.config.redis_address,
+            db=app.config.redis_db,
+            username=app.config.redis_username,
+            password=app.config.redis_password,
+            port=app.config.redis_port,
+            decode_responses=False,
+        )
+        await app.jobs.setup()
+    app.start_local_worker()
     return
 
 
@@ -39,55 +79,155 @@ async def shutdown() -> None:
     |coroutine|
 
     This method is binded to the shutdown event of the server triggered when the FastAPI app instance shuts down,
-    it closes the redis connection.
+    it closes the redis connection, stops the local OCR worker, closes the session images are downloaded with, shuts
+    the execution lanes and the image processes down, and writes the log lines still queued.
     """
     await FastAPILimiter.close()
+    await app.stop_local_worker()
+    await app.fetcher.close()
+    if isinstance(app.jobs, RedisJobQueue) and app.jobs.redis is not None:
+        await app.jobs.redis.close()
+    app.ocr_lane.shutdown(wait=False)
+    app.text_lane.shutdown(wait=False)
+    if app.pool is not None:
+        app.pool.shutdown(wait=False)
+    await logger.complete()
     return
 
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root() -> HTMLResponse:
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
     """
-    This endpoint is the root endpoint of the API.
+    This handler turns a request that ran out of time into a `504 Gateway Timeout` response.
+    """
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected) -> JSONResponse:
+    """
+    This handler answers a request whose client has disconnected with `499 Client Closed Request`, which nobody will
+    read, but it stops the request from being logged as a server error.
     """
-    return HTMLResponse(
-        content=open("static/index.html", "r").read(),
-        media_type="text/html",
+    return JSONResponse(status_code=499, content={"detail": str(exc)})
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    """
+    This handler turns a request that was shed because the server is overloaded into a
+    `503 Service Unavailable` response, with a `Retry-After` header telling the client when to try again.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
     )
 
 
-@app.get("/game", response_class=HTMLResponse)
-async def game() -> HTMLResponse:
+@app.exception_handler(JobFailed)
+async def job_failed_handler(request: Request, exc: JobFailed) -> JSONResponse:
     """
-    This endpoint contains an experimental web based game.
+    This handler turns an image that an OCR worker failed to read into a `502 Bad Gateway` response, as the error
+    happened on the worker, not on the API node.
+    """
+    return JSONResponse(status_code=502, content={"detail": str(exc)})
+
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded) -> JSONResponse:
     """
-    return HTMLResponse(
-        content=open("static/game.html", "r").read(),
-        media_type="text/html",
+    This handler turns a request whose client has spent its budget of work into a `429 Too Many Requests` response,
+    with a `Retry-After` header telling the client when its budget covers the request again.
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
     )
 
 
+def rate_limit(times: int, seconds: int) -> typing.List[typing.Any]:
+    """
+    This function returns the request rate limit of an endpoint whose work is measured, which is only enforced if
+    quotas are disabled, as quotas already charge clients by the work their requests take, and limit the number of
+    their requests coarsely.
+    """
+    if app.quotas is not None:
+        return []
+    return [Depends(RateLimiter(times=times, seconds=seconds))]
+
+
+async def require_admin(x_admin_token: typing.Optional[str] = Header(None)) -> None:
+    """
+    This dependency guards the admin endpoints with the `X-Admin-Token` header.
+    """
+    app.verify_admin(x_admin_token)
+
+
+async def serve_asset(request: Request, path: str, max_age: int) -> Response:
+    """
+    |coroutine|
+    This function serves a file of the static directory from the cache of the app.
+
+    Raises:
+        (HTTPException): If the file does not exist.
+    """
+    response = await app.assets.response(request, path, max_age=max_age)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
+
+
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_root(request: Request) -> Response:
+    """
+    This endpoint is the root endpoint of the API.
+    """
+    return await serve_asset(request, "index.html", max_age=app.config.asset_page_max_age)
+
+
+@app.api_route("/game", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def game(request: Request) -> Response:
+    """
+    This endpoint contains an experimental web based game.
+    """
+    return await serve_asset(request, "game.html", max_age=app.config.asset_page_max_age)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], name="static", include_in_schema=False)
+async def static_file(request: Request, path: str) -> Response:
+    """
+    This endpoint serves the scripts, stylesheets and images of the pages.
+    """
+    return await serve_asset(request, path, max_age=app.config.asset_max_age)
+
+
 @app.post(
     "/token/image/{url}",
-    dependencies=[Depends(RateLimiter(times=1, seconds=30))],
+    dependencies=rate_limit(times=1, seconds=30),
     response_model=Token,
 )
 async def read_token_from_image(
     image: ImageRequest,
+    request: Request,
 ) -> JSONResponse:
     """
     This endpoint reads an image from an url and tries extract the token from it, this uses tesseract-ocr, so it might
     not be accurate all the time.
-    This endpoint has a rate limiter, so you can only make 1 request every 30 seconds.
+    Requests are charged to the quota of the client by the work they take, or limited to 1 request every 30
+    seconds if quotas are disabled.
+    The request can take the timeout in config.yml, or the one the client asks for with the `X-Request-Timeout`
+    header, up to the maximum in config.yml.
     """
 
-    data = await app.search_token_in_image(image.url)
+    data = await app.search_token_in_image(image.url, deadline=app.create_deadline(request))
     return data
 
 
 @app.post(
     "/token/text/{text}",
-    dependencies=[Depends(RateLimiter(times=1, seconds=10))],
+    dependencies=rate_limit(times=1, seconds=10),
     response_model=Token,
 )
 async def read_token_from_text(
@@ -96,7 +236,8 @@ async def read_token_from_text(
     """
     This endpoint reads a text and tries extract a token from it, if found, it will return the token and various
     other information related to the token.
-    This endpoint has a rate limiter, so you can only make 1 request every 10 seconds.
+    Requests are charged to the quota of the client by the work they take, or limited to 1 request every 10
+    seconds if quotas are disabled.
     """
     response = await app.search_token_in_text(data.content)
     return response
@@ -104,14 +245,213 @@ async def read_token_from_text(
 
 @app.post(
     "/ocr/text/{text}",
-    dependencies=[Depends(RateLimiter(times=1, seconds=10))],
+    dependencies=rate_limit(times=1, seconds=10),
     response_model=OCRData,
 )
-async def OCR_endpoint(data: ImageRequest) -> JSONResponse:
+async def OCR_endpoint(data: ImageRequest, request: Request) -> JSONResponse:
     """
     This enpoint takes an url of an image, validates and downloads the image and returns the text extracted from it in
     :class:`OCRData` response. This endpoint uses Tesseract OCR engine to process the image.
+    Requests are charged to the quota of the client by the work they take, or limited to 1 request every 10
+    seconds if quotas are disabled.
+    The request can take the timeout in config.yml, or the one the client asks for with the `X-Request-Timeout`
+    header, up to the maximum in config.yml.
+    """
+    response = await app.ocr(data.url, deadline=app.create_deadline(request))
+    return response
+
+
+@app.post(
+    "/token/upload",
+    dependencies=rate_limit(times=1, seconds=30),
+    response_model=Token,
+)
+async def read_token_from_upload(request: Request) -> JSONResponse:
+    """
+    This endpoint reads an image uploaded in the request body, either as raw bytes with a content type such as
+    `application/octet-stream`, or as a file in a `multipart/form-data` body, and tries to extract the token from it.
+    Clients that already have the image in memory should use this endpoint, as the image does not have to be
+    downloaded again.
+    Requests are charged to the quota of the client by the work they take, or limited to 1 request every 30
+    seconds if quotas are disabled.
+    """
+    response = await app.search_token_in_upload(request)
+    return response
+
+
+@app.post(
+    "/ocr/upload",
+    dependencies=rate_limit(times=1, seconds=10),
+    response_model=OCRData,
+)
+async def OCR_upload_endpoint(request: Request) -> JSONResponse:
+    """
+    This endpoint reads an image uploaded in the request body, either as raw bytes or as a file in a
+    `multipart/form-data` body, and returns the text extracted from it in :class:`OCRData` response.
+    Requests are charged to the quota of the client by the work they take, or limited to 1 request every 10
+    seconds if quotas are disabled.
+    """
+    response = await app.ocr_upload(request)
+    return response
+
+
+@app.post(
+    "/token/session",
+    dependencies=[Depends(RateLimiter(times=1, seconds=10))],
+    response_model=ScanSessionData,
+    status_code=201,
+)
+async def create_scan_session() -> JSONResponse:
+    """
+    This endpoint opens an incremental scan session. Text appended to the session is scanned only once, so clients
+    that repeatedly submit a growing document or a chat channel can send just the new text.
+    Sessions are evicted after they have been inactive for the time configured in config.yml.
     This endpoint has a rate limiter, so you can only make 1 request every 10 seconds.
     """
-    response = await app.ocr(data.url)
+    response = await app.create_scan_session()
+    return response
+
+
+@app.post(
+    "/token/session/{session_id}",
+    dependencies=rate_limit(times=20, seconds=10),
+    response_model=ScanSessionData,
+)
+async def append_to_scan_session(session_id: str, data: TextRequest) -> JSONResponse:
+    """
+    This endpoint appends text to an incremental scan session, and returns the tokens found for the first time in it,
+    along with every token found in the session so far.
+    Requests are charged to the quota of the client by the work they take, or limited to 20 requests every 10
+    seconds if quotas are disabled.
+    """
+    response = await app.append_to_scan_session(session_id, data.content)
     return response
+
+
+@app.delete(
+    "/token/session/{session_id}",
+    response_model=ScanSessionData,
+)
+async def close_scan_session(session_id: str) -> JSONResponse:
+    """
+    This endpoint closes an incremental scan session, and returns every token found in it.
+    """
+    response = await app.close_scan_session(session_id)
+    return response
+
+
+@app.get("/status", dependencies=[Depends(require_admin)])
+async def status() -> JSONResponse:
+    """
+    This endpoint returns the queue metrics of the execution lanes, text parsing and image reading each run in their
+    own lane, and the state of the adaptive OCR concurrency limiter. Like the profiling endpoints, it is only
+    available to admins.
+    """
+    return JSONResponse(status_code=200, content=app.status(), media_type="application/json")
+
+
+@app.get(
+    "/admin/profile/sample",
+    dependencies=[Depends(require_admin)],
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def sample_profile(
+    seconds: float = Query(5.0, gt=0), idle: bool = False
+) -> PlainTextResponse:
+    """
+    This endpoint samples the stacks of the event loop and every executor thread for a number of seconds, and returns
+    them as collapsed stacks, which flamegraph.pl and speedscope can read.
+    """
+    stacks = await app.sample_profile(seconds, idle=idle)
+    return PlainTextResponse(content=stacks)
+
+
+@app.get(
+    "/admin/profile/requests",
+    dependencies=[Depends(require_admin)],
+    include_in_schema=False,
+)
+async def list_request_profiles() -> JSONResponse:
+    """
+    This endpoint lists the per-request profiles kept in memory, oldest first.
+    """
+    return JSONResponse(
+        status_code=200,
+        content=[profile.summary() for profile in app.profiles.profiles.values()],
+    )
+
+
+@app.get(
+    "/admin/profile/requests/{profile_id}",
+    dependencies=[Depends(require_admin)],
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def get_request_profile(
+    profile_id: str,
+    sort: str = Query("cumulative", regex="^(cumulative|tottime|calls|ncalls|time)$"),
+    limit: int = Query(50, gt=0),
+) -> PlainTextResponse:
+    """
+    This endpoint returns a per-request profile as a pstats report.
+    """
+    profile = app.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return PlainTextResponse(content=profile.render(sort=sort, limit=limit))
+
+
+@app.post(
+    "/admin/tracemalloc/start",
+    dependencies=[Depends(require_admin)],
+    include_in_schema=False,
+)
+async def start_allocation_tracing(frames: int = Query(25, gt=0, le=100)) -> JSONResponse:
+    """
+    This endpoint starts tracing memory allocations and takes the baseline snapshot. Tracing slows every allocation
+    down, so it should be stopped as soon as the diff was taken.
+    """
+    app.allocations.start(frames=frames)
+    return JSONResponse(status_code=200, content={"tracing": True})
+
+
+@app.get(
+    "/admin/tracemalloc/diff",
+    dependencies=[Depends(require_admin)],
+    include_in_schema=False,
+)
+async def allocation_diff(
+    limit: int = Query(25, gt=0),
+    key_type: str = Query("lineno", regex="^(lineno|filename|traceback)$"),
+    match: typing.Optional[str] = None,
+) -> JSONResponse:
+    """
+    This endpoint returns the places that allocated the most memory since tracing started. Pass a part of a file name
+    as `match`, such as `reader.py` or `models.py`, to only look at allocations made by that file.
+    """
+    diff = await app.allocation_diff(limit, key_type, match)
+    return JSONResponse(status_code=200, content=diff)
+
+
+@app.post(
+    "/admin/tracemalloc/stop",
+    dependencies=[Depends(require_admin)],
+    include_in_schema=False,
+)
+async def stop_allocation_tracing() -> JSONResponse:
+    """
+    This endpoint stops tracing memory allocations.
+    """
+    app.allocations.stop()
+    return JSONResponse(status_code=200, content={"tracing": False})
+
+
+@app.websocket("/stream")
+async def stream_endpoint(websocket: WebSocket) -> None:
+    """
+    This endpoint accepts a binary stream of length prefixed msgpack frames over a websocket, for high volume
+    clients. Many text, image and OCR scans can be in flight at once on one connection, and their results are sent
+    back as they complete. See :class:`src.stream.StreamIngress` for the format of the frames.
+    """
+    await stream.run(websocket)
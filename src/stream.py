@@ -0,0 +1,307 @@
+import asyncio
+import hmac
+import struct
+import time
+import typing
+
+import fastapi
+import msgpack
+from fastapi import WebSocket
+from loguru import logger
+
+from utils.exceptions import DeadlineExceeded, Overloaded, QuotaExceeded
+from utils.logs import log_event
+
+if typing.TYPE_CHECKING:
+    from src.app import DetectionAPI
+
+__all__ = ("StreamIngress",)
+
+FRAME_HEADER = struct.Struct(">I")
+# Browsers can't set headers on a websocket, so they pass the token as a subprotocol instead.
+SUBPROTOCOL = "stream"
+TOKEN_SUBPROTOCOL_PREFIX = "token."
+
+
+class StreamIngress:
+    """
+    A class that serves scans over a websocket, as a binary stream of length prefixed msgpack frames. Every frame is
+    a 4 byte big endian length, followed by a msgpack encoded map. Many scans can be in flight on one connection at
+    once, and their results are sent back as soon as they complete, in any order.
+
+    A request frame looks like ``{"id": 1, "type": "text", "content": "..."}`` for text, or
+    ``{"id": 2, "type": "image", "url": "..."}`` and ``{"id": 3, "type": "ocr", "url": "..."}`` for images.
+    Image frames can also have a ``"timeout"`` in seconds, which is used instead of the default request timeout.
+    Every connection can start a limited number of scans per second, frames over it are read more slowly.
+    A response frame looks like ``{"id": 1, "ok": True, "result": {...}}``, or
+    ``{"id": 1, "ok": False, "error": {"status": 400, "detail": "..."}}`` if the scan failed.
+
+    If a token is set, clients pass it in the ``X-Stream-Token`` header, or offer the ``stream`` subprotocol along
+    with a ``token.<token>`` subprotocol, and the connection is accepted with the ``stream`` subprotocol.
+    """
+
+    def __init__(self, app: "DetectionAPI"):
+        self.app = app
+        self.logger = logger
+        self.max_in_flight = app.config.stream_max_in_flight
+        self.max_frame_size = app.config.stream_max_frame_size
+        self.rate = app.config.stream_rate
+        self.token = app.config.stream_token
+
+    @staticmethod
+    def pack(payload: dict) -> bytes:
+        """
+        This method encodes a payload as a length prefixed msgpack frame.
+
+        Parameters:
+            payload (dict): This parameter takes the payload to encode.
+
+        Returns:
+            (bytes): The encoded frame.
+        """
+        data = msgpack.packb(payload, use_bin_type=True)
+        return FRAME_HEADER.pack(len(data)) + data
+
+    def unpack(self, buffer: bytearray) -> typing.List[dict]:
+        """
+        This method removes every complete frame from the start of the buffer and decodes it. Incomplete frames are
+        left in the buffer, so that frames can span multiple websocket messages.
+
+        Parameters:
+            buffer (bytearray): This parameter takes the buffer of received bytes.
+
+        Returns:
+            (typing.List[dict]): The decoded payloads.
+
+        Raises:
+            (ValueError): If a frame is larger than the maximum frame size, or is not a msgpack map.
+        """
+        payloads = []
+        offset = 0
+        while len(buffer) - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame of {length} bytes is larger than the maximum frame size.")
+            if len(buffer) - offset - FRAME_HEADER.size < length:
+                break
+            start = offset + FRAME_HEADER.size
+            payload = msgpack.unpackb(bytes(buffer[start : start + length]), raw=False)
+            if not isinstance(payload, dict):
+                raise ValueError("Frame payload must be a msgpack map.")
+            payloads.append(payload)
+            offset = start + length
+
+        del buffer[:offset]
+        return payloads
+
+    async def handle(self, payload: dict, tenant: typing.Optional[str] = None) -> dict:
+        """
+        |coroutine|
+        This method runs the scan requested by a frame, using the same pipeline as the HTTP endpoints. The work of
+        the scan is charged to the budget of the client, if quotas are enabled.
+
+        Parameters:
+            payload (dict): This parameter takes the decoded request frame.
+
+            tenant (typing.Optional[str]): This parameter takes the client the scan is charged to.
+
+        Returns:
+            (dict): The decoded response frame.
+        """
+        if self.app.quotas is None or tenant is None:
+            return await self._handle(payload)
+        with self.app.quotas.meter(tenant):
+            return await self._handle(payload)
+
+    async def _handle(self, payload: dict) -> dict:
+        # The fields of the frame are validated before the scan runs, so that errors raised by the scan itself are
+        # never reported as an invalid frame.
+        request_id = payload.get("id")
+        request_type = payload.get("type")
+        if request_type not in ("text", "image", "ocr"):
+            return self.error(request_id, 400, f"Unknown request type: {request_type}.")
+        field = "content" if request_type == "text" else "url"
+        if field not in payload:
+            return self.error(request_id, 422, f"Missing field in request frame: '{field}'.")
+        if not isinstance(payload[field], str):
+            return self.error(request_id, 422, f"Invalid field in request frame: '{field}' must be a string.")
+
+        try:
+            deadline = self.app.create_deadline(timeout=payload.get("timeout"))
+            if request_type == "text":
+                result = (await self.app.scan_text(payload["content"])).jsonify()
+            elif request_type == "image":
+                result = (await self.app.scan_image(payload["url"], deadline=deadline)).jsonify()
+            else:
+                result = await self.app.extract_text(payload["url"], deadline=deadline)
+        except DeadlineExceeded as e:
+            return self.error(request_id, 504, str(e))
+        except Overloaded as e:
+            response = self.error(request_id, 503, str(e))
+            response["error"]["retry_after"] = e.retry_after
+            return response
+        except QuotaExceeded as e:
+            response = self.error(request_id, 429, str(e))
+            response["error"]["retry_after"] = e.retry_after
+            return response
+        except fastapi.exceptions.HTTPException as e:
+            return self.error(request_id, e.status_code, e.detail)
+        except Exception as e:
+            log_event(
+                "stream_request_failed",
+                "ERROR",
+                "Stream request {request_id} failed. Error: {error}",
+                request_id=request_id,
+                error=repr(e),
+            )
+            return self.error(request_id, 500, "Internal server error.")
+
+        return {"id": request_id, "ok": True, "result": result}
+
+    @staticmethod
+    def error(request_id: typing.Any, status: int, detail: str) -> dict:
+        """
+        This method returns an error response frame.
+
+        Parameters:
+            request_id (typing.Any): This parameter takes the ID of the request that failed.
+
+            status (int): This parameter takes the HTTP status code that describes the error.
+
+            detail (str): This parameter takes the description of the error.
+
+        Returns:
+            (dict): The decoded response frame.
+        """
+        return {"id": request_id, "ok": False, "error": {"status": status, "detail": detail}}
+
+    async def writer(self, websocket: WebSocket, results: asyncio.Queue) -> None:
+        """
+        |coroutine|
+        This method sends completed results to the client. Results that complete at the same time are coalesced into
+        a single websocket message.
+
+        Parameters:
+            websocket (WebSocket): This parameter takes the websocket connection.
+
+            results (asyncio.Queue): This parameter takes the queue of completed response frames.
+        """
+        while True:
+            frames = [self.pack(await results.get())]
+            while not results.empty():
+                frames.append(self.pack(results.get_nowait()))
+            await websocket.send_bytes(b"".join(frames))
+
+    @staticmethod
+    def client_token(websocket: WebSocket) -> typing.Optional[str]:
+        """
+        This method returns the token a client authenticated with, from the `X-Stream-Token` header, or else from a
+        subprotocol that starts with `token.`.
+
+        Parameters:
+            websocket (WebSocket): This parameter takes the websocket connection.
+
+        Returns:
+            (typing.Optional[str]): The token, or None if the client did not pass one.
+        """
+        token = websocket.headers.get("x-stream-token")
+        if token:
+            return token
+        for subprotocol in websocket.scope.get("subprotocols", ()):
+            if subprotocol.startswith(TOKEN_SUBPROTOCOL_PREFIX):
+                return subprotocol[len(TOKEN_SUBPROTOCOL_PREFIX) :]
+        return None
+
+    def authenticate(self, websocket: WebSocket) -> bool:
+        """
+        This method checks the token of a client against the one in config.yml, in constant time.
+
+        Parameters:
+            websocket (WebSocket): This parameter takes the websocket connection.
+
+        Returns:
+            (bool): True if no token is set, or if the client passed it, False otherwise.
+        """
+        if not self.token:
+            return True
+        token = self.client_token(websocket)
+        return token is not None and hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def _writer_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Stopped sending results on a stream. Error: {task.exception()!r}")
+
+    async def run(self, websocket: WebSocket) -> None:
+        """
+        |coroutine|
+        This method serves a websocket connection until the client disconnects, or until the results can't be sent
+        anymore.
+
+        Parameters:
+            websocket (WebSocket): This parameter takes the websocket connection.
+        """
+        if not self.authenticate(websocket):
+            await websocket.close(code=1008)
+            return
+
+        offered = websocket.scope.get("subprotocols", ())
+        await websocket.accept(subprotocol=SUBPROTOCOL if SUBPROTOCOL in offered else None)
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks: typing.Set[asyncio.Task] = set()
+        buffer = bytearray()
+        tenant = self.app.tenant(websocket)
+        interval = 1 / self.rate
+        # The time the next scan is due at, scans can start up to a second ahead of it, or one scan if it is slower.
+        ahead = max(0.0, 1.0 - interval)
+        due = time.monotonic()
+
+        async def process(payload: dict) -> None:
+            try:
+                await results.put(await self.handle(payload, tenant=tenant))
+            finally:
+                in_flight.release()
+
+        writer = asyncio.ensure_future(self.writer(websocket, results))
+        writer.add_done_callback(self._writer_done)
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if writer.done():
+                    # The error of the writer was logged when it stopped.
+                    await websocket.close(code=1011)
+                    return
+                if message.get("bytes") is None:
+                    self.logger.error("Closing stream after a text message, only binary frames are accepted.")
+                    await websocket.close(code=1003)
+                    return
+
+                buffer.extend(message["bytes"])
+                try:
+                    payloads = self.unpack(buffer)
+                except (ValueError, msgpack.UnpackException) as e:
+                    self.logger.error(f"Closing stream after an invalid frame. Error: {e}")
+                    await websocket.close(code=1003)
+                    return
+
+                for payload in payloads:
+                    # Waiting for the rate or for a free slot stops reading from the socket, which applies
+                    # backpressure to the client.
+                    now = time.monotonic()
+                    due = max(due, now)
+                    if due - now > ahead:
+                        await asyncio.sleep(due - now - ahead)
+                    due += interval
+                    await in_flight.acquire()
+                    task = asyncio.ensure_future(process(payload))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.cancel()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} max_in_flight={self.max_in_flight}>"
@@ -0,0 +1,108 @@
+"""
+Generators of the synthetic tokens and images the tests share. They are kept apart from the ones of `benchmarks/`,
+so that tuning a benchmark never changes what the tests check.
+"""
+import base64
+import io
+import os
+import random
+import string
+import typing
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Background and text colors of the dark, light and darker themes of chat clients.
+THEMES = (
+    ((54, 57, 63), (220, 221, 222)),
+    ((255, 255, 255), (46, 51, 56)),
+    ((32, 34, 37), (185, 187, 190)),
+)
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+WORDS = "hey anyone know why my bot keeps going offline here is the config i use for it and the logs".split()
+TOKEN_ALPHABET = string.ascii_letters + string.digits + "-_"
+
+
+def make_token(rng: random.Random) -> str:
+    """
+    This function builds a discord bot token like string, whose components are all valid: an 18 digit user ID, a
+    timestamp after the Discord epoch, and an HMAC with more than 3 unique characters.
+    """
+    user_id = base64.b64encode(str(rng.randrange(10**17, 10**18)).encode()).decode().rstrip("=")
+    seconds = rng.randrange(130_000_000, 200_000_000)
+    timestamp = base64.urlsafe_b64encode(seconds.to_bytes(4, "big")).decode().rstrip("=")
+    hmac = "".join(rng.sample(TOKEN_ALPHABET, 4)) + "".join(rng.choice(TOKEN_ALPHABET) for _ in range(23))
+    return f"{user_id}.{timestamp}.{hmac}"
+
+
+def load_font(size: int) -> ImageFont.ImageFont:
+    """
+    This function loads the first TrueType font that exists on the system, or the default bitmap font of Pillow.
+    """
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+
+def make_screenshot(rng: random.Random, with_token: bool) -> typing.Tuple[bytes, typing.Optional[str]]:
+    """
+    This function draws a clean PNG screenshot of a few chat messages, one of which contains a token if asked to.
+
+    Returns:
+        (typing.Tuple[bytes, typing.Optional[str]]): The encoded image, and the token in it, if any.
+    """
+    background, foreground = rng.choice(THEMES)
+    font = load_font(rng.randint(13, 22))
+    lines = [
+        f"user{rng.randint(1, 9999)}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+        for _ in range(rng.randint(3, 8))
+    ]
+    token = None
+    if with_token:
+        token = make_token(rng)
+        lines.insert(rng.randrange(len(lines) + 1), f"user{rng.randint(1, 9999)}: {token}")
+
+    # Older versions of Pillow only measure bitmap fonts with getsize.
+    if hasattr(font, "getbbox"):
+        line_height = int(font.getbbox("Ag")[3] * 1.6)
+        width = int(max(font.getlength(line) for line in lines)) + 40
+    else:
+        line_height = int(font.getsize("Ag")[1] * 1.6)
+        width = max(font.getsize(line)[0] for line in lines) + 40
+    image = Image.new("RGB", (width, line_height * len(lines) + 30), background)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((20, 15 + number * line_height), line, fill=foreground, font=font)
+
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue(), token
+
+
+def make_photo(rng: random.Random, data: bytes) -> bytes:
+    """
+    This function turns a screenshot into something like a phone photo of the screen it was on: larger, tilted,
+    lit unevenly, noisy, out of focus and compressed as JPEG.
+    """
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image = image.resize((image.width * 2, image.height * 2), Image.BILINEAR)
+    image = image.rotate(rng.uniform(-6, 6), resample=Image.BICUBIC, expand=True, fillcolor=(90, 90, 90))
+    pixels = np.asarray(image, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    # Light falls off towards one side of the screen, and a little towards the bottom.
+    lighting = (
+        np.linspace(rng.uniform(0.5, 0.8), 1.1, width)[None, :, None]
+        * np.linspace(0.8, 1.0, height)[:, None, None]
+    )
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(0, 12, pixels.shape)
+    image = Image.fromarray(np.clip(pixels * lighting + noise, 0, 255).astype(np.uint8))
+    output = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(rng.uniform(0.6, 1.4))).save(output, format="JPEG", quality=70)
+    return output.getvalue()
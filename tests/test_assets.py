@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import os
+
+import pytest
+from starlette.requests import Request
+
+from utils.assets import AssetCache
+
+PAGE = b"<html>" + b"<p>detection api</p>" * 200 + b"</html>"
+
+
+def request(**headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+        }
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    static = tmp_path / "static"
+    (static / "css").mkdir(parents=True)
+    (static / "index.html").write_bytes(PAGE)
+    (tmp_path / "secret.txt").write_text("secret")
+    return AssetCache(str(static), check_interval=0, max_file_size=1_000_000, min_compress_size=256)
+
+
+def test_matching_entity_tags_get_an_empty_response(cache):
+    async def run():
+        first = await cache.response(request(accept_encoding="gzip"), "index.html", max_age=60)
+        etag = first.headers["etag"]
+        again = await cache.response(request(accept_encoding="gzip", if_none_match=etag), "index.html", max_age=60)
+        weak = await cache.response(request(if_none_match=f'"other", W/{etag}'), "index.html", max_age=60)
+        stale = await cache.response(request(if_none_match='"other"'), "index.html", max_age=60)
+        return first, again, weak, stale
+
+    first, again, weak, stale = asyncio.run(run())
+    assert first.status_code == 200 and first.headers["cache-control"] == "public, max-age=60"
+    assert (again.status_code, again.body, again.headers["etag"]) == (304, b"", first.headers["etag"])
+    assert weak.status_code == 304
+    assert stale.status_code == 200
+    assert cache.not_modified == 2
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [(None, "identity"), ("gzip", "gzip"), ("gzip;q=0, deflate", "identity"), ("*", "br"), ("br, gzip", "br")],
+)
+def test_the_smallest_accepted_encoding_is_sent(cache, accept_encoding, encoding):
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+    headers = {"accept_encoding": accept_encoding} if accept_encoding is not None else {}
+    response = asyncio.run(cache.response(request(**headers), "index.html", max_age=0))
+
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers.get("content-encoding", "identity") == encoding
+    body = response.body
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "br":
+        body = brotli.decompress(body)
+    assert body == PAGE
+
+
+def test_files_are_read_again_when_they_change(cache):
+    path = os.path.join(cache.directory, "index.html")
+
+    async def run():
+        first = await cache.get("index.html")
+        with open(path, "wb") as f:
+            f.write(b"<html>changed</html>")
+        os.utime(path, ns=(first.mtime + 10 ** 9, first.mtime + 10 ** 9))
+        return first, await cache.get("index.html"), await cache.get("index.html")
+
+    first, changed, unchanged = asyncio.run(run())
+    assert changed.variants["identity"] == b"<html>changed</html>"
+    assert changed.etag != first.etag
+    assert unchanged is changed
+    assert cache.loads == 2
+
+
+@pytest.mark.parametrize(
+    "path", ["../secret.txt", "css/../../secret.txt", "./index.html", "css/../index.html", "css//../index.html", "css"]
+)
+def test_paths_outside_of_the_directory_or_not_normalized_are_not_served(cache, path):
+    assert asyncio.run(cache.get(path)) is None
+    assert cache.assets == {}
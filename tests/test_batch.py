@@ -0,0 +1,62 @@
+import io
+import json
+import os
+import random
+
+from conftest import make_token
+from core import batch
+from core.batch import BatchScanner, scan_file
+from core.ocr import OCRProfile
+
+
+def crash_on(path: str) -> dict:
+    if path.endswith("crash.txt"):
+        os._exit(1)
+    return scan_file(path)
+
+
+def test_tokens_split_across_chunks_are_found(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "CHUNK_SIZE", 64)
+    tokens = [make_token(random.Random(seed)) for seed in range(3)]
+    path = tmp_path / "notes.txt"
+    path.write_text("é" * 50 + " ".join(f"{'x' * 37} {token}" for token in tokens) + " end", encoding="utf-8")
+
+    result = scan_file(str(path))
+    assert result["error"] is None
+    assert result["size"] == path.stat().st_size
+    assert [token["token_string"] for token in result["tokens"]] == tokens
+
+
+def test_crashed_worker_is_recorded_and_the_run_goes_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "scan_file", crash_on)
+    token = make_token(random.Random(0))
+    names = ["a.txt", "crash.txt"] + [f"{index:02}.txt" for index in range(10)]
+    for name in names:
+        (tmp_path / name).write_text(token, encoding="utf-8")
+    paths = [str(tmp_path / name) for name in names]
+    output = io.StringIO()
+    checkpoint = tmp_path / "run.checkpoint"
+
+    assert BatchScanner(output, checkpoint_path=str(checkpoint), workers=1).run(paths) == len(paths)
+    results = {result["path"]: result for result in map(json.loads, output.getvalue().splitlines())}
+    assert sorted(results) == sorted(paths)
+    assert results[paths[1]]["error"].startswith("BrokenProcessPool")
+    # Files queued after the crash are scanned by a new pool.
+    assert results[paths[-1]]["error"] is None and results[paths[-1]]["tokens"]
+    # Failed files are left out of the checkpoint, so that a resumed run scans them again.
+    assert sorted(checkpoint.read_text().split()) == sorted(
+        path for path, result in results.items() if result["error"] is None
+    )
+
+
+def test_images_are_read_with_the_profile_of_the_scanner(tmp_path, monkeypatch):
+    profiles = []
+    monkeypatch.setattr(batch, "read_text", lambda data, profile=None: profiles.append(profile) or "")
+    monkeypatch.setattr(batch, "_profile", None)
+    profile = OCRProfile(name="token", psm=6, preprocessing="binarize")
+    batch._init_worker(profile)
+    path = tmp_path / "screenshot.png"
+    path.write_bytes(b"png")
+
+    assert scan_file(str(path))["error"] is None
+    assert profiles == [profile]
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from utils.concurrency import AdaptiveLimiter
+from utils.exceptions import DeadlineExceeded, Overloaded
+
+
+def limiter(**kwargs) -> AdaptiveLimiter:
+    options = dict(
+        name="ocr",
+        initial_limit=1,
+        min_limit=1,
+        max_limit=4,
+        target_latency=0.1,
+        queue_timeout=1.0,
+        max_queue=4,
+        backoff=0.5,
+    )
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+def test_the_limit_grows_additively_and_shrinks_multiplicatively():
+    async def run():
+        adaptive = limiter(initial_limit=2)
+        limits = []
+        for latency, overloaded in [(0.01, False), (0.01, False), (0.5, False), (0.01, True), (None, False)]:
+            await adaptive.acquire()
+            adaptive.release(latency=latency, overloaded=overloaded)
+            limits.append(adaptive.limit)
+        return limits
+
+    limits = asyncio.run(run())
+    assert limits == pytest.approx([2.5, 2.9, 1.45, 1.0, 1.0])
+
+
+def test_the_limit_stays_within_its_bounds():
+    async def run():
+        adaptive = limiter(initial_limit=4)
+        for _ in range(10):
+            await adaptive.acquire()
+            adaptive.release(latency=0.01)
+        highest = adaptive.limit
+        for _ in range(10):
+            await adaptive.acquire()
+            adaptive.release(latency=1.0)
+        return highest, adaptive.limit
+
+    assert asyncio.run(run()) == (4.0, 1.0)
+
+
+def test_released_slots_are_handed_to_waiting_jobs_in_order():
+    async def run():
+        adaptive = limiter()
+        await adaptive.acquire()
+        order = []
+
+        async def job(index: int):
+            await adaptive.acquire()
+            order.append(index)
+
+        tasks = [asyncio.ensure_future(job(index)) for index in range(2)]
+        await asyncio.sleep(0)
+        queued = len(adaptive.waiters)
+        adaptive.release()
+        await asyncio.sleep(0)
+        # The slot went straight to the first waiter, it was never free for a new job to take.
+        in_flight = adaptive.in_flight
+        adaptive.release()
+        await asyncio.gather(*tasks)
+        return queued, in_flight, order, adaptive.stats()
+
+    queued, in_flight, order, stats = asyncio.run(run())
+    assert (queued, in_flight, order) == (2, 1, [0, 1])
+    assert (stats["in_flight"], stats["queued"], stats["admitted"], stats["shed"]) == (1, 0, 3, 0)
+
+
+def test_jobs_waiting_past_the_queue_timeout_are_shed():
+    async def run():
+        adaptive = limiter(queue_timeout=0.05)
+        await adaptive.acquire()
+        with pytest.raises(Overloaded) as error:
+            await adaptive.acquire(timeout=5)
+        return adaptive, error.value
+
+    adaptive, error = asyncio.run(run())
+    assert error.retry_after >= 1
+    assert (adaptive.in_flight, len(adaptive.waiters), adaptive.shed) == (1, 0, 1)
+
+
+def test_jobs_are_shed_right_away_when_the_queue_is_full():
+    async def run():
+        adaptive = limiter(max_queue=1)
+        await adaptive.acquire()
+        waiting = asyncio.ensure_future(adaptive.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            adaptive.admit()
+        with pytest.raises(Overloaded):
+            await adaptive.acquire()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return adaptive
+
+    adaptive = asyncio.run(run())
+    assert (adaptive.in_flight, len(adaptive.waiters), adaptive.shed) == (1, 0, 2)
+
+
+def test_no_slot_is_leaked_by_cancelled_jobs():
+    async def run():
+        adaptive = limiter()
+        started = asyncio.Event()
+
+        async def job(wait: bool):
+            async with adaptive.slot():
+                started.set()
+                if wait:
+                    await asyncio.sleep(10)
+
+        running = asyncio.ensure_future(job(wait=True))
+        await started.wait()
+        queued = [asyncio.ensure_future(job(wait=False)) for _ in range(2)]
+        await asyncio.sleep(0)
+        # The first waiter is cancelled while it waits, and the second one right after the slot was handed to it.
+        queued[0].cancel()
+        await asyncio.sleep(0)
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        queued[1].cancel()
+        await asyncio.gather(*queued, return_exceptions=True)
+        return adaptive
+
+    adaptive = asyncio.run(run())
+    assert (adaptive.in_flight, len(adaptive.waiters)) == (0, 0)
+
+
+def test_jobs_past_their_deadline_shrink_the_limit():
+    async def run():
+        adaptive = limiter(initial_limit=4)
+        with pytest.raises(DeadlineExceeded):
+            async with adaptive.slot():
+                raise DeadlineExceeded("ocr")
+        return adaptive
+
+    adaptive = asyncio.run(run())
+    assert (adaptive.limit, adaptive.in_flight) == (2.0, 0)
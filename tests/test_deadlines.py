@@ -0,0 +1,33 @@
+import pytest
+from fastapi.exceptions import HTTPException
+from starlette.requests import Request
+
+from src.app import DetectionAPI
+
+
+@pytest.fixture(scope="module")
+def app():
+    return DetectionAPI()
+
+
+def request(timeout: str) -> Request:
+    return Request({"type": "http", "headers": [(b"x-request-timeout", timeout.encode())]})
+
+
+@pytest.mark.parametrize("timeout", ["nan", "inf", "-inf", "0", "-1", "soon"])
+def test_invalid_header_timeouts_are_rejected(app, timeout):
+    with pytest.raises(HTTPException) as error:
+        app.create_deadline(request(timeout))
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("timeout", [float("nan"), "inf", -5, 0, "soon", [1]])
+def test_invalid_frame_timeouts_are_rejected(app, timeout):
+    with pytest.raises(HTTPException):
+        app.create_deadline(timeout=timeout)
+
+
+def test_timeouts_are_capped(app):
+    assert app.create_deadline(request("2.5")).remaining() <= 2.5
+    assert app.create_deadline(request("100000")).remaining() <= app.config.max_request_timeout
+    assert app.create_deadline().remaining() <= app.config.request_timeout
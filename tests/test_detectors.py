@@ -0,0 +1,46 @@
+import asyncio
+import random
+
+from conftest import make_token
+from core.detectors import DetectorRegistry, api_key_detector, discord_webhook_detector
+from core.parser import TokenParser
+
+API_KEY = "a1B2c3D4e5F6g7H8i9J0k1L2m3N4o5P6q7R8"
+
+
+def test_case_folded_prefixes_do_not_raise():
+    # In a case-insensitive unicode search "ſ" (U+017F) matches "s" and "K" (U+212A) matches "k".
+    registry = DetectorRegistry()
+    registry.register(discord_webhook_detector())
+    registry.register(api_key_detector())
+    assert list(registry.finditer("httpſ://discord.com/api/webhooks ſecret_Key = é aKKess_token")) == []
+
+
+def test_non_ascii_text_is_scanned():
+    token = make_token(random.Random(0))
+    records = TokenParser().scan(f"héllo httpſ:// ſecret {token} api_key = {API_KEY}", data_parsed_from_type="text")
+    assert [record.token_type for record in records] == ["discord_bot_token", "api_key"]
+    assert records[0].token_string == token
+
+
+def test_decoys_do_not_hide_a_valid_token():
+    token = make_token(random.Random(0))
+    parser = TokenParser()
+    for decoy in ("api_key = " + "a" * 40, "https://discord.com/api/webhooks/123456789012345678/" + "b" * 68):
+        record = asyncio.run(parser.validate_token(f"{decoy}\nthe bot uses {token}", data_parsed_from_type="text"))
+        assert (record.token_type, record.token_string, record.is_valid) == ("discord_bot_token", token, True)
+
+
+def test_first_invalid_match_is_returned_without_a_valid_one():
+    record = asyncio.run(TokenParser().validate_token("api_key = " + "a" * 40, data_parsed_from_type="text"))
+    assert (record.token_type, record.is_valid) == ("api_key", False)
+
+
+def test_prefixes_are_found_like_the_regex_finds_them():
+    registry = TokenParser().detectors
+    rng = random.Random(0)
+    pieces = ["api", "API", "secret", "Access", "auth", "https://", "mfa.", "a", "s", "x ", "pi", "ccess"]
+    for _ in range(200):
+        text = "".join(rng.choice(pieces) for _ in range(30))
+        expected = [(match.start(), match.lastindex - 1) for match in registry._prefixes.finditer(text)]
+        assert registry._find_prefixes(text) == expected
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils.exceptions import DownloadFailed
+from utils.fetcher import CircuitBreaker, ImageFetcher
+
+
+async def large(request: web.Request) -> web.StreamResponse:
+    # Sent in chunks, without a Content-Length header.
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for _ in range(64):
+        await response.write(b"x" * 1024)
+    return response
+
+
+async def trickle(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for _ in range(100):
+        await response.write(b"x")
+        await asyncio.sleep(0.05)
+    return response
+
+
+def fetch(path: str, timeout: float, **kwargs):
+    async def run():
+        app = web.Application()
+        app.router.add_get("/large", large)
+        app.router.add_get("/trickle", trickle)
+        server = TestServer(app)
+        await server.start_server()
+        fetcher = ImageFetcher(
+            negative_ttl=30,
+            negative_max_entries=10,
+            failure_threshold=1,
+            reset_timeout=30,
+            connect_timeout=1,
+            read_timeout=0.2,
+            **kwargs,
+        )
+        try:
+            with pytest.raises(DownloadFailed) as error:
+                await fetcher.fetch(str(server.make_url(path)), timeout=timeout)
+            breaker = fetcher.breaker(f"{server.host}:{server.port}")
+            return error.value, breaker.state, len(fetcher.negative_cache)
+        finally:
+            await fetcher.close()
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_downloads_stop_at_the_maximum_size():
+    error, state, cached = fetch("/large", timeout=5, max_size=10_000)
+    assert error.reason == "too large"
+    assert state == CircuitBreaker.CLOSED
+    assert cached == 1
+
+
+def test_trickling_hosts_trip_the_breaker():
+    error, state, cached = fetch("/trickle", timeout=0.5, max_size=10_000)
+    assert error.reason == "timeout"
+    assert state == CircuitBreaker.OPEN
+    assert cached == 1
+
+
+def test_short_client_timeouts_do_not_blame_the_host():
+    error, state, cached = fetch("/trickle", timeout=0.1, max_size=10_000)
+    assert error.reason == "timeout"
+    assert state == CircuitBreaker.CLOSED
+    # Other clients can still download the url.
+    assert cached == 0
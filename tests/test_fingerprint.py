@@ -0,0 +1,60 @@
+import asyncio
+import random
+
+from conftest import make_token
+from core.fingerprint import FingerprintStore
+from core.parser import TokenParser
+from core.session import ScanSession
+
+
+def test_false_positive_rate_stays_near_the_error_rate():
+    async def run():
+        store = FingerprintStore(salt="salt", capacity=2000, error_rate=0.01)
+        for index in range(2000):
+            await store.add(f"added-{index}")
+        assert all([await store.contains(f"added-{index}") for index in range(2000)])
+        return store, sum([await store.contains(f"other-{index}") for index in range(20000)])
+
+    store, false_positives = asyncio.run(run())
+    assert len(store) > 1950
+    assert false_positives / 20000 < 0.02
+
+
+def test_session_tokens_are_tagged_with_seen_before():
+    store = FingerprintStore(salt="salt", capacity=1000, error_rate=0.001)
+    parser = TokenParser(fingerprints=store)
+    token = make_token(random.Random(0))
+
+    async def scan(session_id: str):
+        session = ScanSession(session_id, parser)
+        tokens = session.feed(f"leaked {token[:20]}") + session.feed(f"{token[20:]} here")
+        await parser.remember(tokens)
+        return tokens
+
+    first, second = asyncio.run(scan("first")), asyncio.run(scan("second"))
+    assert [(record.token_string, record.seen_before) for record in first] == [(token, False)]
+    assert [(record.token_string, record.seen_before) for record in second] == [(token, True)]
+
+
+def test_bloom_hits_are_confirmed_before_validation_is_skipped():
+    store = FingerprintStore(salt="salt", capacity=1000, error_rate=0.001, exact_capacity=1, skip_known=True)
+    parser = TokenParser(fingerprints=store)
+    token, other = make_token(random.Random(0)), make_token(random.Random(1))
+    # Fills the Bloom filter, so that every lookup is a hit, as a false positive would be.
+    store.bloom.bits[:] = b"\xff" * len(store.bloom.bits)
+
+    async def run():
+        await store.add(token)
+        known = await parser.validate_token(f"leaked {token}", data_parsed_from_type="text")
+        await store.add(other)
+        # The first token was evicted from the exact set, so it is only a hit of the Bloom filter now.
+        evicted = await parser.validate_token(f"leaked {token}", data_parsed_from_type="text")
+        # A string that was never reported, and whose timestamp is before the Discord epoch.
+        forged = ".".join([token.split(".")[0], "AAAAAA", token.split(".")[2]])
+        invalid = await parser.validate_token(f"leaked {forged}", data_parsed_from_type="text")
+        return known, evicted, invalid
+
+    known, evicted, invalid = asyncio.run(run())
+    assert (known.is_valid, known.seen_before, known.user_id) == (True, True, None)
+    assert (evicted.is_valid, evicted.seen_before, evicted.user_id) == (True, True, 544157599796692941)
+    assert (invalid.is_valid, invalid.seen_before) == (False, None)
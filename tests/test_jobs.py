@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from core.jobs import JobQueue, LocalJobQueue, OCRJob, RedisJobQueue
+from utils.exceptions import DeadlineExceeded, InvalidImage, JobFailed, Overloaded
+
+
+def job(job_id: str) -> OCRJob:
+    return OCRJob(job_id=job_id, image=b"image", expires_at=time.time() + 10)
+
+
+def test_local_queue_hands_jobs_to_a_worker():
+    async def run():
+        queue = LocalJobQueue(max_length=2)
+
+        async def worker():
+            for fetched in await queue.fetch("worker", count=2, timeout=1.0):
+                result = {"job_id": fetched.job_id, "text": "hello", "route": "photo", "error": None, "detail": None}
+                await queue.complete(fetched, result)
+
+        task = asyncio.ensure_future(worker())
+        text = await queue.read_image(b"image", timeout=1.0)
+        await task
+        return text, queue.results
+
+    text, results = asyncio.run(run())
+    assert text == ("hello", "photo")
+    assert results == {}
+
+
+@pytest.mark.parametrize(
+    "error, exception", [("deadline", DeadlineExceeded), ("invalid_image", InvalidImage), ("failed", JobFailed)]
+)
+def test_local_queue_raises_worker_errors(error, exception):
+    async def run():
+        queue = LocalJobQueue(max_length=2)
+
+        async def worker():
+            fetched = (await queue.fetch("worker", count=1, timeout=1.0))[0]
+            await queue.complete(fetched, {"job_id": fetched.job_id, "text": None, "error": error, "detail": "x"})
+
+        task = asyncio.ensure_future(worker())
+        try:
+            await queue.read_image(b"image", timeout=1.0)
+        finally:
+            await task
+
+    with pytest.raises(exception):
+        asyncio.run(run())
+
+
+def test_local_queue_sheds_jobs_when_full():
+    async def run():
+        queue = LocalJobQueue(max_length=1)
+        await queue.submit(job("first"))
+        await queue.submit(job("second"))
+
+    with pytest.raises(Overloaded):
+        asyncio.run(run())
+
+
+def redis_queue(**kwargs) -> RedisJobQueue:
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisJobQueue(redis=fakeredis.FakeAsyncRedis(), **kwargs)
+
+
+def test_redis_queue_never_trims_queued_jobs():
+    async def run():
+        queue = redis_queue(max_length=3)
+        await queue.setup()
+        for index in range(3):
+            await queue.submit(job(str(index)))
+        with pytest.raises(Overloaded):
+            await queue.submit(job("shed"))
+        return [fetched.job_id for fetched in await queue.fetch("worker", count=10, timeout=0.1)]
+
+    assert asyncio.run(run()) == ["0", "1", "2"]
+
+
+def test_redis_queue_claims_stale_jobs_past_the_first_page():
+    async def run():
+        queue = redis_queue(claim_idle=0.0)
+        queue.claim_page = 2
+        await queue.setup()
+        for index in range(5):
+            await queue.submit(job(str(index)))
+        taken = await queue.redis.xreadgroup(queue.group, "dead", {queue.stream: ">"}, count=5)
+        entries = [entry_id for _, stream_entries in taken for entry_id, _ in stream_entries]
+        # A job deleted from the stream while it was pending is claimed without its fields.
+        await queue.redis.xdel(queue.stream, entries[0])
+        claimed = await queue.claim("worker", count=10)
+        pending = await queue.redis.xpending(queue.stream, queue.group)
+        return [fetched.job_id for fetched in claimed], pending["pending"]
+
+    claimed, pending = asyncio.run(run())
+    assert claimed == ["1", "2", "3", "4"]
+    assert pending == 4
+
+
+def test_job_queues_must_implement_the_whole_interface():
+    class PartialQueue(JobQueue):
+        async def submit(self, job: OCRJob) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        PartialQueue()
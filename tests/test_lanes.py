@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from utils.exceptions import Overloaded
+from utils.lanes import ExecutionLane
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+@pytest.fixture
+def lane():
+    lane = ExecutionLane("test", max_workers=1, max_queue=1)
+    yield lane
+    lane.shutdown()
+
+
+def test_jobs_over_the_queue_limit_are_rejected(lane):
+    release = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(lane.run(release.wait, 5))
+        while not lane.active:
+            await asyncio.sleep(0.001)
+        queued = asyncio.ensure_future(lane.run(lambda: "queued"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await lane.run(lambda: "rejected")
+        release.set()
+        return error.value, await running, await queued
+
+    error, running, queued = asyncio.run(run())
+    assert error.retry_after >= 1
+    assert (running, queued) == (True, "queued")
+    stats = lane.stats()
+    assert (stats["queued"], stats["active"], stats["completed"], stats["rejected"]) == (0, 0, 2, 1)
+
+
+def test_cancelled_callers_are_accounted_for(lane):
+    release = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(lane.run(release.wait, 5))
+        while not lane.active:
+            await asyncio.sleep(0.001)
+        queued = asyncio.ensure_future(lane.run(lambda: "never run"))
+        await asyncio.sleep(0)
+        # A job that has not started yet is dropped from the queue.
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        after_queued = lane.stats()
+        # A job that is running goes on, and is counted once it finishes.
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        release.set()
+        return after_queued
+
+    after_queued = asyncio.run(run())
+    assert (after_queued["queued"], after_queued["active"], after_queued["cancelled"]) == (0, 1, 1)
+    lane.shutdown()
+    stats = lane.stats()
+    assert (stats["queued"], stats["active"], stats["completed"], stats["failed"]) == (0, 0, 1, 0)
+
+
+def test_jobs_run_in_the_context_of_their_caller(lane):
+    async def job(value: str):
+        request_id.set(value)
+        return await lane.run(request_id.get)
+
+    async def run():
+        return await asyncio.gather(job("first"), job("second"))
+
+    lane.max_queue = 2
+    assert asyncio.run(run()) == ["first", "second"]
+    assert request_id.get() is None
@@ -0,0 +1,11 @@
+import pytest
+
+from utils.models import TokenRecord
+
+
+def test_token_records_are_compared_by_value_and_unhashable():
+    record = TokenRecord(is_valid=True, token_string="token", token_type="api_key")
+    assert record == TokenRecord(is_valid=True, token_string="token", token_type="api_key")
+    assert record != TokenRecord(is_valid=True, token_string="token", token_type="api_key", seen_before=True)
+    with pytest.raises(TypeError):
+        hash(record)
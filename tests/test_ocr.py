@@ -0,0 +1,36 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from core.ocr import TesseractProcess
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "wait4"), reason="os.wait4 is not available")
+
+
+def test_cpu_time_and_exit_code_are_kept_when_the_process_is_reaped():
+    script = "import sys; sum(range(3 * 10 ** 6)); sys.stdout.write(sys.stdin.read()); sys.exit(3)"
+    process = TesseractProcess(
+        [sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    data = b"image"
+    while True:
+        try:
+            stdout, _ = process.communicate(data, timeout=0.01)
+            break
+        except subprocess.TimeoutExpired:
+            data = None
+
+    assert (stdout, process.returncode) == (b"image", 3)
+    assert process.cpu_time > 0
+
+
+def test_killed_processes_report_the_signal():
+    process = TesseractProcess([sys.executable, "-c", "import time; time.sleep(10)"])
+    with pytest.raises(subprocess.TimeoutExpired):
+        process.wait(timeout=0.01)
+    process.kill()
+    assert process.wait() == -signal.SIGKILL
+    assert process.cpu_time is not None
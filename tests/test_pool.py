@@ -0,0 +1,40 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from utils.pool import RecyclingPool
+
+
+def test_processes_are_recycled_after_max_jobs():
+    async def run():
+        pool = RecyclingPool("test", processes=1, max_queue=10, max_jobs=2)
+        try:
+            pids = [await pool.run(os.getpid) for _ in range(4)]
+            await asyncio.sleep(0.1)
+            return pids, pool.stats()
+        finally:
+            pool.shutdown()
+
+    pids, stats = asyncio.run(run())
+    assert os.getpid() not in pids
+    assert pids[0] == pids[1] != pids[2] == pids[3]
+    assert stats["recycled"] == 2
+    assert [event["reason"] for event in stats["recycle_events"]] == ["max_jobs", "max_jobs"]
+
+
+def test_crashed_process_is_replaced():
+    async def run():
+        pool = RecyclingPool("test", processes=1, max_queue=10, max_jobs=100)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await pool.run(os._exit, 1)
+            await asyncio.sleep(0.1)
+            return await pool.run(os.getpid), pool.stats()
+        finally:
+            pool.shutdown()
+
+    pid, stats = asyncio.run(run())
+    assert pid != os.getpid()
+    assert stats["recycle_events"][0]["reason"].startswith("crash")
@@ -0,0 +1,58 @@
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.profiling import ProfileMiddleware, ProfileStore
+
+
+def client(profiles: ProfileStore) -> TestClient:
+    async def scan(request):
+        return PlainTextResponse("scanned")
+
+    app = Starlette(routes=[Route("/ocr/upload", scan, methods=["POST"]), Route("/", scan)])
+    app.add_middleware(
+        ProfileMiddleware, profiles=profiles, is_admin=lambda token: token == "secret", prefixes=("/token/", "/ocr/")
+    )
+    return TestClient(app)
+
+
+def test_admin_requests_are_profiled():
+    profiles = ProfileStore(max_profiles=4)
+    response = client(profiles).post("/ocr/upload", headers={"x-profile": "1", "x-admin-token": "secret"})
+    assert response.text == "scanned"
+    assert profiles.get(response.headers["x-profile-id"]) is not None
+
+
+def test_profiling_needs_the_admin_token():
+    profiles = ProfileStore(max_profiles=4)
+    response = client(profiles).post("/ocr/upload", headers={"x-profile": "1", "x-admin-token": "wrong"})
+    assert response.status_code == 403
+    assert len(profiles) == 0
+
+
+def test_other_requests_are_not_profiled():
+    profiles = ProfileStore(max_profiles=4)
+    http = client(profiles)
+    assert "x-profile-id" not in http.post("/ocr/upload").headers
+    assert "x-profile-id" not in http.get("/", headers={"x-profile": "1", "x-admin-token": "secret"}).headers
+    assert len(profiles) == 0
+
+
+def test_profiling_is_off_without_an_admin_token():
+    from src.endpoints import app
+
+    assert app.config.profiling_admin_token is None
+    assert ProfileMiddleware not in [middleware.cls for middleware in app.user_middleware]
+
+
+def test_status_is_only_shown_to_admins(monkeypatch):
+    from src.endpoints import app
+    from utils.helpers import Config
+
+    http = TestClient(app)
+    assert http.get("/status").status_code == 404
+    monkeypatch.setattr(Config, "profiling_admin_token", property(lambda self: "secret"))
+    assert http.get("/status", headers={"x-admin-token": "wrong"}).status_code == 403
+    response = http.get("/status", headers={"x-admin-token": "secret"})
+    assert response.status_code == 200 and "lanes" in response.json()
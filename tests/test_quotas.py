@@ -0,0 +1,70 @@
+import ipaddress
+
+import pytest
+from starlette.requests import Request
+
+from src.app import DetectionAPI
+from utils.exceptions import QuotaExceeded
+from utils.quotas import QuotaManager, record_usage
+
+
+def quotas(**settings) -> QuotaManager:
+    options = dict(
+        capacity=100,
+        refill_rate=10,
+        megapixel_cost=100,
+        cpu_second_cost=1000,
+        megabyte_cost=500,
+        cpu_per_megapixel=0.3,
+        max_requests=3,
+        request_rate=1,
+    )
+    options.update(settings)
+    return QuotaManager(**options)
+
+
+def test_requests_are_limited_whatever_they_cost():
+    manager = quotas()
+    for _ in range(3):
+        with manager.meter("client"):
+            pass
+    with pytest.raises(QuotaExceeded) as error:
+        with manager.meter("client"):
+            pass
+    assert error.value.retry_after == 1
+    with manager.meter("other client"):
+        pass
+
+
+def test_measured_work_is_settled():
+    manager = quotas(max_requests=100)
+    with manager.meter("client"):
+        manager.charge_text(100_000)  # 50 units.
+        record_usage(cpu_ms=30)  # 30 more units, measured after the fact.
+    assert manager.remaining("client") == pytest.approx(20, abs=1)
+    with pytest.raises(QuotaExceeded) as error:
+        with manager.meter("client"):
+            manager.charge_text(100_000)
+    assert error.value.retry_after >= 3
+
+
+@pytest.fixture(scope="module")
+def app():
+    return DetectionAPI()
+
+
+def request(client: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (client, 1234)})
+
+
+def test_forwarded_header_is_ignored_from_clients(app, monkeypatch):
+    monkeypatch.setattr(app, "trusted_proxies", [])
+    assert app.tenant(request("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+
+def test_forwarded_header_is_used_from_trusted_proxies(app, monkeypatch):
+    monkeypatch.setattr(app, "trusted_proxies", [ipaddress.ip_network("10.0.0.0/8")])
+    # The client can prepend addresses of its own, only the ones added by the trusted proxies count.
+    assert app.tenant(request("10.0.0.2", "1.1.1.1, 198.51.100.1, 10.0.0.1")) == "198.51.100.1"
+    assert app.tenant(request("10.0.0.2")) == "10.0.0.2"
@@ -0,0 +1,24 @@
+import io
+import random
+
+import pytest
+
+from conftest import make_photo, make_screenshot
+from core.ocr import clean_image
+
+
+def route(data: bytes) -> str:
+    return clean_image(io.BytesIO(data), preprocessing="auto")[1]
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_clean_screenshots_run_the_screenshot_pipeline(seed):
+    data, _ = make_screenshot(random.Random(seed), with_token=seed % 2 == 0)
+    assert route(data) == "screenshot"
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_photos_of_screens_run_the_photo_pipeline(seed):
+    rng = random.Random(seed)
+    data, _ = make_screenshot(rng, with_token=True)
+    assert route(make_photo(rng, data)) == "photo"
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import msgpack
+import pytest
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from src.app import DetectionAPI
+from src.stream import StreamIngress
+from utils.helpers import Config
+
+
+@pytest.fixture
+def ingress(monkeypatch):
+    monkeypatch.setattr(Config, "stream_rate", property(lambda self: 5.0))
+    return StreamIngress(DetectionAPI())
+
+
+@pytest.mark.parametrize(
+    "payload, status",
+    [
+        ({"id": 1, "type": "video", "url": "x"}, 400),
+        ({"id": 1, "type": "text"}, 422),
+        ({"id": 1, "type": "image", "url": ["x"]}, 422),
+        ({"id": 1, "type": "ocr", "url": "http://x", "timeout": "soon"}, 400),
+    ],
+)
+def test_invalid_frames_are_rejected(ingress, payload, status):
+    response = asyncio.run(ingress.handle(payload))
+    assert response["ok"] is False
+    assert response["error"]["status"] == status
+
+
+def test_scan_errors_are_not_reported_as_invalid_frames(ingress, monkeypatch):
+    async def scan_text(text):
+        raise ValueError("broken detector")
+
+    monkeypatch.setattr(ingress.app, "scan_text", scan_text)
+    response = asyncio.run(ingress.handle({"id": 7, "type": "text", "content": "hello"}))
+    assert response == {"id": 7, "ok": False, "error": {"status": 500, "detail": "Internal server error."}}
+
+
+def test_scans_are_paced_to_the_rate_of_the_connection(ingress):
+    app = FastAPI()
+
+    @app.websocket("/stream")
+    async def stream(websocket: WebSocket):
+        await ingress.run(websocket)
+
+    frames = b"".join(ingress.pack({"id": index, "type": "text", "content": "hello"}) for index in range(10))
+    with TestClient(app).websocket_connect("/stream") as websocket:
+        started = time.monotonic()
+        websocket.send_bytes(frames)
+        received = []
+        while len(received) < 10:
+            data = websocket.receive_bytes()
+            while data:
+                length = int.from_bytes(data[:4], "big")
+                received.append(msgpack.unpackb(data[4 : 4 + length]))
+                data = data[4 + length :]
+        elapsed = time.monotonic() - started
+
+    assert sorted(frame["id"] for frame in received) == list(range(10))
+    assert all(frame["ok"] for frame in received)
+    # A burst of 5 scans starts right away, the 5 others a fifth of a second apart.
+    assert 0.9 <= elapsed < 3
+
+
+def serve(ingress: StreamIngress) -> TestClient:
+    app = FastAPI()
+
+    @app.websocket("/stream")
+    async def stream(websocket: WebSocket):
+        await ingress.run(websocket)
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "headers, subprotocols",
+    [({"x-stream-token": "secret"}, None), ({}, ["stream", "token.secret"])],
+)
+def test_clients_pass_the_token_in_a_header_or_a_subprotocol(ingress, headers, subprotocols):
+    ingress.token = "secret"
+    with serve(ingress).websocket_connect("/stream", headers=headers, subprotocols=subprotocols) as websocket:
+        websocket.send_bytes(ingress.pack({"id": 1, "type": "text", "content": "hello"}))
+        assert msgpack.unpackb(websocket.receive_bytes()[4:])["ok"] is True
+        assert websocket.accepted_subprotocol == ("stream" if subprotocols else None)
+
+
+@pytest.mark.parametrize(
+    "url, headers", [("/stream", {}), ("/stream?token=secret", {}), ("/stream", {"x-stream-token": "secreT"})]
+)
+def test_clients_without_the_token_are_refused(ingress, url, headers):
+    ingress.token = "secret"
+    with pytest.raises(WebSocketDisconnect) as error:
+        with serve(ingress).websocket_connect(url, headers=headers):
+            pass
+    assert error.value.code == 1008
+
+
+def test_errors_of_the_writer_are_logged_and_end_the_stream(ingress, monkeypatch):
+    async def writer(websocket, results):
+        await results.get()
+        raise RuntimeError("broken socket")
+
+    errors = []
+    monkeypatch.setattr(ingress, "writer", writer)
+    monkeypatch.setattr(ingress.logger, "error", errors.append)
+    frame = ingress.pack({"id": 1, "type": "text", "content": "hello"})
+    with serve(ingress).websocket_connect("/stream") as websocket:
+        websocket.send_bytes(frame)
+        while not errors:
+            time.sleep(0.01)
+        websocket.send_bytes(frame)
+        with pytest.raises(WebSocketDisconnect) as error:
+            websocket.receive_bytes()
+    assert error.value.code == 1011
+    assert errors == ["Stopped sending results on a stream. Error: RuntimeError('broken socket')"]
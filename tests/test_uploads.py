@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi.exceptions import HTTPException
+from starlette.requests import Request
+
+from src.app import DetectionAPI
+from utils.helpers import Config
+
+MAX_SIZE = 1024
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(Config, "max_upload_size", property(lambda self: MAX_SIZE))
+    return DetectionAPI()
+
+
+def request(chunks, content_type: str = "application/octet-stream"):
+    """
+    Builds a chunked request, without a Content-Length header, and a list of the chunks it received.
+    """
+    received = []
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        message = messages.pop(0)
+        received.append(message["body"])
+        return message
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", content_type.encode())]}
+    return Request(scope, receive), received
+
+
+def multipart(data: bytes, boundary: str = "boundary") -> bytes:
+    return (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode()
+        + data
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+
+def test_raw_upload_is_read(app):
+    upload, _ = request([b"a" * 512, b"b" * 512])
+    assert asyncio.run(app.read_upload(upload)).getvalue() == b"a" * 512 + b"b" * 512
+
+
+def test_chunked_raw_upload_stops_at_the_limit(app):
+    upload, received = request([b"a" * 512] * 100)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(app.read_upload(upload))
+    assert error.value.status_code == 413
+    assert len(received) == 3
+
+
+def test_multipart_upload_is_read(app):
+    upload, _ = request([multipart(b"png" * 100)], "multipart/form-data; boundary=boundary")
+    assert asyncio.run(app.read_upload(upload)).getvalue() == b"png" * 100
+
+
+def test_chunked_multipart_upload_stops_before_parsing_the_body(app):
+    body = multipart(b"a" * 1024 * 1024)
+    chunks = [body[index:index + 4096] for index in range(0, len(body), 4096)]
+    upload, received = request(chunks, "multipart/form-data; boundary=boundary")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(app.read_upload(upload))
+    assert error.value.status_code == 413
+    # The multipart allowance is 64 KiB past the maximum upload size, the rest of the body is never received.
+    assert sum(map(len, received)) <= MAX_SIZE + 65536 + 4096
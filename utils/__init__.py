@@ -2,3 +2,12 @@ from .helpers import *
 from .exceptions import *
 from .models import *
 from .server import *
+from .deadline import *
+from .concurrency import *
+from .lanes import *
+from .profiling import *
+from .logs import *
+from .fetcher import *
+from .pool import *
+from .quotas import *
+from .assets import *
@@ -0,0 +1,296 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import stat as stat_module
+import time
+import typing
+from email.utils import formatdate
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, assets are only compressed with gzip without it.
+    brotli = None
+
+__all__ = (
+    "AssetCache",
+    "StaticAsset",
+)
+
+# Media types worth compressing, images and fonts are already compressed.
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class StaticAsset:
+    """
+    A class that represents a static file kept in memory, along with its compressed variants.
+    Files too large to be kept in memory only carry their metadata, and are sent from the disk.
+    """
+
+    __slots__ = ("path", "mtime", "size", "media_type", "etag", "last_modified", "variants", "checked_at")
+
+    def __init__(
+        self,
+        path: str,
+        mtime: int,
+        size: int,
+        media_type: str,
+        etag: str,
+        variants: typing.Optional[typing.Dict[str, bytes]],
+    ):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.media_type = media_type
+        self.etag = etag
+        self.last_modified = formatdate(mtime / 1e9, usegmt=True)
+        self.variants = variants
+        self.checked_at = time.monotonic()
+
+    @property
+    def in_memory(self) -> bool:
+        """
+        This property returns whether the file is kept in memory.
+
+        Returns:
+            (bool): True if the file is kept in memory, False if it is sent from the disk.
+        """
+        return self.variants is not None
+
+    def tag(self, encoding: str) -> str:
+        """
+        This method returns the entity tag of a variant of the file, every encoding has its own tag.
+
+        Parameters:
+            encoding (str): This parameter takes the content encoding of the variant.
+
+        Returns:
+            (str): The quoted entity tag.
+        """
+        if encoding == "identity":
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{encoding}"'
+
+    def __repr__(self):
+        encodings = ",".join(self.variants) if self.variants is not None else "disk"
+        return f"<{self.__class__.__name__} {self.path} size={self.size} variants={encodings}>"
+
+
+class AssetCache:
+    """
+    A class that serves the files of a static directory from memory. Every file is read and compressed once, with
+    gzip, and with brotli if it is installed, and is read again only when its modification time changes, which is
+    checked at most once every `check_interval` seconds, so that serving a file does not touch the disk. Responses
+    carry an entity tag, and requests that send back a matching `If-None-Match` header get an empty 304 response.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        check_interval: float,
+        max_file_size: int,
+        min_compress_size: int,
+    ):
+        self.directory = os.path.realpath(directory)
+        self.check_interval = check_interval
+        self.max_file_size = max_file_size
+        self.min_compress_size = min_compress_size
+        self.assets: typing.Dict[str, StaticAsset] = {}
+        self._loading: typing.Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.loads = 0
+        self.not_modified = 0
+
+    def resolve(self, path: str) -> typing.Optional[str]:
+        """
+        This method returns the path of a file of the static directory on the disk.
+
+        Parameters:
+            path (str): This parameter takes the path of the file, relative to the static directory.
+
+        Returns:
+            (typing.Optional[str]): The absolute path of the file, or None if it is outside of the static directory.
+        """
+        full_path = os.path.realpath(os.path.join(self.directory, path))
+        if not full_path.startswith(self.directory + os.sep):
+            return None
+        return full_path
+
+    def _load(self, path: str, full_path: str, stat: os.stat_result) -> StaticAsset:
+        # Runs in an executor, as reading and compressing the file blocks.
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if stat.st_size > self.max_file_size:
+            etag = hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()[:20]
+            return StaticAsset(path, stat.st_mtime_ns, stat.st_size, media_type, etag, None)
+
+        with open(full_path, "rb") as f:
+            body = f.read()
+        variants = {"identity": body}
+        if len(body) >= self.min_compress_size and media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            # A variant that is not smaller than the file is never worth sending.
+            variants.update((encoding, data) for encoding, data in compressed.items() if len(data) < len(body))
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        return StaticAsset(path, stat.st_mtime_ns, len(body), media_type, etag, variants)
+
+    async def get(self, path: str) -> typing.Optional[StaticAsset]:
+        """
+        |coroutine|
+        This method returns a file of the static directory, reading it again if it changed on the disk.
+        Concurrent requests for a file that is being read wait for the same read. Paths that are not normalized,
+        such as `./index.html` or `css/../index.html`, are not served, so that a file is never cached twice.
+
+        Parameters:
+            path (str): This parameter takes the path of the file, relative to the static directory.
+
+        Returns:
+            (typing.Optional[StaticAsset]): The file, or None if it does not exist.
+        """
+        if not path or posixpath.normpath(path) != path:
+            return None
+        asset = self.assets.get(path)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked_at < self.check_interval:
+            self.hits += 1
+            return asset
+
+        full_path = self.resolve(path)
+        try:
+            stat = os.stat(full_path) if full_path is not None else None
+        except OSError:
+            stat = None
+        if stat is None or not stat_module.S_ISREG(stat.st_mode):
+            self.assets.pop(path, None)
+            return None
+        if asset is not None and asset.mtime == stat.st_mtime_ns and asset.size == stat.st_size:
+            asset.checked_at = now
+            self.hits += 1
+            return asset
+
+        future = self._loading.get(path)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = self._loading[path] = loop.run_in_executor(None, self._load, path, full_path, stat)
+            future.add_done_callback(lambda _: self._loading.pop(path, None))
+            self.loads += 1
+        try:
+            asset = await asyncio.shield(future)
+        except OSError:
+            # The file was removed between the check and the read.
+            self.assets.pop(path, None)
+            return None
+        self.assets[path] = asset
+        return asset
+
+    @staticmethod
+    def accepted_encodings(request: Request) -> typing.Set[str]:
+        """
+        This method returns the content encodings the client accepts, from its `Accept-Encoding` header.
+
+        Parameters:
+            request (Request): This parameter takes the request.
+
+        Returns:
+            (typing.Set[str]): The accepted encodings, without the ones the client refused with a quality of 0.
+        """
+        encodings = set()
+        for item in request.headers.get("accept-encoding", "").split(","):
+            encoding, _, parameters = item.partition(";")
+            encoding = encoding.strip().lower()
+            quality = parameters.strip()
+            if quality.startswith("q="):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            if encoding:
+                encodings.add(encoding)
+        return encodings
+
+    async def response(self, request: Request, path: str, max_age: int) -> typing.Optional[Response]:
+        """
+        |coroutine|
+        This method builds the response for a file of the static directory, in the smallest encoding the client
+        accepts, or an empty 304 response if the client already has the file.
+
+        Parameters:
+            request (Request): This parameter takes the request.
+
+            path (str): This parameter takes the path of the file, relative to the static directory.
+
+            max_age (int): This parameter takes the number of seconds clients may cache the file for without asking
+                           for it again, 0 makes them revalidate it on every use.
+
+        Returns:
+            (typing.Optional[Response]): The response, or None if the file does not exist.
+        """
+        asset = await self.get(path)
+        if asset is None:
+            return None
+
+        encoding = "identity"
+        if asset.in_memory:
+            accepted = self.accepted_encodings(request)
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and (candidate in accepted or "*" in accepted):
+                    encoding = candidate
+                    break
+
+        headers = {
+            "etag": asset.tag(encoding),
+            "last-modified": asset.last_modified,
+            "cache-control": f"public, max-age={max_age}" if max_age > 0 else "no-cache",
+        }
+        if asset.in_memory and len(asset.variants) > 1:
+            headers["vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip() for tag in if_none_match.split(",")}
+            # Weak tags match too, as a 304 response only needs the file to be equivalent.
+            tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+            if "*" in tags or tags & {asset.tag(variant) for variant in (asset.variants or ("identity",))}:
+                self.not_modified += 1
+                return Response(status_code=304, headers=headers)
+
+        if not asset.in_memory:
+            return FileResponse(self.resolve(path), media_type=asset.media_type, headers=headers)
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        return Response(content=asset.variants[encoding], media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> dict:
+        """
+        This method returns the metrics of the cache.
+
+        Returns:
+            (dict): The number of files and the bytes kept in memory, the number of requests served from memory, of
+                    files read from the disk, and of 304 responses, and whether brotli is available.
+        """
+        return {
+            "files": len(self.assets),
+            "bytes": sum(
+                len(data) for asset in self.assets.values() if asset.in_memory for data in asset.variants.values()
+            ),
+            "hits": self.hits,
+            "loads": self.loads,
+            "not_modified": self.not_modified,
+            "brotli": brotli is not None,
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.directory} files={len(self.assets)}>"
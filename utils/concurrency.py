@@ -0,0 +1,177 @@
+import asyncio
+import contextlib
+import math
+import time
+import typing
+from collections import deque
+
+from utils.exceptions import DeadlineExceeded, Overloaded
+
+__all__ = ("AdaptiveLimiter",)
+
+
+class AdaptiveLimiter:
+    """
+    A class that limits how many expensive jobs run at once, and adapts the limit to the latency it observes, using
+    additive increase and multiplicative decrease (AIMD). While jobs finish faster than the target latency, the limit
+    grows by about one job per limit's worth of jobs. As soon as a job is slower than the target, or runs out of time,
+    the limit shrinks by a constant factor.
+
+    Jobs over the limit wait in a short queue. When the queue is full, or a job waits longer than the queue timeout,
+    the job is shed with :class:`Overloaded`, so that the jobs that are admitted still finish in time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        queue_timeout: float,
+        max_queue: int,
+        backoff: float = 0.9,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiters: typing.Deque[asyncio.Future] = deque()
+        self.latency = target_latency  # Exponentially weighted moving average of the observed latency.
+        self.admitted = 0
+        self.shed = 0
+
+    @property
+    def retry_after(self) -> int:
+        """
+        This property returns the number of seconds a shed client should wait before it tries again, which is about
+        the time it takes for the jobs in flight and in the queue to finish.
+        """
+        backlog = (self.in_flight + len(self.waiters)) / max(self.limit, 1.0)
+        return max(1, math.ceil(backlog * self.latency))
+
+    def admit(self) -> None:
+        """
+        This method sheds a job right away if the queue is already full, so that callers can avoid doing work, such
+        as downloading an image, for a job that would be shed anyway.
+
+        Raises:
+            (Overloaded): If the queue is full.
+        """
+        if self.in_flight >= int(self.limit) and len(self.waiters) >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(self.name, self.retry_after)
+
+    async def acquire(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        |coroutine|
+        This method waits for a free slot.
+
+        Parameters:
+            timeout (typing.Optional[float]): This parameter takes the longest time to wait in the queue, the queue
+                                              timeout is used if it is not given or longer.
+
+        Raises:
+            (Overloaded): If the queue is full, or no slot became free in time.
+        """
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        self.admit()
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except BaseException as e:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as this job gave up waiting, so it is passed on to the next one.
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                raise Overloaded(self.name, self.retry_after)
+            raise
+        # The slot was already counted as in flight by :meth:`release` when it woke this waiter.
+        self.admitted += 1
+
+    def release(self, latency: typing.Optional[float] = None, overloaded: bool = False) -> None:
+        """
+        This method frees a slot, adapts the limit to the latency of the job, and wakes up waiting jobs for every
+        free slot.
+
+        Parameters:
+            latency (typing.Optional[float]): This parameter takes the time the job took in seconds, or None if the
+                                              job should not change the limit.
+
+            overloaded (bool): This parameter takes True if the job ran out of time, which always shrinks the limit.
+        """
+        self.in_flight -= 1
+        if overloaded or (latency is not None and latency > self.target_latency):
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        elif latency is not None:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        if latency is not None:
+            self.latency = 0.9 * self.latency + 0.1 * latency
+
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, timeout: typing.Optional[float] = None) -> typing.AsyncIterator[None]:
+        """
+        |coroutine|
+        This method waits for a free slot, and frees it again when the job is done. The time the job takes is used to
+        adapt the limit, the time it waited in the queue is not.
+
+        Parameters:
+            timeout (typing.Optional[float]): This parameter takes the longest time to wait in the queue.
+
+        Raises:
+            (Overloaded): If the queue is full, or no slot became free in time.
+        """
+        await self.acquire(timeout=timeout)
+        started = time.monotonic()
+        try:
+            yield
+        except DeadlineExceeded:
+            self.release(latency=time.monotonic() - started, overloaded=True)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.release(latency=time.monotonic() - started)
+
+    def stats(self) -> dict:
+        """
+        This method returns the current state of the limiter.
+
+        Returns:
+            (dict): The limit, the jobs in flight and in the queue, the average latency, and the number of jobs
+                    that were admitted and shed.
+        """
+        return {
+            "name": self.name,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "latency": round(self.latency, 4),
+            "target_latency": self.target_latency,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name} limit={self.limit:.2f} in_flight={self.in_flight}>"
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+import typing
+
+from utils.exceptions import ClientDisconnected, DeadlineExceeded
+
+__all__ = ("Deadline",)
+
+
+class Deadline:
+    """
+    A class that represents the time budget of a request. The stages of the image pipeline check it before they start,
+    and the work of a stage is abandoned as soon as the budget runs out or the client disconnects. Work that was
+    abandoned is marked as cancelled, so that executor jobs which have not started yet are dropped, and running
+    Tesseract processes are killed.
+    """
+
+    def __init__(self, timeout: float, request=None, poll_interval: float = 0.25):
+        self.timeout = timeout
+        self.request = request
+        self.poll_interval = poll_interval
+        self.expires_at = time.monotonic() + timeout
+        self.cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """
+        This method returns the number of seconds left in the budget.
+
+        Returns:
+            (float): The seconds left, or 0 if the deadline has passed.
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """
+        This property returns True if the deadline has passed or the work was cancelled.
+        """
+        return self.cancelled.is_set() or time.monotonic() >= self.expires_at
+
+    def raise_if_expired(self, stage: str) -> None:
+        """
+        This method raises if the deadline has passed. It can be called from executor threads.
+
+        Parameters:
+            stage (str): This parameter takes the name of the stage that is about to start.
+
+        Raises:
+            (DeadlineExceeded): If the deadline has passed or the work was cancelled.
+        """
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    async def check(self, stage: str) -> None:
+        """
+        |coroutine|
+        This method raises if the deadline has passed or the client has disconnected.
+
+        Parameters:
+            stage (str): This parameter takes the name of the stage that is about to start.
+
+        Raises:
+            (DeadlineExceeded): If the deadline has passed.
+            (ClientDisconnected): If the client has disconnected.
+        """
+        self.raise_if_expired(stage)
+        if self.request is not None and await self.request.is_disconnected():
+            self.cancelled.set()
+            raise ClientDisconnected(stage)
+
+    async def run(self, awaitable: typing.Awaitable, stage: str) -> typing.Any:
+        """
+        |coroutine|
+        This method runs a stage of the pipeline within the budget. The client is polled for a disconnect while the
+        stage runs, and if the stage does not finish in time, it is cancelled.
+
+        Parameters:
+            awaitable (typing.Awaitable): This parameter takes the work of the stage.
+
+            stage (str): This parameter takes the name of the stage.
+
+        Returns:
+            (typing.Any): The result of the stage.
+
+        Raises:
+            (DeadlineExceeded): If the deadline passed before the stage finished.
+            (ClientDisconnected): If the client disconnected before the stage finished.
+        """
+        await self.check(stage)
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {task}, timeout=min(self.poll_interval, self.remaining())
+                )
+                if done:
+                    return task.result()
+                await self.check(stage)
+        finally:
+            if not task.done():
+                # Cancelling the task drops executor jobs that have not started yet, and the event tells jobs that
+                # already started to stop.
+                self.cancelled.set()
+                task.cancel()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} remaining={self.remaining():.3f}>"
@@ -1,3 +1,6 @@
+import typing
+
+
 class InvalidImage(Exception):
     """
     Exception raised when the url of the image is invalid.
@@ -12,3 +15,83 @@ class InvalidUrl(Exception):
     """
 
     pass
+
+
+class DeadlineExceeded(Exception):
+    """
+    Exception raised when the time budget of a request runs out before a stage of the pipeline finishes.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Request deadline exceeded during the {stage} stage.")
+
+
+class ClientDisconnected(Exception):
+    """
+    Exception raised when the client disconnects before a stage of the pipeline finishes.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Client disconnected during the {stage} stage.")
+
+
+class Overloaded(Exception):
+    """
+    Exception raised when a job is shed because too many expensive jobs are already running or waiting.
+    """
+
+    def __init__(self, name: str, retry_after: int):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"The {name} capacity of the server is exhausted, retry after {retry_after} seconds.")
+
+
+class JobFailed(Exception):
+    """
+    Exception raised when an OCR worker failed to read the image of a job.
+    """
+
+    def __init__(self, job_id: str, detail: str):
+        self.job_id = job_id
+        self.detail = detail
+        super().__init__(f"OCR job {job_id} failed. Error: {detail}")
+
+
+class DownloadFailed(Exception):
+    """
+    Exception raised when an image could not be downloaded, because the host answered with an error, did not answer
+    in time, or could not be reached.
+    """
+
+    def __init__(self, url: str, status: typing.Optional[int] = None, reason: str = "status"):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        detail = f"status {status}" if status is not None else reason
+        super().__init__(f"Image could not be downloaded from {url}, {detail}.")
+
+
+class HostUnavailable(Exception):
+    """
+    Exception raised when an image is not downloaded, because its host failed too often recently.
+    """
+
+    def __init__(self, host: str, retry_after: int):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(
+            f"Downloads from {host} are paused after repeated failures, retry after {retry_after} seconds."
+        )
+
+
+class QuotaExceeded(Exception):
+    """
+    Exception raised when a client has spent its budget of work, and has to wait for it to refill.
+    """
+
+    def __init__(self, tenant: str, retry_after: int):
+        self.tenant = tenant
+        self.retry_after = retry_after
+        super().__init__(f"The quota of {tenant} is exhausted, retry after {retry_after} seconds.")
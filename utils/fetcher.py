@@ -0,0 +1,389 @@
+import asyncio
+import math
+import time
+import typing
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.exceptions import DownloadFailed, HostUnavailable
+from utils.logs import log_event
+
+__all__ = (
+    "CircuitBreaker",
+    "ImageFetcher",
+    "NegativeCache",
+)
+
+
+class NegativeCache:
+    """
+    A class that remembers the urls images could not be downloaded from, for a short time to live, so that retries of
+    a dead url fail right away instead of asking the host again. Urls are kept in the order they failed in, and the
+    oldest ones are evicted first when the cache is full.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, typing.Tuple[float, DownloadFailed]]" = OrderedDict()
+        self.hits = 0
+
+    def evict_expired(self) -> int:
+        """
+        This method removes every url whose time to live has passed.
+
+        Returns:
+            (int): The number of urls that were evicted.
+        """
+        now = time.monotonic()
+        evicted = 0
+        while self._entries:
+            expires_at, _ = next(iter(self._entries.values()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def get(self, url: str) -> typing.Optional[DownloadFailed]:
+        """
+        This method returns the error an url failed with, if it failed recently.
+
+        Parameters:
+            url (str): This parameter takes the url of the image.
+
+        Returns:
+            (typing.Optional[DownloadFailed]): The error, or None if the url did not fail within the time to live.
+        """
+        self.evict_expired()
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def add(self, error: DownloadFailed) -> None:
+        """
+        This method remembers that an url failed.
+
+        Parameters:
+            error (DownloadFailed): This parameter takes the error the url failed with.
+        """
+        self._entries.pop(error.url, None)
+        self._entries[error.url] = (time.monotonic() + self.ttl, error)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} entries={len(self._entries)}/{self.max_entries} ttl={self.ttl}>"
+
+
+class CircuitBreaker:
+    """
+    A class that stops requests to a host after it failed a number of times in a row. The breaker is closed while the
+    host works, and opens after the failure threshold is reached, failing every request right away. Once the reset
+    timeout has passed, it is half-open, and lets a single probe through: if the probe succeeds the breaker closes,
+    otherwise it opens again for another reset timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> str:
+        """
+        This property returns the state of the breaker, "closed", "open" or "half_open".
+        """
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_after(self) -> int:
+        """
+        This property returns the number of seconds until the breaker lets a probe through.
+        """
+        return max(1, math.ceil(self.opened_at + self.reset_timeout - time.monotonic()))
+
+    def allow(self) -> bool:
+        """
+        This method checks if a request can be made. In the half-open state, only the first request is let through,
+        as the probe, until its outcome is recorded.
+
+        Returns:
+            (bool): True if the request can be made.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """
+        This method records a request that succeeded, which closes the breaker.
+        """
+        self.failures = 0
+        self.probing = False
+        self._state = self.CLOSED
+
+    def record_failure(self) -> bool:
+        """
+        This method records a request that failed, which opens the breaker if the probe failed, or if the host failed
+        too many times in a row.
+
+        Returns:
+            (bool): True if the breaker was opened by this failure.
+        """
+        self.failures += 1
+        if self.probing or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.probing = False
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def release(self) -> None:
+        """
+        This method gives up the probe without an outcome, such as when the request was cancelled, so that the next
+        request probes the host instead.
+        """
+        self.probing = False
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} state={self.state} failures={self.failures}>"
+
+
+class ImageFetcher:
+    """
+    A class that downloads images through a single shared :class:`aiohttp.ClientSession`, so that connections to the
+    same host are reused. Hosts that fail repeatedly, by answering with a server error, not answering in time, or not
+    accepting connections, are cut off by a :class:`CircuitBreaker` per host, and urls that failed are remembered in a
+    :class:`NegativeCache`, so failing hosts do not hold up requests. Images are read in chunks, and downloads larger
+    than the maximum size are abandoned as soon as they grow past it.
+    """
+
+    def __init__(
+        self,
+        negative_ttl: float,
+        negative_max_entries: int,
+        failure_threshold: int,
+        reset_timeout: float,
+        connect_timeout: float,
+        read_timeout: float,
+        max_size: int,
+        max_hosts: int = 1024,
+    ):
+        self.negative_cache = NegativeCache(ttl=negative_ttl, max_entries=negative_max_entries)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_size = max_size
+        self.max_hosts = max_hosts
+        self.breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self.session: typing.Optional[aiohttp.ClientSession] = None
+        self.downloads = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        """
+        This method returns the circuit breaker of a host, creating it if needed. The breakers of the least recently
+        used hosts are dropped when there are too many of them.
+
+        Parameters:
+            host (str): This parameter takes the host name.
+
+        Returns:
+            (CircuitBreaker): The circuit breaker of the host.
+        """
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            while len(self.breakers) > self.max_hosts:
+                self.breakers.popitem(last=False)
+        else:
+            self.breakers.move_to_end(host)
+        return breaker
+
+    @staticmethod
+    def host(url: str) -> str:
+        """
+        This method returns the host of an url, along with its port if it has one, which is what breakers are kept
+        per.
+
+        Raises:
+            (aiohttp.InvalidURL): If the url has no host, or an invalid port.
+        """
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
+            raise aiohttp.InvalidURL(url)
+        if not parts.hostname:
+            raise aiohttp.InvalidURL(url)
+        return f"{parts.hostname}:{port}" if port else parts.hostname
+
+    def _session(self) -> aiohttp.ClientSession:
+        # The session is created on first use, so that it belongs to the event loop the server runs on.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        return self.session
+
+    async def _read(self, url: str, response: aiohttp.ClientResponse) -> BytesIO:
+        if response.content_length is not None and response.content_length > self.max_size:
+            raise DownloadFailed(url, reason="too large")
+        data = BytesIO()
+        async for chunk in response.content.iter_chunked(65536):
+            data.write(chunk)
+            if data.tell() > self.max_size:
+                raise DownloadFailed(url, reason="too large")
+        data.seek(0)
+        return data
+
+    async def fetch(self, url: str, timeout: typing.Optional[float] = None) -> BytesIO:
+        """
+        |coroutine|
+        This method downloads an image, unless the url failed recently or its host is cut off.
+
+        Parameters:
+            url (str): This parameter takes the url of the image.
+
+            timeout (typing.Optional[float]): This parameter takes the number of seconds the whole download can take,
+                                              which should end before the deadline of the request, so that a host
+                                              that sends the image too slowly counts against its breaker. A host is
+                                              only blamed for it if it had at least the read timeout, so that clients
+                                              asking for short deadlines cannot cut off a host.
+
+        Returns:
+            (BytesIO): The downloaded image as a BytesIO object.
+
+        Raises:
+            (aiohttp.InvalidURL): If the url is not a valid url.
+            (DownloadFailed): If the host answered with an error, did not answer in time, could not be reached, or
+                              sent an image larger than the maximum size, now or within the time to live of the
+                              negative cache.
+            (HostUnavailable): If the host failed too many times in a row recently.
+        """
+        host = self.host(url)
+        cached = self.negative_cache.get(url)
+        if cached is not None:
+            # A new error is raised every time, as raising the cached one again would grow its traceback.
+            raise DownloadFailed(cached.url, status=cached.status, reason=cached.reason)
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self.rejected += 1
+            raise HostUnavailable(host, breaker.retry_after)
+
+        self.downloads += 1
+        request_timeout = self.timeout
+        if timeout is not None:
+            # A total of 0 would disable the timeout altogether.
+            request_timeout = aiohttp.ClientTimeout(
+                total=max(timeout, 0.001), sock_connect=self.connect_timeout, sock_read=self.read_timeout
+            )
+        try:
+            async with self._session().get(url, timeout=request_timeout) as response:
+                if response.status != 200:
+                    raise DownloadFailed(url, status=response.status)
+                data = await self._read(url, response)
+        except DownloadFailed as e:
+            # Only server errors say something about the host, a missing or oversized image does not.
+            self._failed(e, breaker, host_failed=e.status is not None and e.status >= 500)
+            raise
+        except asyncio.TimeoutError:
+            error = DownloadFailed(url, reason="timeout")
+            host_failed = timeout is None or timeout >= self.read_timeout
+            # A deadline shorter than the read timeout is the choice of the client, not a fault of the url.
+            self._failed(error, breaker, host_failed=host_failed, cache=host_failed)
+            raise error from None
+        except aiohttp.InvalidURL:
+            breaker.release()
+            raise
+        except aiohttp.ClientError as e:
+            error = DownloadFailed(url, reason=f"connection error: {e.__class__.__name__}")
+            self._failed(error, breaker, host_failed=True)
+            raise error from None
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return data
+
+    def _failed(self, error: DownloadFailed, breaker: CircuitBreaker, host_failed: bool, cache: bool = True) -> None:
+        self.failed += 1
+        if cache:
+            self.negative_cache.add(error)
+        log_event(
+            "download_failed",
+            "WARNING",
+            "Image could not be downloaded. Error: {error}",
+            error=str(error),
+            url=error.url,
+            status=error.status,
+        )
+        if not host_failed:
+            # The host answered, so it is up, even if the image is missing.
+            breaker.record_success()
+            return
+        if breaker.record_failure():
+            log_event(
+                "circuit_opened",
+                "WARNING",
+                "Downloads from {host} are paused for {seconds} seconds after {failures} failures in a row.",
+                host=self.host(error.url),
+                seconds=breaker.reset_timeout,
+                failures=breaker.failures,
+            )
+
+    async def close(self) -> None:
+        """
+        |coroutine|
+        This method closes the shared session.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def stats(self) -> dict:
+        """
+        This method returns the counters of the fetcher, and the hosts whose breaker is not closed.
+
+        Returns:
+            (dict): The number of downloads, failed downloads, downloads rejected by a breaker and by the negative
+                    cache, the size of the negative cache, and the state of every breaker that is open or half-open.
+        """
+        return {
+            "downloads": self.downloads,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "negative_cache_hits": self.negative_cache.hits,
+            "negative_cache_size": len(self.negative_cache),
+            "open_hosts": {
+                host: breaker.state
+                for host, breaker in self.breakers.items()
+                if breaker.state != CircuitBreaker.CLOSED
+            },
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} hosts={len(self.breakers)} cached={len(self.negative_cache)}>"
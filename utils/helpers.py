@@ -1,16 +1,24 @@
 import asyncio
 import functools
+import ipaddress
+import os
 import sys
 import typing
 
 import yaml
 from loguru import logger
 
+# core.reader imports utils, so CleanImage is looked up when a profile is validated, not when this module is imported.
+import core.reader
+from utils.lanes import get_lane
+
 __all__ = (
     "Config",
     "executor_function",
 )
 
+IPNetwork = typing.Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
 
 class Config:
     """
@@ -160,22 +168,975 @@ class Config:
             sys.exit(1)
         return data
 
+    @property
+    def session_ttl(self) -> typing.Optional[int]:
+        """
+        This property returns the number of seconds an incremental scan session can be inactive before it is evicted,
+        defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The time to live of scan sessions in seconds.
+        """
+        data = self.data["Sessions"]["ttl"]
+        if data is None:
+            self.logger.error("Session ttl was not set in config.yml")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def session_limit(self) -> typing.Optional[int]:
+        """
+        This property returns the maximum number of incremental scan sessions that are kept in memory at once,
+        defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum number of scan sessions.
+        """
+        data = self.data["Sessions"]["max_sessions"]
+        if data is None:
+            self.logger.error("Maximum number of sessions was not set in config.yml")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def fingerprint_salt(self) -> typing.Optional[str]:
+        """
+        This property returns the salt used to hash the fingerprints of detected tokens, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The fingerprint salt, or None if a random salt should be used.
+        """
+        data = self.data["Fingerprints"]["salt"]
+        if not data:
+            return None
+        return str(data)
+
+    @property
+    def fingerprint_capacity(self) -> typing.Optional[int]:
+        """
+        This property returns the number of fingerprints the in-memory Bloom filter is sized for, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The capacity of the Bloom filter.
+        """
+        data = self.data["Fingerprints"]["capacity"]
+        if data is None:
+            self.logger.error("Fingerprint capacity was not set in config.yml")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def fingerprint_exact_capacity(self) -> typing.Optional[int]:
+        """
+        This property returns the number of recently detected fingerprints kept in an exact in-memory set, which
+        confirms the hits of the Bloom filter, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The capacity of the exact set of fingerprints.
+        """
+        data = self.data["Fingerprints"]["exact_capacity"]
+        if data is None:
+            self.logger.error("Fingerprint exact capacity was not set in config.yml")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def fingerprint_error_rate(self) -> typing.Optional[float]:
+        """
+        This property returns the false positive rate the in-memory Bloom filter is sized for, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The false positive rate of the Bloom filter.
+        """
+        data = self.data["Fingerprints"]["error_rate"]
+        if data is None or not 0 < float(data) < 1:
+            self.logger.error(
+                "Fingerprint error rate in config.yml must be a number between 0 and 1."
+            )
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def fingerprint_skip_known(self) -> typing.Optional[bool]:
+        """
+        This property returns the state of the setting that skips the validation of already reported tokens in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[bool]): True if known tokens are not validated again, False otherwise.
+        """
+        mode = self.data["Fingerprints"]["skip_known"]
+        if mode is not True and mode is not False:
+            self.logger.error(
+                "Invalid choice for skip_known in the config.yml file. Accepted values are 'on' or 'off'."
+            )
+            sys.exit(1)
+        return mode
+
+    @property
+    def fingerprint_redis(self) -> typing.Optional[bool]:
+        """
+        This property returns the state of the setting that shares token fingerprints through redis in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[bool]): True if fingerprints are stored in redis, False otherwise.
+        """
+        mode = self.data["Fingerprints"]["redis"]
+        if mode is not True and mode is not False:
+            self.logger.error(
+                "Invalid choice for fingerprint redis mode in the config.yml file. Accepted values are 'on' or 'off'."
+            )
+            sys.exit(1)
+        return mode
+
+    @property
+    def max_upload_size(self) -> typing.Optional[int]:
+        """
+        This property returns the maximum size of an uploaded image in bytes, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum upload size in bytes.
+        """
+        data = self.data["Images"]["max_upload_size"]
+        if data is None or int(data) < 1:
+            self.logger.error("Images max_upload_size in config.yml must be a positive number.")
+            sys.exit(1)
+        return int(data)
+
+    def _download_setting(self, key: str, minimum: float) -> float:
+        data = self.data["Downloads"][key]
+        if data is None or float(data) < minimum:
+            self.logger.error(f"Downloads {key} in config.yml must be a number of at least {minimum}.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def download_connect_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds to wait for an image host to accept a connection, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The connect timeout in seconds.
+        """
+        return self._download_setting("connect_timeout", 0.1)
+
+    @property
+    def download_read_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds to wait for an image host to send the next part of an image,
+        defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The read timeout in seconds.
+        """
+        return self._download_setting("read_timeout", 0.1)
+
+    @property
+    def download_negative_ttl(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds an url that failed to download is remembered, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The time to live of the negative cache in seconds.
+        """
+        return self._download_setting("negative_ttl", 0)
+
+    @property
+    def download_negative_max_entries(self) -> typing.Optional[int]:
+        """
+        This property returns the number of failed urls that are remembered, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum size of the negative cache.
+        """
+        return int(self._download_setting("negative_max_entries", 1))
+
+    @property
+    def download_failure_threshold(self) -> typing.Optional[int]:
+        """
+        This property returns the number of failures in a row after which downloads from a host are paused, defined
+        in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The failure threshold of the circuit breakers.
+        """
+        return int(self._download_setting("failure_threshold", 1))
+
+    @property
+    def download_reset_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds downloads from a failing host are paused for, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The reset timeout of the circuit breakers in seconds.
+        """
+        return self._download_setting("reset_timeout", 0.1)
+
+    @property
+    def ocr_profiles(self) -> typing.Optional[typing.Dict[str, dict]]:
+        """
+        This property returns the OCR profiles, the settings of Tesseract OCR engine and the preprocessing variant
+        of every profile by its name, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[typing.Dict[str, dict]]): The settings of every profile.
+        """
+        data = self.data["OCR"]["profiles"]
+        if not isinstance(data, dict) or not data:
+            self.logger.error("OCR profiles in config.yml must define at least one profile.")
+            sys.exit(1)
+
+        profiles = {}
+        for name, settings in data.items():
+            settings = dict(settings or {})
+            unknown = set(settings) - {"lang", "oem", "psm", "whitelist", "tessdata_dir", "preprocessing"}
+            if unknown:
+                self.logger.error(
+                    f"OCR profile {name} in config.yml has unknown settings: {', '.join(sorted(unknown))}."
+                )
+                sys.exit(1)
+            if settings.get("preprocessing", "default") not in core.reader.CleanImage.PREPROCESSING:
+                self.logger.error(
+                    f"OCR profile {name} in config.yml must use one of the "
+                    f"{', '.join(core.reader.CleanImage.PREPROCESSING)} preprocessing variants."
+                )
+                sys.exit(1)
+            for key in ("oem", "psm"):
+                if settings.get(key) is not None and not str(settings[key]).isdigit():
+                    self.logger.error(f"OCR profile {name} in config.yml must have a whole number as {key}.")
+                    sys.exit(1)
+                if settings.get(key) is not None:
+                    settings[key] = int(settings[key])
+            profiles[str(name)] = settings
+        return profiles
+
+    @property
+    def ocr_profile(self) -> typing.Optional[str]:
+        """
+        This property returns the name of the OCR profile images are read with, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The name of the profile.
+        """
+        data = self.data["OCR"]["profile"]
+        if data not in self.ocr_profiles:
+            self.logger.error(f"OCR profile {data} in config.yml is not defined in the OCR profiles.")
+            sys.exit(1)
+        return str(data)
+
+    @property
+    def request_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the default number of seconds an image request can take, from downloading the image to
+        parsing the text read from it, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The default request timeout in seconds.
+        """
+        data = self.data["Deadlines"]["default_timeout"]
+        if data is None or float(data) <= 0:
+            self.logger.error("Deadlines default_timeout in config.yml must be a positive number.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def max_request_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the longest timeout a client can ask for with the X-Request-Timeout header, defined in
+        the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The maximum request timeout in seconds.
+        """
+        data = self.data["Deadlines"]["max_timeout"]
+        if data is None or float(data) <= 0:
+            self.logger.error("Deadlines max_timeout in config.yml must be a positive number.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def quotas_enabled(self) -> typing.Optional[bool]:
+        """
+        This property returns True if clients are charged by the work their requests take, defined in the config.yml
+        file.
+
+        Returns:
+            (typing.Optional[bool]): True if cost-weighted quotas are enabled.
+        """
+        return bool(self.data["Quotas"]["enabled"])
+
+    def _quota_setting(self, key: str, minimum: float) -> float:
+        data = self.data["Quotas"][key]
+        if data is None or float(data) < minimum:
+            self.logger.error(f"Quotas {key} in config.yml must be a number of at least {minimum}.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def quota_capacity(self) -> typing.Optional[float]:
+        """
+        This property returns the number of cost units a client can spend at once, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The size of the budget of a client.
+        """
+        return self._quota_setting("capacity", 1)
+
+    @property
+    def quota_refill_rate(self) -> typing.Optional[float]:
+        """
+        This property returns the number of cost units the budget of a client refills by every second, defined in
+        the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The refill rate of a budget.
+        """
+        return self._quota_setting("refill_rate", 0.001)
+
+    @property
+    def quota_megapixel_cost(self) -> typing.Optional[float]:
+        """
+        This property returns the cost of decoding a megapixel of an image, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The cost of a megapixel.
+        """
+        return self._quota_setting("megapixel_cost", 0)
+
+    @property
+    def quota_cpu_second_cost(self) -> typing.Optional[float]:
+        """
+        This property returns the cost of a second of CPU time of Tesseract OCR engine, defined in the config.yml
+        file.
+
+        Returns:
+            (typing.Optional[float]): The cost of a CPU second.
+        """
+        return self._quota_setting("cpu_second_cost", 0)
+
+    @property
+    def quota_megabyte_cost(self) -> typing.Optional[float]:
+        """
+        This property returns the cost of parsing a megabyte of text, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The cost of a megabyte.
+        """
+        return self._quota_setting("megabyte_cost", 0)
+
+    @property
+    def quota_cpu_per_megapixel(self) -> typing.Optional[float]:
+        """
+        This property returns the initial estimate of the CPU seconds reading a megapixel takes, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The estimated CPU seconds per megapixel.
+        """
+        return self._quota_setting("cpu_per_megapixel", 0)
+
+    @property
+    def quota_max_tenants(self) -> typing.Optional[int]:
+        """
+        This property returns the number of clients whose budget is remembered, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum number of budgets.
+        """
+        return int(self._quota_setting("max_tenants", 1))
+
+    @property
+    def quota_max_requests(self) -> typing.Optional[int]:
+        """
+        This property returns the number of requests a client can send at once whatever they cost, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The size of the request allowance of every client.
+        """
+        return int(self._quota_setting("max_requests", 1))
+
+    @property
+    def quota_request_rate(self) -> typing.Optional[float]:
+        """
+        This property returns the number of requests the allowance of a client refills by every second, defined in
+        the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The refill rate of the request allowance.
+        """
+        return self._quota_setting("request_rate", 0.001)
+
+    @property
+    def quota_trusted_proxies(self) -> typing.Optional[typing.List[IPNetwork]]:
+        """
+        This property returns the networks of the reverse proxies whose X-Forwarded-For header is trusted, defined
+        in the config.yml file.
+
+        Returns:
+            (typing.Optional[typing.List[IPNetwork]]): The networks of the trusted proxies.
+        """
+        data = self.data["Quotas"].get("trusted_proxies") or []
+        try:
+            return [ipaddress.ip_network(str(address), strict=False) for address in data]
+        except (TypeError, ValueError):
+            self.logger.error("Quotas trusted_proxies in config.yml must be a list of addresses or networks.")
+            sys.exit(1)
+
+    def _concurrency_setting(self, key: str, minimum: float) -> float:
+        data = self.data["Concurrency"][key]
+        if data is None or float(data) < minimum:
+            self.logger.error(f"Concurrency {key} in config.yml must be a number of at least {minimum}.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def concurrency_initial_limit(self) -> typing.Optional[int]:
+        """
+        This property returns the number of images that can be read at once when the server starts, defined in the
+        config.yml file. The limit adapts to the observed latency after that.
+
+        Returns:
+            (typing.Optional[int]): The initial concurrency limit.
+        """
+        return int(self._concurrency_setting("initial_limit", 1))
+
+    @property
+    def concurrency_min_limit(self) -> typing.Optional[int]:
+        """
+        This property returns the lowest the concurrency limit can adapt to, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The minimum concurrency limit.
+        """
+        return int(self._concurrency_setting("min_limit", 1))
+
+    @property
+    def concurrency_max_limit(self) -> typing.Optional[int]:
+        """
+        This property returns the highest the concurrency limit can adapt to, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum concurrency limit.
+        """
+        return int(self._concurrency_setting("max_limit", 1))
+
+    @property
+    def concurrency_target_latency(self) -> typing.Optional[float]:
+        """
+        This property returns the latency in seconds reading an image should stay under, defined in the config.yml
+        file. The concurrency limit shrinks when reading an image takes longer.
+
+        Returns:
+            (typing.Optional[float]): The target latency in seconds.
+        """
+        return self._concurrency_setting("target_latency", 0.001)
+
+    @property
+    def concurrency_queue_timeout(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds an image can wait for a free slot before it is shed, defined in
+        the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The queue timeout in seconds.
+        """
+        return self._concurrency_setting("queue_timeout", 0)
+
+    @property
+    def concurrency_max_queue(self) -> typing.Optional[int]:
+        """
+        This property returns the number of images that can wait for a free slot at once, defined in the config.yml
+        file. Images over this number are shed right away.
+
+        Returns:
+            (typing.Optional[int]): The maximum queue length.
+        """
+        return int(self._concurrency_setting("max_queue", 0))
+
+    @property
+    def stream_max_in_flight(self) -> typing.Optional[int]:
+        """
+        This property returns the maximum number of scans that can be in flight at once on one streaming connection,
+        defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum number of scans in flight per connection.
+        """
+        data = self.data["Stream"]["max_in_flight"]
+        if data is None or int(data) < 1:
+            self.logger.error("Stream max_in_flight in config.yml must be a positive number.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def stream_max_frame_size(self) -> typing.Optional[int]:
+        """
+        This property returns the maximum size of a single frame on a streaming connection in bytes, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum frame size in bytes.
+        """
+        data = self.data["Stream"]["max_frame_size"]
+        if data is None or int(data) < 1:
+            self.logger.error("Stream max_frame_size in config.yml must be a positive number.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def stream_rate(self) -> typing.Optional[float]:
+        """
+        This property returns the number of scans a streaming connection can start per second, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The number of scans per second per connection.
+        """
+        data = self.data["Stream"]["rate"]
+        if data is None or float(data) <= 0:
+            self.logger.error("Stream rate in config.yml must be a positive number.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def stream_token(self) -> typing.Optional[str]:
+        """
+        This property returns the token streaming clients have to authenticate with, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The stream token, or None if streaming clients do not have to authenticate.
+        """
+        data = self.data["Stream"]["token"]
+        if not data:
+            return None
+        return str(data)
+
+    def _lane_setting(self, key: str, minimum: int) -> int:
+        data = self.data["Lanes"][key]
+        if data is None or not str(data).isdigit() or int(data) < minimum:
+            self.logger.error(f"Lanes {key} in config.yml must be a whole number of at least {minimum}.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def lane_ocr_workers(self) -> typing.Optional[int]:
+        """
+        This property returns the number of threads that clean and read images, defined in the config.yml file. If it
+        is 0, the number of CPUs is used.
+
+        Returns:
+            (typing.Optional[int]): The number of threads of the OCR lane.
+        """
+        return self._lane_setting("ocr_workers", 0) or os.cpu_count() or 1
+
+    @property
+    def lane_ocr_max_queue(self) -> typing.Optional[int]:
+        """
+        This property returns the number of image jobs that can wait for a thread of the OCR lane, defined in the
+        config.yml file. Jobs over this number are shed.
+
+        Returns:
+            (typing.Optional[int]): The maximum queue length of the OCR lane.
+        """
+        return self._lane_setting("ocr_max_queue", 1)
+
+    @property
+    def lane_text_workers(self) -> typing.Optional[int]:
+        """
+        This property returns the number of threads that parse large texts, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The number of threads of the text lane.
+        """
+        return self._lane_setting("text_workers", 1)
+
+    @property
+    def lane_text_max_queue(self) -> typing.Optional[int]:
+        """
+        This property returns the number of large texts that can wait for a thread of the text lane, defined in the
+        config.yml file. Texts over this number are shed.
+
+        Returns:
+            (typing.Optional[int]): The maximum queue length of the text lane.
+        """
+        return self._lane_setting("text_max_queue", 1)
+
+    @property
+    def lane_text_inline_limit(self) -> typing.Optional[int]:
+        """
+        This property returns the length in characters under which texts are parsed inline on the event loop instead
+        of in the text lane, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The inline limit of the text lane.
+        """
+        return self._lane_setting("text_inline_limit", 0)
+
+    @property
+    def recycling_enabled(self) -> typing.Optional[bool]:
+        """
+        This property returns True if images are cleaned in child processes that are recycled, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[bool]): True if images are cleaned in child processes.
+        """
+        return bool(self.data["Recycling"]["enabled"])
+
+    def _recycling_setting(self, key: str, minimum: int) -> int:
+        data = self.data["Recycling"][key]
+        if data is None or not str(data).isdigit() or int(data) < minimum:
+            self.logger.error(f"Recycling {key} in config.yml must be a whole number of at least {minimum}.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def recycling_processes(self) -> typing.Optional[int]:
+        """
+        This property returns the number of child processes that clean images, defined in the config.yml file. If it
+        is 0, the number of CPUs is used.
+
+        Returns:
+            (typing.Optional[int]): The number of processes.
+        """
+        return self._recycling_setting("processes", 0) or os.cpu_count() or 1
+
+    @property
+    def recycling_max_jobs(self) -> typing.Optional[int]:
+        """
+        This property returns the number of images a child process cleans before it is replaced, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum number of jobs per process.
+        """
+        return self._recycling_setting("max_jobs", 1)
+
+    @property
+    def recycling_max_rss(self) -> typing.Optional[int]:
+        """
+        This property returns the resident memory a child process can grow to before it is replaced, defined in
+        megabytes in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The memory ceiling in bytes, or None if processes are only replaced after a number
+                                    of jobs.
+        """
+        return self._recycling_setting("max_rss", 0) * 1048576 or None
+
+    @property
+    def queue_backend(self) -> typing.Optional[str]:
+        """
+        This property returns where images are read, defined in the config.yml file. "inline" reads them in the OCR
+        lane of the API, "local" hands them to an OCR worker in the API process, and "redis" hands them to the OCR
+        workers through a Redis stream.
+
+        Returns:
+            (typing.Optional[str]): The queue backend.
+        """
+        data = str(self.data["Queue"]["backend"]).lower()
+        if data not in ("inline", "local", "redis"):
+            self.logger.error(f'Queue backend in config.yml must be "inline", "local" or "redis", not {data}.')
+            sys.exit(1)
+        return data
+
+    @property
+    def queue_stream(self) -> typing.Optional[str]:
+        """
+        This property returns the name of the Redis stream image jobs are added to, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The name of the stream.
+        """
+        data = self.data["Queue"]["stream"]
+        if not data:
+            self.logger.error("Queue stream in config.yml must not be empty.")
+            sys.exit(1)
+        return str(data)
+
+    @property
+    def queue_group(self) -> typing.Optional[str]:
+        """
+        This property returns the name of the consumer group the OCR workers read the stream as, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The name of the consumer group.
+        """
+        data = self.data["Queue"]["group"]
+        if not data:
+            self.logger.error("Queue group in config.yml must not be empty.")
+            sys.exit(1)
+        return str(data)
+
+    def _queue_setting(self, key: str, minimum: int) -> int:
+        data = self.data["Queue"][key]
+        if data is None or not str(data).isdigit() or int(data) < minimum:
+            self.logger.error(f"Queue {key} in config.yml must be a whole number of at least {minimum}.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def queue_max_length(self) -> typing.Optional[int]:
+        """
+        This property returns the number of image jobs that can wait in the queue, defined in the config.yml file.
+        Jobs over this number are shed.
+
+        Returns:
+            (typing.Optional[int]): The maximum length of the queue.
+        """
+        return self._queue_setting("max_length", 1)
+
+    @property
+    def queue_result_ttl(self) -> typing.Optional[int]:
+        """
+        This property returns the number of seconds the result of a job is kept in Redis, defined in the config.yml
+        file.
+
+        Returns:
+            (typing.Optional[int]): The time to live of a result, in seconds.
+        """
+        return self._queue_setting("result_ttl", 1)
+
+    @property
+    def queue_claim_idle(self) -> typing.Optional[int]:
+        """
+        This property returns the number of seconds a job taken by a worker can go unacknowledged before another
+        worker takes it over, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The claim idle time, in seconds.
+        """
+        return self._queue_setting("claim_idle", 1)
+
+    @property
+    def queue_worker_concurrency(self) -> typing.Optional[int]:
+        """
+        This property returns the number of images an OCR worker reads at once, defined in the config.yml file. If it
+        is 0, the number of CPUs is used.
+
+        Returns:
+            (typing.Optional[int]): The concurrency of an OCR worker.
+        """
+        return self._queue_setting("worker_concurrency", 0) or os.cpu_count() or 1
+
+    @property
+    def logging_level(self) -> typing.Optional[str]:
+        """
+        This property returns the lowest level that is logged, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The log level.
+        """
+        data = str(self.data["Logging"]["level"]).upper()
+        if data not in ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"):
+            self.logger.error(f"Logging level in config.yml must be a loguru level, not {data}.")
+            sys.exit(1)
+        return data
+
+    @property
+    def logging_serialize(self) -> typing.Optional[bool]:
+        """
+        This property returns True if log lines are written as JSON objects, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[bool]): True if log lines are serialized.
+        """
+        return bool(self.data["Logging"]["serialize"])
+
+    @property
+    def logging_sample_rate(self) -> typing.Optional[float]:
+        """
+        This property returns the number of lines every type of noisy event can log per second, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The sample rate, or None if every event is logged.
+        """
+        data = self.data["Logging"]["sample_rate"]
+        if data is None or float(data) < 0:
+            self.logger.error("Logging sample_rate in config.yml must be a positive number, or 0.")
+            sys.exit(1)
+        return float(data) or None
+
+    @property
+    def logging_sample_burst(self) -> typing.Optional[int]:
+        """
+        This property returns the number of lines every type of noisy event can log at once, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The sample burst.
+        """
+        data = self.data["Logging"]["sample_burst"]
+        if data is None or int(data) < 1:
+            self.logger.error("Logging sample_burst in config.yml must be a positive number.")
+            sys.exit(1)
+        return int(data)
+
+    @property
+    def assets_directory(self) -> typing.Optional[str]:
+        """
+        This property returns the directory of the pages and the static files, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The path of the directory.
+        """
+        data = self.data["Assets"]["directory"]
+        if not data or not os.path.isdir(str(data)):
+            self.logger.error("Assets directory in config.yml must be an existing directory.")
+            sys.exit(1)
+        return str(data)
+
+    def _asset_setting(self, key: str, minimum: float) -> float:
+        data = self.data["Assets"][key]
+        if data is None or float(data) < minimum:
+            self.logger.error(f"Assets {key} in config.yml must be a number of at least {minimum}.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def asset_max_age(self) -> typing.Optional[int]:
+        """
+        This property returns the number of seconds browsers may cache the files under /static for, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The max-age of the Cache-Control header of static files.
+        """
+        return int(self._asset_setting("max_age", 0))
+
+    @property
+    def asset_page_max_age(self) -> typing.Optional[int]:
+        """
+        This property returns the number of seconds browsers may cache the pages for, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The max-age of the Cache-Control header of the pages.
+        """
+        return int(self._asset_setting("page_max_age", 0))
+
+    @property
+    def asset_check_interval(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds between two checks of the modification time of a static file,
+        defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The check interval in seconds.
+        """
+        return self._asset_setting("check_interval", 0)
+
+    @property
+    def asset_max_file_size(self) -> typing.Optional[int]:
+        """
+        This property returns the size in bytes of the largest static file that is kept in memory, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum file size in bytes.
+        """
+        return int(self._asset_setting("max_file_size", 0))
+
+    @property
+    def asset_min_compress_size(self) -> typing.Optional[int]:
+        """
+        This property returns the size in bytes of the smallest static file that is compressed, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The minimum size in bytes.
+        """
+        return int(self._asset_setting("min_compress_size", 0))
+
+    @property
+    def profiling_admin_token(self) -> typing.Optional[str]:
+        """
+        This property returns the token admins have to pass in the `X-Admin-Token` header to use the profiling
+        and status endpoints, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[str]): The admin token, or None if the profiling endpoints are disabled.
+        """
+        data = self.data["Profiling"]["admin_token"]
+        if not data:
+            return None
+        return str(data)
+
+    @property
+    def profiling_sample_interval(self) -> typing.Optional[float]:
+        """
+        This property returns the number of seconds between two samples of the sampling profiler, defined in the
+        config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The sample interval in seconds.
+        """
+        data = self.data["Profiling"]["sample_interval"]
+        if data is None or float(data) <= 0:
+            self.logger.error("Profiling sample_interval in config.yml must be a positive number.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def profiling_max_duration(self) -> typing.Optional[float]:
+        """
+        This property returns the longest a sampling profile can run in seconds, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[float]): The maximum duration in seconds.
+        """
+        data = self.data["Profiling"]["max_duration"]
+        if data is None or float(data) <= 0:
+            self.logger.error("Profiling max_duration in config.yml must be a positive number.")
+            sys.exit(1)
+        return float(data)
+
+    @property
+    def profiling_max_profiles(self) -> typing.Optional[int]:
+        """
+        This property returns the number of per-request profiles kept in memory, defined in the config.yml file.
+
+        Returns:
+            (typing.Optional[int]): The maximum number of profiles.
+        """
+        data = self.data["Profiling"]["max_profiles"]
+        if data is None or int(data) < 1:
+            self.logger.error("Profiling max_profiles in config.yml must be a positive number.")
+            sys.exit(1)
+        return int(data)
+
     def __repr__(self):
         return f"<Config {self.data}>"
 
 
 def executor_function(
-    sync_function: typing.Callable[..., typing.Callable]
+    sync_function: typing.Optional[typing.Callable[..., typing.Callable]] = None,
+    *,
+    lane: typing.Optional[str] = None,
 ):
     # Taken from Jishaku ( https://github.com/Gorialis/jishaku/blob/master/jishaku/functools.py#L20 )
     """
     A decorator that wraps a sync function in an executor, changing it into an async function.
     This allows processing functions to be wrapped and used immediately as an async function.
+    It can be used bare, to run the function in the default executor, or as `@executor_function(lane="ocr")`, to run
+    it in the :class:`utils.lanes.ExecutionLane` registered with that name.
 
     Parameters:
         sync_function (typing.Callable): This parameter takes the function to be wrapped and converts it into an
                                          async function.
 
+        lane (typing.Optional[str]): This parameter takes the name of the lane to run the function in. The default
+                                     executor is used if no lane with that name is registered.
+
 
     Returns:
         (typing.Callable): The wrapped function as a coroutine.
@@ -184,19 +1145,27 @@ def executor_function(
         (TypeError): If the function object that is passed is already an async function.
     """
 
-    @functools.wraps(sync_function)
-    async def sync_wrapper(*args, **kwargs):
-        """
-        Asynchronous function that wraps a sync function with an executor.
-        """
+    def decorator(function: typing.Callable[..., typing.Callable]):
+        @functools.wraps(function)
+        async def sync_wrapper(*args, **kwargs):
+            """
+            Asynchronous function that wraps a sync function with an executor.
+            """
 
-        loop = asyncio.get_event_loop()
-        internal_function = functools.partial(sync_function, *args, **kwargs)
-        if asyncio.iscoroutinefunction(internal_function):
-            raise TypeError(
-                f"This decorator only wraps and converts a synchronous function into an async function, "
-                f"{sync_function} is already an async function."
-            )
-        return await loop.run_in_executor(None, internal_function)
+            internal_function = functools.partial(function, *args, **kwargs)
+            if asyncio.iscoroutinefunction(internal_function):
+                raise TypeError(
+                    f"This decorator only wraps and converts a synchronous function into an async function, "
+                    f"{function} is already an async function."
+                )
+            execution_lane = get_lane(lane) if lane is not None else None
+            if execution_lane is not None:
+                return await execution_lane.run(internal_function)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, internal_function)
+
+        return sync_wrapper
 
-    return sync_wrapper
+    if sync_function is None:
+        return decorator
+    return decorator(sync_function)
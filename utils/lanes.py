@@ -0,0 +1,173 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+import typing
+
+from utils.exceptions import Overloaded
+from utils.profiling import run_profiled
+
+__all__ = (
+    "ExecutionLane",
+    "get_lane",
+    "register_lane",
+)
+
+_lanes: typing.Dict[str, "ExecutionLane"] = {}
+
+
+class ExecutionLane:
+    """
+    A class that runs blocking work in its own bounded thread pool, so that one kind of work, such as OCR, can never
+    make another kind of work, such as parsing text, wait behind it. Each lane has its own queue limit, and keeps its
+    own metrics.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"lane-{name}"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        # Exponentially weighted moving averages, in seconds.
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def _job(self, function: typing.Callable, submitted: float) -> typing.Any:
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_time = 0.9 * self.wait_time + 0.1 * (started - submitted)
+
+        failed = False
+        try:
+            return function()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.failed += failed
+                self.run_time = 0.9 * self.run_time + 0.1 * (time.monotonic() - started)
+
+    def _done(self, future: concurrent.futures.Future) -> None:
+        if future.cancelled():
+            # The job never started, so it is still counted as queued.
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    async def run(self, function: typing.Callable, *args, **kwargs) -> typing.Any:
+        """
+        |coroutine|
+        This method runs a blocking function in the lane, in a copy of the current context, so that the job is
+        profiled along with the request that started it. If the coroutine is cancelled before the function started,
+        the function is dropped from the queue.
+
+        Parameters:
+            function (typing.Callable): This parameter takes the blocking function to run.
+
+            *args: The positional arguments of the function.
+
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            (typing.Any): The return value of the function.
+
+        Raises:
+            (Overloaded): If the queue of the lane is full.
+        """
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            retry_after = max(1, int(self.queued / max(self.max_workers, 1) * self.run_time) + 1)
+            raise Overloaded(self.name, retry_after)
+
+        with self._lock:
+            self.queued += 1
+        context = contextvars.copy_context()
+        future = self.executor.submit(
+            self._job,
+            functools.partial(context.run, run_profiled, functools.partial(function, *args, **kwargs)),
+            time.monotonic(),
+        )
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """
+        This method returns the metrics of the lane.
+
+        Returns:
+            (dict): The size of the lane, the jobs queued and running, the number of jobs completed, failed, rejected
+                    and cancelled, and the average time jobs waited in the queue and ran, in seconds.
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "wait_time": round(self.wait_time, 6),
+                "run_time": round(self.run_time, 6),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        This method shuts the thread pool of the lane down.
+
+        Parameters:
+            wait (bool): This parameter takes True to wait for the running jobs to finish.
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name} workers={self.max_workers} queued={self.queued}>"
+
+
+def register_lane(lane: ExecutionLane) -> ExecutionLane:
+    """
+    This function registers a lane, so that functions decorated with :func:`utils.helpers.executor_function` can
+    run in it by name. A lane that has the same name is shut down and replaced.
+
+    Parameters:
+        lane (ExecutionLane): This parameter takes the lane to register.
+
+    Returns:
+        (ExecutionLane): The registered lane.
+    """
+    previous = _lanes.get(lane.name)
+    if previous is not None and previous is not lane:
+        previous.shutdown(wait=False)
+    _lanes[lane.name] = lane
+    return lane
+
+
+def get_lane(name: str) -> typing.Optional[ExecutionLane]:
+    """
+    This function returns the lane registered with the given name.
+
+    Parameters:
+        name (str): This parameter takes the name of the lane.
+
+    Returns:
+        (typing.Optional[ExecutionLane]): The lane, or None if no lane has that name.
+    """
+    return _lanes.get(name)
@@ -0,0 +1,145 @@
+import sys
+import threading
+import time
+import typing
+
+from loguru import logger
+
+__all__ = (
+    "EventSampler",
+    "log_event",
+    "setup_logging",
+)
+
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+
+def _format(record: dict) -> str:
+    if "suppressed" in record["extra"]:
+        return LOG_FORMAT + " <dim>({extra[suppressed]} similar lines were dropped)</dim>\n{exception}"
+    return LOG_FORMAT + "\n{exception}"
+
+
+class EventSampler:
+    """
+    A class that limits how often every type of log event is logged, with a token bucket per event. Every event can be
+    logged in a burst, after that only at a steady rate, and the number of events that were dropped in between is
+    reported with the next one that is logged. It can be used from any thread.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: typing.Dict[str, typing.List[float]] = {}
+        self.suppressed: typing.Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, event: str) -> typing.Optional[int]:
+        """
+        This method takes a token from the bucket of an event, if there is one.
+
+        Parameters:
+            event (str): This parameter takes the name of the event.
+
+        Returns:
+            (typing.Optional[int]): None if the event should be dropped, otherwise the number of events of the same
+                                    type that were dropped since the last one that was logged.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(event)
+            if bucket is None:
+                bucket = self.buckets[event] = [float(self.burst), now]
+            tokens = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return None
+            bucket[0] = tokens - 1.0
+            return self.suppressed.pop(event, 0)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} rate={self.rate} burst={self.burst} events={len(self.buckets)}>"
+
+
+_sampler: typing.Optional[EventSampler] = None
+_min_level = 0
+_level_numbers: typing.Dict[str, int] = {}
+
+
+def _level_number(level: str) -> int:
+    number = _level_numbers.get(level)
+    if number is None:
+        number = _level_numbers[level] = logger.level(level).no
+    return number
+
+
+def setup_logging(
+    level: str = "INFO",
+    serialize: bool = False,
+    sample_rate: typing.Optional[float] = None,
+    sample_burst: int = 50,
+    sink: typing.Any = sys.stderr,
+) -> None:
+    """
+    This function replaces the default loguru handler with one that writes from a background thread, so that writing
+    a log line never blocks the event loop or an executor thread, and sets up the sampling of :func:`log_event`.
+    It is called once by the API when it starts and by the offline scanner.
+
+    Parameters:
+        level (str): This parameter takes the lowest level that is logged, such as "DEBUG" or "INFO".
+
+        serialize (bool): This parameter takes True to write every log line as a JSON object, with the structured
+                          fields of the event.
+
+        sample_rate (typing.Optional[float]): This parameter takes the number of lines every type of event can log
+                                              per second after its burst, or None to log every event.
+
+        sample_burst (int): This parameter takes the number of lines every type of event can log at once.
+
+        sink (typing.Any): This parameter takes where the log is written to, stderr by default.
+    """
+    global _sampler, _min_level
+    logger.remove()
+    logger.add(
+        sink,
+        level=level,
+        format=_format,
+        serialize=serialize,
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
+    )
+    _min_level = _level_number(level)
+    _sampler = EventSampler(sample_rate, sample_burst) if sample_rate is not None else None
+
+
+def log_event(event: str, level: str, message: str, **fields: typing.Any) -> None:
+    """
+    This function logs an event of a type that can happen many times per request, such as a rejected token candidate.
+    The event is dropped before its message is formatted if its level is not logged, or if its type was already
+    logged too often. The message is a :meth:`str.format` template, which is only formatted once the event passed
+    both checks, and the fields are kept as structured data in the `extra` of the record.
+
+    Parameters:
+        event (str): This parameter takes the name of the type of event, which events are sampled by.
+
+        level (str): This parameter takes the level of the event, such as "DEBUG" or "WARNING".
+
+        message (str): This parameter takes the message template, such as "Could not decode user ID {value}".
+
+        **fields: The fields of the event, which fill in the template.
+    """
+    if _level_number(level) < _min_level:
+        return
+    if _sampler is not None:
+        suppressed = _sampler.allow(event)
+        if suppressed is None:
+            return
+        if suppressed:
+            fields["suppressed"] = suppressed
+    logger.opt(depth=1).log(level, message, event=event, **fields)
@@ -1,14 +1,15 @@
 import datetime
-import json
 import typing
 
 from pydantic import BaseModel
 
 __all__ = (
     "Token",
+    "TokenRecord",
     "ImageRequest",
     "OCRData",
     "TextRequest",
+    "ScanSessionData",
 )
 
 
@@ -18,6 +19,7 @@ class Token(BaseModel):
     """
 
     token_string: typing.Optional[str] = None
+    token_type: typing.Optional[str] = None
     raw_data: typing.Optional[str] = None
     user_id: typing.Optional[int] = None
     timestamp: typing.Optional[int] = None
@@ -25,6 +27,7 @@ class Token(BaseModel):
     hmac: typing.Optional[str] = None
     is_valid: bool
     reason: typing.Optional[str] = None
+    seen_before: typing.Optional[bool] = None
 
     def jsonify(self) -> dict:
         """
@@ -33,8 +36,9 @@ class Token(BaseModel):
         Returns:
             (dict): The dictionary representation of the Token object.
         """
-        data = {
+        return {
             "token_string": self.token_string,
+            "token_type": self.token_type,
             "user_id": self.user_id,
             "raw_data": self.raw_data,
             "timestamp": self.timestamp,
@@ -42,15 +46,90 @@ class Token(BaseModel):
             "hmac": self.hmac,
             "is_valid": self.is_valid,
             "reason": self.reason,
+            "seen_before": self.seen_before,
         }
-        json_data = json.dumps(data)
-        data = json.loads(json_data)
-        return data
 
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.jsonify()}>"
 
 
+class TokenRecord:
+    """
+    A class that holds the same data as :class:`Token`, without any validation. The parser creates one for every
+    token like string it finds, which has to be cheap, as batch and streaming scans find a lot of them. Records are
+    only converted to JSON when they leave the API. Records are compared by value, and are intentionally unhashable,
+    as they are mutable: `seen_before` is set after the record is created.
+    """
+
+    __slots__ = (
+        "token_string",
+        "token_type",
+        "raw_data",
+        "user_id",
+        "timestamp",
+        "created_at",
+        "hmac",
+        "is_valid",
+        "reason",
+        "seen_before",
+    )
+
+    def __init__(
+        self,
+        is_valid: bool,
+        token_string: typing.Optional[str] = None,
+        token_type: typing.Optional[str] = None,
+        raw_data: typing.Optional[str] = None,
+        user_id: typing.Optional[int] = None,
+        timestamp: typing.Optional[int] = None,
+        created_at: typing.Optional[datetime.datetime] = None,
+        hmac: typing.Optional[str] = None,
+        reason: typing.Optional[str] = None,
+        seen_before: typing.Optional[bool] = None,
+    ):
+        self.token_string = token_string
+        self.token_type = token_type
+        self.raw_data = raw_data
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.created_at = created_at
+        self.hmac = hmac
+        self.is_valid = is_valid
+        self.reason = reason
+        self.seen_before = seen_before
+
+    def jsonify(self) -> dict:
+        """
+        This method converts the record into a regular python dictionary object, in the same format as
+        :meth:`Token.jsonify`.
+
+        Returns:
+            (dict): The dictionary representation of the record.
+        """
+        return {
+            "token_string": self.token_string,
+            "token_type": self.token_type,
+            "user_id": self.user_id,
+            "raw_data": self.raw_data,
+            "timestamp": self.timestamp,
+            "created_at": str(self.created_at),
+            "hmac": self.hmac,
+            "is_valid": self.is_valid,
+            "reason": self.reason,
+            "seen_before": self.seen_before,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, TokenRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.token_type} {self.token_string!r} is_valid={self.is_valid}>"
+
+
 class ImageRequest(BaseModel):
     """
     A model that represents a POST request to the image endpoint.
@@ -88,6 +167,24 @@ class OCRData(BaseModel):
         The text that was processed.
     """
 
-    url: str
+    url: typing.Optional[str] = None
     unfiltered_text: str
     filtered_text: str
+
+
+class ScanSessionData(BaseModel):
+    """
+    A model that represents the response from the incremental scan session endpoints.
+
+    **api/token/session**
+
+    Attributes:
+        The ID of the session, the tokens found by the last appended text, every token found in the session,
+        the number of characters scanned, and the number of seconds until the session expires.
+    """
+
+    session_id: str
+    new_tokens: typing.List[Token] = []
+    tokens: typing.List[Token] = []
+    scanned_characters: int
+    expires_in: float
@@ -0,0 +1,312 @@
+import asyncio
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import time
+import typing
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.exceptions import Overloaded
+from utils.logs import log_event
+
+__all__ = (
+    "RecyclingPool",
+    "current_rss",
+)
+
+# Processes are started by a fork server, or spawned where there is none, and never forked from the server itself:
+# forking it copies the locks of its threads, such as the ones of the lanes and of the logging thread, whichever
+# thread holds them, and a child that then takes one of them waits forever.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def current_rss() -> typing.Optional[int]:
+    """
+    This function returns the resident memory of the current process, from /proc.
+
+    Returns:
+        (typing.Optional[int]): The resident memory in bytes, or None on systems without /proc.
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _call(function: typing.Callable, args: tuple, kwargs: dict) -> tuple:
+    # Runs in the child process. The error is returned instead of raised, so that the memory of the process is reported
+    # along with jobs that failed too.
+    try:
+        result, error = function(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, os.getpid(), current_rss()
+
+
+def _warm_up() -> tuple:
+    return None, None, os.getpid(), current_rss()
+
+
+class PoolProcess:
+    """
+    A class that represents a single process of a :class:`RecyclingPool`, and what it has done so far.
+    """
+
+    def __init__(self, number: int):
+        self.number = number
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context(START_METHOD)
+        )
+        self.started_at = time.time()
+        self.pid: typing.Optional[int] = None
+        self.rss: typing.Optional[int] = None
+        self.peak_rss = 0
+        self.jobs = 0
+
+    def record(self, pid: int, rss: typing.Optional[int]) -> None:
+        """
+        This method records the process ID and the resident memory a job of the process reported.
+        """
+        self.pid = pid
+        self.rss = rss
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def stats(self) -> dict:
+        """
+        This method returns what the process has done so far.
+
+        Returns:
+            (dict): The slot number and ID of the process, the jobs it ran, its resident memory and the peak of it in
+                    megabytes, and its age in seconds.
+        """
+        return {
+            "number": self.number,
+            "pid": self.pid,
+            "jobs": self.jobs,
+            "rss_mb": round(self.rss / 1048576, 1) if self.rss is not None else None,
+            "peak_rss_mb": round(self.peak_rss / 1048576, 1),
+            "age": round(time.time() - self.started_at, 1),
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.number} pid={self.pid} jobs={self.jobs}>"
+
+
+class RecyclingPool:
+    """
+    A class that runs blocking work in a fixed number of child processes, one job per process at a time, and replaces
+    every process once it has run a number of jobs or its resident memory grew past a ceiling. Decoding large images
+    fragments the heap of the process that decodes them, and the memory is only given back when the process exits,
+    so recycling the processes keeps the memory of the server flat.
+
+    A process is only replaced between two jobs, and jobs wait for a free process in the parent, so recycling never
+    drops work. Jobs over the queue limit are shed with :class:`Overloaded`. The functions and their arguments have to
+    be picklable, and the functions should not depend on the state of the parent process.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        processes: int,
+        max_queue: int,
+        max_jobs: int,
+        max_rss: typing.Optional[int] = None,
+        max_events: int = 50,
+    ):
+        self.name = name
+        self.processes = processes
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.slots: typing.List[PoolProcess] = []
+        self.idle: typing.Deque[PoolProcess] = deque()
+        self.waiters: typing.Deque[asyncio.Future] = deque()
+        self.events: typing.Deque[dict] = deque(maxlen=max_events)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.recycled = 0
+        self.run_time = 0.0  # Exponentially weighted moving average, in seconds.
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+    def _start(self) -> None:
+        # The processes are started on first use, so that nothing is forked when the module is imported.
+        self._loop = asyncio.get_event_loop()
+        for number in range(self.processes):
+            process = self._spawn(number)
+            self.slots.append(process)
+            self.idle.append(process)
+
+    @staticmethod
+    def _spawn(number: int) -> PoolProcess:
+        process = PoolProcess(number)
+
+        def started(future: concurrent.futures.Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                process.record(*future.result()[2:])
+
+        # Starting the process right away means the first job it gets does not wait for the process to start.
+        process.executor.submit(_warm_up).add_done_callback(started)
+        return process
+
+    async def _acquire(self) -> PoolProcess:
+        if self._loop is None:
+            self._start()
+        if self.idle:
+            return self.idle.popleft()
+        waiter = self._loop.create_future()
+        self.waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The process was handed over right as the job was cancelled, so it goes to the next job instead.
+                self._release(waiter.result())
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+
+    def _release(self, process: PoolProcess) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(process)
+                return
+        self.idle.append(process)
+
+    def _recycle(self, process: PoolProcess, reason: str) -> PoolProcess:
+        event = {
+            "time": time.time(),
+            "pool": self.name,
+            "number": process.number,
+            "pid": process.pid,
+            "reason": reason,
+            "jobs": process.jobs,
+            "rss_mb": round(process.rss / 1048576, 1) if process.rss is not None else None,
+            "age": round(time.time() - process.started_at, 1),
+        }
+        self.events.append(event)
+        self.recycled += 1
+        log_event(
+            "process_recycled",
+            "INFO",
+            "Recycled process {pid} of the {pool} pool after {jobs} jobs, because of {reason}.",
+            **event,
+        )
+        # The process is idle, so it exits as soon as it is shut down, without waiting for it here.
+        process.executor.shutdown(wait=False)
+        replacement = self._spawn(process.number)
+        self.slots[process.number] = replacement
+        return replacement
+
+    def _finished(self, process: PoolProcess, future: concurrent.futures.Future, started: float) -> None:
+        self.run_time = 0.9 * self.run_time + 0.1 * (time.monotonic() - started)
+        if future.cancelled():
+            self.cancelled += 1
+            self._release(process)
+            return
+
+        error = future.exception()
+        if error is not None:
+            # The process died while it ran the job, such as when it was killed for running out of memory.
+            self.failed += 1
+            self._release(self._recycle(process, f"crash: {error.__class__.__name__}"))
+            return
+
+        _, job_error, pid, rss = future.result()
+        process.jobs += 1
+        process.record(pid, rss)
+        self.completed += 1
+        self.failed += job_error is not None
+        if process.jobs >= self.max_jobs:
+            process = self._recycle(process, "max_jobs")
+        elif self.max_rss is not None and rss is not None and rss >= self.max_rss:
+            process = self._recycle(process, "max_rss")
+        self._release(process)
+
+    async def run(self, function: typing.Callable, *args, **kwargs) -> typing.Any:
+        """
+        |coroutine|
+        This method runs a function in a free process of the pool, waiting for one if they are all busy. If the
+        coroutine is cancelled while the function runs, the process finishes the job before it takes the next one.
+
+        Parameters:
+            function (typing.Callable): This parameter takes the function to run, it has to be picklable.
+
+            *args: The positional arguments of the function.
+
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            (typing.Any): The return value of the function.
+
+        Raises:
+            (Overloaded): If too many jobs are already waiting for a process.
+            (BrokenProcessPool): If the process died while it ran the function.
+        """
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            retry_after = max(1, math.ceil(len(self.waiters) / max(self.processes, 1) * self.run_time))
+            raise Overloaded(self.name, retry_after)
+
+        process = await self._acquire()
+        started = time.monotonic()
+        try:
+            future = process.executor.submit(_call, function, args, kwargs)
+        except BrokenProcessPool:
+            self._release(self._recycle(process, "crash: BrokenProcessPool"))
+            raise
+        future.add_done_callback(
+            lambda done: self._loop.call_soon_threadsafe(self._finished, process, done, started)
+        )
+        result, error, _, _ = await asyncio.wrap_future(future)
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self) -> dict:
+        """
+        This method returns the metrics of the pool.
+
+        Returns:
+            (dict): The limits of the pool, the number of jobs waiting, completed, failed, rejected and cancelled,
+                    the number of processes that were recycled, every process with its memory, and the most recent
+                    recycle events.
+        """
+        return {
+            "name": self.name,
+            "processes": [process.stats() for process in self.slots],
+            "max_jobs": self.max_jobs,
+            "max_rss_mb": round(self.max_rss / 1048576, 1) if self.max_rss is not None else None,
+            "queued": len(self.waiters),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "recycled": self.recycled,
+            "run_time": round(self.run_time, 6),
+            "recycle_events": list(self.events),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        This method shuts every process of the pool down.
+
+        Parameters:
+            wait (bool): This parameter takes True to wait for the running jobs to finish.
+        """
+        for process in self.slots:
+            process.executor.shutdown(wait=wait)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name} processes={self.processes} recycled={self.recycled}>"
@@ -0,0 +1,406 @@
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+import uuid
+from collections import Counter, OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = (
+    "AllocationTracker",
+    "ProfileMiddleware",
+    "ProfileStore",
+    "RequestProfile",
+    "SamplingProfiler",
+    "run_profiled",
+)
+
+_request_profile: "contextvars.ContextVar[typing.Optional[RequestProfile]]" = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+# Leaf frames of threads that are waiting for work, they are left out of samples unless idle threads are asked for.
+IDLE_FRAMES = frozenset(
+    {
+        ("threading.py", "wait"),
+        ("threading.py", "_wait_for_tstate_lock"),
+        ("selectors.py", "select"),
+        ("queue.py", "get"),
+        ("thread.py", "_worker"),
+    }
+)
+
+
+class SamplingProfiler:
+    """
+    A class that samples the stacks of every thread of the process at a fixed interval, the event loop and the
+    executor threads alike, and counts how often every stack was seen. Sampling does not slow down the sampled code,
+    as nothing is traced, so it is safe to run in production. The result is in the collapsed stack format, which
+    flamegraph tools such as flamegraph.pl and speedscope can read.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.running = False
+
+    def _sample(self, duration: float, idle: bool) -> typing.Counter[str]:
+        own_thread = threading.get_ident()
+        stacks: typing.Counter[str] = Counter()
+        ends_at = time.monotonic() + duration
+        while time.monotonic() < ends_at:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_thread:
+                    continue
+                if not idle and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    async def sample(self, duration: float, idle: bool = False) -> str:
+        """
+        |coroutine|
+        This method samples every thread for a number of seconds. Only one sample can run at once.
+
+        Parameters:
+            duration (float): This parameter takes the number of seconds to sample for.
+
+            idle (bool): This parameter takes True to also count threads that are waiting for work.
+
+        Returns:
+            (str): The collapsed stacks, one stack per line, the frames from the thread name down to the leaf
+                   separated by semicolons, followed by the number of samples it was seen in.
+
+        Raises:
+            (RuntimeError): If a sample is already running.
+        """
+        if self.running:
+            raise RuntimeError("A sampling profile is already running.")
+        self.running = True
+        try:
+            loop = asyncio.get_event_loop()
+            stacks = await loop.run_in_executor(None, self._sample, duration, idle)
+        finally:
+            self.running = False
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} interval={self.interval} running={self.running}>"
+
+
+class RequestProfile:
+    """
+    A class that holds the cProfile data captured for a single request. The part of the request that runs on the
+    event loop and every job it runs in an :class:`utils.lanes.ExecutionLane` are profiled separately, and merged when
+    the profile is rendered. Other requests that run on the event loop at the same time show up in the event loop
+    part too, as cProfile traces a whole thread.
+    """
+
+    def __init__(self, profile_id: str, method: str, path: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.created_at = time.time()
+        self.elapsed = 0.0
+        self.profiles: typing.List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def capture(self) -> typing.Iterator[None]:
+        """
+        This method profiles the code in the block, in the current thread, and adds it to the profile. Nothing is
+        captured if another profiler is already active, which is the case on Python versions where cProfile can
+        only trace one thread at once.
+        """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self.profiles.append(profile)
+
+    def render(self, sort: str = "cumulative", limit: int = 50) -> str:
+        """
+        This method renders the profile as the text report of :class:`pstats.Stats`.
+
+        Parameters:
+            sort (str): This parameter takes the key the functions are sorted by, such as "cumulative" or "tottime".
+
+            limit (int): This parameter takes the number of functions to include.
+
+        Returns:
+            (str): The report.
+        """
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return "No profile was captured for this request.\n"
+        stream = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self) -> dict:
+        """
+        This method returns what the profile is about, without the profile data itself.
+
+        Returns:
+            (dict): The ID of the profile, the method and path of the request, when it was made, and how long it
+                    took in seconds.
+        """
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "created_at": self.created_at,
+            "elapsed": round(self.elapsed, 6),
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.profile_id} {self.method} {self.path}>"
+
+
+class ProfileStore:
+    """
+    A class that profiles single requests with cProfile and keeps the most recent profiles in memory, so that they
+    can be fetched later. Only one request is profiled at once, as the profiles of concurrent requests would overlap.
+    """
+
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self.profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self.active: typing.Optional[RequestProfile] = None
+
+    @contextlib.contextmanager
+    def profile(self, method: str, path: str) -> typing.Iterator[typing.Optional[RequestProfile]]:
+        """
+        This method profiles the request that runs in the block. Lane jobs started in the block are profiled too,
+        as they inherit the context of the request.
+
+        Parameters:
+            method (str): This parameter takes the HTTP method of the request.
+
+            path (str): This parameter takes the path of the request.
+
+        Returns:
+            (typing.Optional[RequestProfile]): The profile, or None if another request is already being profiled.
+        """
+        if self.active is not None:
+            yield None
+            return
+
+        profile = RequestProfile(uuid.uuid4().hex, method, path)
+        self.active = profile
+        token = _request_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with profile.capture():
+                yield profile
+        finally:
+            profile.elapsed = time.perf_counter() - started
+            _request_profile.reset(token)
+            self.active = None
+            self.profiles[profile.profile_id] = profile
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> typing.Optional[RequestProfile]:
+        """
+        This method returns a stored profile.
+
+        Parameters:
+            profile_id (str): This parameter takes the ID of the profile.
+
+        Returns:
+            (typing.Optional[RequestProfile]): The profile, or None if it does not exist or was dropped.
+        """
+        return self.profiles.get(profile_id)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} profiles={len(self.profiles)}/{self.max_profiles}>"
+
+
+class ProfileMiddleware:
+    """
+    An ASGI middleware that profiles a single request to the paths that start with one of the prefixes with cProfile
+    when an admin asks for it with the `X-Profile` header. The ID of the profile is returned in the `X-Profile-Id`
+    header, and the profile can be fetched from /admin/profile/requests/{profile_id}. It is a plain ASGI middleware,
+    and is only added while an admin token is set, so that requests that are not profiled go through untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        profiles: ProfileStore,
+        is_admin: typing.Callable[[typing.Optional[str]], bool],
+        prefixes: typing.Tuple[str, ...],
+    ):
+        self.app = app
+        self.profiles = profiles
+        self.is_admin = is_admin
+        self.prefixes = prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if "x-profile" not in headers:
+            await self.app(scope, receive, send)
+            return
+        if not self.is_admin(headers.get("x-admin-token")):
+            response = JSONResponse(status_code=403, content={"detail": "Invalid admin token."})
+            await response(scope, receive, send)
+            return
+
+        with self.profiles.profile(scope["method"], scope["path"]) as profile:
+
+            async def send_with_profile(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    response_headers = MutableHeaders(scope=message)
+                    if profile is None:
+                        response_headers["X-Profile-Status"] = "busy"
+                    else:
+                        response_headers["X-Profile-Id"] = profile.profile_id
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile)
+
+
+def run_profiled(function: typing.Callable[[], typing.Any]) -> typing.Any:
+    """
+    This function runs a function, and profiles it if it runs in the context of a request that is being profiled.
+    It is used by :class:`utils.lanes.ExecutionLane` to profile the jobs of a request in the lane threads.
+
+    Parameters:
+        function (typing.Callable): This parameter takes the function to run, without arguments.
+
+    Returns:
+        (typing.Any): The return value of the function.
+    """
+    profile = _request_profile.get()
+    if profile is None:
+        return function()
+    with profile.capture():
+        return function()
+
+
+class AllocationTracker:
+    """
+    A class that finds where memory is allocated, by comparing a snapshot of tracemalloc with a baseline snapshot.
+    Tracing allocations makes every allocation slower, so it only runs between :meth:`start` and :meth:`stop`.
+    """
+
+    def __init__(self):
+        self.baseline: typing.Optional[tracemalloc.Snapshot] = None
+        self.started_tracing = False
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    def start(self, frames: int = 25) -> None:
+        """
+        This method starts tracing allocations, if they are not traced already, and takes the baseline snapshot.
+
+        Parameters:
+            frames (int): This parameter takes the number of frames stored for every allocation.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.started_tracing = True
+        self.baseline = self._snapshot()
+
+    def diff(
+        self, limit: int = 25, key_type: str = "lineno", match: typing.Optional[str] = None
+    ) -> typing.List[dict]:
+        """
+        This method compares a new snapshot with the baseline, and returns the places that allocated the most memory
+        since the baseline was taken.
+
+        Parameters:
+            limit (int): This parameter takes the number of places to return.
+
+            key_type (str): This parameter takes how allocations are grouped, "lineno", "filename" or "traceback".
+
+            match (typing.Optional[str]): This parameter takes a part of a file name, such as "reader.py", only
+                                          allocations with that file in their traceback are compared.
+
+        Returns:
+            (typing.List[dict]): The places, largest growth first, with the size and number of their allocations and
+                                 how much both grew since the baseline.
+
+        Raises:
+            (RuntimeError): If tracing was not started.
+        """
+        if self.baseline is None or not tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracing was not started.")
+        snapshot = self._snapshot()
+        baseline = self.baseline
+        if match:
+            filters = (tracemalloc.Filter(True, f"*{match}*", all_frames=True),)
+            snapshot = snapshot.filter_traces(filters)
+            baseline = baseline.filter_traces(filters)
+
+        return [
+            {
+                "traceback": stat.traceback.format() if key_type == "traceback" else str(stat.traceback[0]),
+                "size": stat.size,
+                "size_diff": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in snapshot.compare_to(baseline, key_type)[:limit]
+        ]
+
+    def stop(self) -> None:
+        """
+        This method stops tracing allocations, if this tracker started it, and drops the baseline.
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.baseline = None
+
+    @property
+    def tracing(self) -> bool:
+        """
+        This property returns True if allocations are being traced and a baseline was taken.
+        """
+        return self.baseline is not None and tracemalloc.is_tracing()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} tracing={self.tracing}>"
@@ -0,0 +1,373 @@
+import contextlib
+import contextvars
+import math
+import threading
+import time
+import typing
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from utils.exceptions import QuotaExceeded
+
+__all__ = (
+    "Meter",
+    "QuotaManager",
+    "QuotaMiddleware",
+    "metered",
+    "record_usage",
+)
+
+_current_meter: "contextvars.ContextVar[typing.Optional[Meter]]" = contextvars.ContextVar(
+    "current_meter", default=None
+)
+
+
+class Meter:
+    """
+    A class that adds up the work a request took: the pixels of the images it decoded, the CPU time Tesseract OCR
+    engine spent reading them, and the bytes of text the parser scanned, along with the cost that was already taken
+    from the budget of its client.
+    """
+
+    __slots__ = ("tenant", "pixels", "cpu_ms", "scanned_bytes", "reserved", "_lock")
+
+    def __init__(self, tenant: typing.Optional[str] = None):
+        self.tenant = tenant
+        self.pixels = 0
+        self.cpu_ms = 0.0
+        self.scanned_bytes = 0
+        self.reserved = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, pixels: int = 0, cpu_ms: float = 0.0, scanned_bytes: int = 0) -> None:
+        """
+        This method adds work to the meter. It can be called from executor threads.
+        """
+        with self._lock:
+            self.pixels += pixels
+            self.cpu_ms += cpu_ms
+            self.scanned_bytes += scanned_bytes
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} {self.tenant} pixels={self.pixels} cpu_ms={self.cpu_ms:.1f} "
+            f"bytes={self.scanned_bytes}>"
+        )
+
+
+@contextlib.contextmanager
+def metered(tenant: typing.Optional[str] = None) -> typing.Iterator[Meter]:
+    """
+    This function measures the work done in the block, including the jobs it runs in execution lanes, as they inherit
+    its context.
+
+    Parameters:
+        tenant (typing.Optional[str]): This parameter takes the client the work is done for, if any.
+
+    Returns:
+        (Meter): The meter the work is added to.
+    """
+    meter = Meter(tenant)
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+def record_usage(pixels: int = 0, cpu_ms: float = 0.0, scanned_bytes: int = 0) -> None:
+    """
+    This function adds work to the meter of the current context, it does nothing if the work is not measured.
+
+    Parameters:
+        pixels (int): This parameter takes the number of pixels that were decoded.
+
+        cpu_ms (float): This parameter takes the CPU time that was spent, in milliseconds.
+
+        scanned_bytes (int): This parameter takes the number of bytes of text that were scanned.
+    """
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add(pixels=pixels, cpu_ms=cpu_ms, scanned_bytes=scanned_bytes)
+
+
+class QuotaManager:
+    """
+    A class that gives every client a budget of work, as a token bucket of cost units that refills at a steady rate.
+    A request is charged by the work it takes instead of counting as one, so a thumbnail costs a fraction of a large
+    screenshot. Images are charged before they are decoded, with the cost estimated from their header, and the
+    estimate is corrected with the measured work once the request finishes. A client whose budget is spent is turned
+    away with :class:`QuotaExceeded` until it refills. Every client can also only send so many requests, whatever
+    they cost, so that requests which do next to no work cannot be sent without limit either.
+
+    Budgets are kept in memory, so every instance of the API enforces them on its own.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_rate: float,
+        megapixel_cost: float,
+        cpu_second_cost: float,
+        megabyte_cost: float,
+        cpu_per_megapixel: float,
+        max_requests: float,
+        request_rate: float,
+        max_tenants: int = 100000,
+    ):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.megapixel_cost = megapixel_cost
+        self.cpu_second_cost = cpu_second_cost
+        self.megabyte_cost = megabyte_cost
+        self.cpu_per_megapixel = cpu_per_megapixel  # Exponentially weighted moving average of the measured value.
+        self.max_requests = max_requests
+        self.request_rate = request_rate
+        self.max_tenants = max_tenants
+        # The cost units left, the time the bucket was last refilled at, and the requests left, of every client.
+        self.buckets: "OrderedDict[str, typing.List[float]]" = OrderedDict()
+        self.charged = 0.0
+        self.rejected = 0
+
+    def cost(self, pixels: int = 0, cpu_ms: float = 0.0, scanned_bytes: int = 0) -> float:
+        """
+        This method converts work into cost units.
+
+        Returns:
+            (float): The cost of the work.
+        """
+        return (
+            pixels / 1e6 * self.megapixel_cost
+            + cpu_ms / 1000 * self.cpu_second_cost
+            + scanned_bytes / 1e6 * self.megabyte_cost
+        )
+
+    def _bucket(self, tenant: str) -> typing.List[float]:
+        now = time.monotonic()
+        bucket = self.buckets.get(tenant)
+        if bucket is None:
+            bucket = self.buckets[tenant] = [self.capacity, now, self.max_requests]
+            while len(self.buckets) > self.max_tenants:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(tenant)
+            elapsed = now - bucket[1]
+            bucket[0] = min(self.capacity, bucket[0] + elapsed * self.refill_rate)
+            bucket[2] = min(self.max_requests, bucket[2] + elapsed * self.request_rate)
+            bucket[1] = now
+        return bucket
+
+    def admit(self, tenant: str) -> None:
+        """
+        This method counts a request of a client, whatever it costs.
+
+        Parameters:
+            tenant (str): This parameter takes the client of the request.
+
+        Raises:
+            (QuotaExceeded): If the client has sent too many requests.
+        """
+        bucket = self._bucket(tenant)
+        if bucket[2] < 1:
+            self.rejected += 1
+            raise QuotaExceeded(tenant, max(1, math.ceil((1 - bucket[2]) / self.request_rate)))
+        bucket[2] -= 1
+
+    def reserve(self, cost: float) -> None:
+        """
+        This method takes a cost from the budget of the client of the current request. A cost larger than the whole
+        budget is let through when the budget is full, so that every request can be served eventually.
+
+        Parameters:
+            cost (float): This parameter takes the cost to take.
+
+        Raises:
+            (QuotaExceeded): If the budget of the client does not cover the cost.
+        """
+        meter = _current_meter.get()
+        if meter is None or meter.tenant is None:
+            return
+        bucket = self._bucket(meter.tenant)
+        needed = min(cost, self.capacity)
+        if bucket[0] < needed:
+            self.rejected += 1
+            retry_after = max(1, math.ceil((needed - bucket[0]) / self.refill_rate))
+            raise QuotaExceeded(meter.tenant, retry_after)
+        bucket[0] -= cost
+        meter.reserved += cost
+        self.charged += cost
+
+    @staticmethod
+    def image_pixels(data: BytesIO) -> int:
+        """
+        This method reads the size of an image from its header, without decoding it.
+
+        Parameters:
+            data (BytesIO): This parameter takes the image.
+
+        Returns:
+            (int): The number of pixels of the image, or 0 if its header could not be read.
+        """
+        position = data.tell()
+        try:
+            with Image.open(data) as image:
+                width, height = image.size
+            return width * height
+        except Exception:
+            # The image is rejected when it is decoded, which is not charged.
+            return 0
+        finally:
+            data.seek(position)
+
+    def charge_image(self, data: BytesIO) -> None:
+        """
+        This method charges the client of the current request for an image before it is decoded, with the pixels
+        from its header, and the CPU time reading that many pixels took on average.
+
+        Parameters:
+            data (BytesIO): This parameter takes the image.
+
+        Raises:
+            (QuotaExceeded): If the budget of the client does not cover the image.
+        """
+        pixels = self.image_pixels(data)
+        cpu_ms = pixels / 1e6 * self.cpu_per_megapixel * 1000
+        self.reserve(self.cost(pixels=pixels, cpu_ms=cpu_ms))
+        record_usage(pixels=pixels)
+
+    def charge_text(self, length: int) -> None:
+        """
+        This method charges the client of the current request for a text before it is parsed.
+
+        Parameters:
+            length (int): This parameter takes the length of the text.
+
+        Raises:
+            (QuotaExceeded): If the budget of the client does not cover the text.
+        """
+        self.reserve(self.cost(scanned_bytes=length))
+        record_usage(scanned_bytes=length)
+
+    @contextlib.contextmanager
+    def meter(self, tenant: str, admit: bool = True) -> typing.Iterator[Meter]:
+        """
+        This method measures the work of a request, and settles the cost of the work with the budget of its client
+        once the request finishes. The estimates that were charged up front are replaced by the measured work, so a
+        client that was charged too little pays the rest from its next budget, and one that was charged too much gets
+        the difference back. The request is counted with :meth:`admit` first, unless it already was.
+
+        Parameters:
+            tenant (str): This parameter takes the client of the request.
+
+            admit (bool): This parameter takes False if the request was already counted.
+
+        Returns:
+            (Meter): The meter of the request.
+
+        Raises:
+            (QuotaExceeded): If the client has sent too many requests.
+        """
+        if admit:
+            self.admit(tenant)
+        with metered(tenant) as meter:
+            try:
+                yield meter
+            finally:
+                self.settle(meter)
+
+    def settle(self, meter: Meter) -> None:
+        """
+        This method replaces the cost that was charged for a request with the cost of the work it measured, and
+        learns how much CPU time a megapixel takes to read.
+
+        Parameters:
+            meter (Meter): This parameter takes the meter of the request.
+        """
+        if meter.pixels and meter.cpu_ms:
+            measured = meter.cpu_ms / 1000 / (meter.pixels / 1e6)
+            self.cpu_per_megapixel = 0.9 * self.cpu_per_megapixel + 0.1 * measured
+        if meter.tenant is None:
+            return
+        difference = self.cost(meter.pixels, meter.cpu_ms, meter.scanned_bytes) - meter.reserved
+        if difference:
+            # The budget can go below zero, which the client then has to wait out.
+            self._bucket(meter.tenant)[0] -= difference
+            self.charged += difference
+
+    def remaining(self, tenant: str) -> float:
+        """
+        This method returns what is left of the budget of a client.
+
+        Parameters:
+            tenant (str): This parameter takes the client.
+
+        Returns:
+            (float): The cost units the client can spend right now.
+        """
+        return self._bucket(tenant)[0]
+
+    def stats(self) -> dict:
+        """
+        This method returns the settings and the counters of the quotas.
+
+        Returns:
+            (dict): The size and refill rate of every budget and of every request allowance, the number of clients
+                    with a budget, the cost charged and the number of requests rejected so far, and the learned CPU
+                    seconds per megapixel.
+        """
+        return {
+            "capacity": self.capacity,
+            "refill_rate": self.refill_rate,
+            "max_requests": self.max_requests,
+            "request_rate": self.request_rate,
+            "tenants": len(self.buckets),
+            "charged": round(self.charged, 3),
+            "rejected": self.rejected,
+            "cpu_per_megapixel": round(self.cpu_per_megapixel, 6),
+        }
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} tenants={len(self.buckets)} capacity={self.capacity}>"
+
+
+class QuotaMiddleware:
+    """
+    An ASGI middleware that measures the work of every request to the paths that start with one of the prefixes,
+    and charges it to the budget of its client. Clients that sent too many requests are answered with a
+    `429 Too Many Requests` response right away. It is a plain ASGI middleware, so that it adds no task and no copy
+    of the response to the requests it measures.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        quotas: QuotaManager,
+        tenant: typing.Callable[[HTTPConnection], str],
+        prefixes: typing.Tuple[str, ...],
+    ):
+        self.app = app
+        self.quotas = quotas
+        self.tenant = tenant
+        self.prefixes = prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        tenant = self.tenant(HTTPConnection(scope))
+        try:
+            self.quotas.admit(tenant)
+        except QuotaExceeded as e:
+            response = JSONResponse(
+                status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        with self.quotas.meter(tenant, admit=False):
+            await self.app(scope, receive, send)
+
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import signal
+import sys
+
+import aioredis
+from loguru import logger
+
+from core.jobs import OCRWorker, RedisJobQueue
+from core.ocr import OCRProfile
+from utils.helpers import Config
+from utils.logs import setup_logging
+from utils.pool import RecyclingPool
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run an OCR worker, which reads the images of the jobs the API adds to the Redis stream in "
+        'config.yml, with Tesseract OCR engine. Set the queue backend to "redis" for the API to use the workers.'
+    )
+    parser.add_argument(
+        "--consumer",
+        default=None,
+        help="The name of the worker in the consumer group. Defaults to the hostname and process ID. Use a stable "
+        "name to take over the jobs a crashed worker of the same name left behind right away.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="The number of images read at once. Defaults to the worker concurrency in config.yml.",
+    )
+    return parser.parse_args()
+
+
+async def run(arguments: argparse.Namespace) -> None:
+    config = Config()
+    setup_logging(
+        level=config.logging_level,
+        serialize=config.logging_serialize,
+        sample_rate=config.logging_sample_rate,
+        sample_burst=config.logging_sample_burst,
+    )
+    redis = await aioredis.from_url(
+        url=config.redis_address,
+        db=config.redis_db,
+        username=config.redis_username,
+        password=config.redis_password,
+        port=config.redis_port,
+        decode_responses=False,
+    )
+    queue = RedisJobQueue(
+        redis,
+        stream=config.queue_stream,
+        group=config.queue_group,
+        max_length=config.queue_max_length,
+        result_ttl=config.queue_result_ttl,
+        claim_idle=config.queue_claim_idle,
+    )
+    await queue.setup()
+    concurrency = arguments.concurrency or config.queue_worker_concurrency
+    pool = None
+    if config.recycling_enabled:
+        pool = RecyclingPool(
+            name="worker",
+            processes=concurrency,
+            max_queue=concurrency,
+            max_jobs=config.recycling_max_jobs,
+            max_rss=config.recycling_max_rss,
+        )
+    worker = OCRWorker(
+        queue=queue,
+        profile=OCRProfile(name=config.ocr_profile, **config.ocr_profiles[config.ocr_profile]),
+        concurrency=concurrency,
+        consumer=arguments.consumer,
+        pool=pool,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    if sys.platform.lower() != "win32":
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+    try:
+        await worker.run(stop)
+    finally:
+        worker.lane.shutdown(wait=False)
+        if pool is not None:
+            pool.shutdown(wait=False)
+        await redis.close()
+        await logger.complete()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_arguments()))
+    except KeyboardInterrupt:
+        logger.info("[*] User interrupted the worker. Shutting down.")
+        sys.exit(130)